@@ -0,0 +1,250 @@
+"""Admission control for the HTTP entry points.
+
+Every admitted request holds a slot in one of the ``Gate`` budgets (inference
+or LLM) until its response has been sent in full, including streamed bodies.
+Waiting requests are granted in priority order (``INTERACTIVE`` before
+``BATCH``). Lower lanes can be capped to a share of the slots, which keeps
+headroom for interactive traffic. A request is refused with 503 and
+``Retry-After`` when:
+
+- the gate's wait queue is full
+- the expected wait (recent slot time x work ahead / slots) already exceeds
+  the lane's queue deadline
+- it is still waiting when the deadline passes
+- the upload bytes in flight (by ``Content-Length``) would exceed the memory
+  budget
+
+Gates live on the event loop and need no locks.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import observe_stage
+
+INTERACTIVE = 0
+BATCH = 1
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+_EWMA_ALPHA = 0.2
+_MAX_RETRY_AFTER_SEC = 60
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing; ``retry_after`` is a hint in whole seconds."""
+
+    def __init__(self, reason: str, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = max(1, min(_MAX_RETRY_AFTER_SEC, int(retry_after)))
+
+
+class Gate:
+    """Weighted concurrency budget with a priority wait queue and per-priority deadlines."""
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        max_queue: int = 64,
+        deadlines: Optional[Dict[int, float]] = None,
+        lane_limits: Optional[Dict[int, int]] = None,
+    ):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.max_queue = max(0, int(max_queue))
+        self.deadlines = deadlines or {}
+        self.lane_limits = {p: max(1, min(self.limit, int(n))) for p, n in (lane_limits or {}).items()}
+        self._in_use = 0
+        self._lane_use: Dict[int, int] = {}
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []  # (priority, seq, cost, future)
+        self._seq = itertools.count()
+        self._service_sec: Optional[float] = None  # EWMA of slot hold time
+        self._stats = {"admitted": 0, "queue_full": 0, "predicted": 0, "deadline": 0, "peak_waiting": 0}
+
+    def _fits(self, priority: int, cost: int) -> bool:
+        if self._in_use + cost > self.limit:
+            return False
+        cap = self.lane_limits.get(priority)
+        return cap is None or self._lane_use.get(priority, 0) + cost <= cap
+
+    def _grant(self, priority: int, cost: int):
+        self._in_use += cost
+        self._lane_use[priority] = self._lane_use.get(priority, 0) + cost
+        self._stats["admitted"] += 1
+
+    def _wake(self):
+        while self._waiters:
+            priority, _, cost, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._fits(priority, cost):
+                break
+            heapq.heappop(self._waiters)
+            self._grant(priority, cost)
+            fut.set_result(True)
+
+    def waiting(self) -> int:
+        return sum(1 for w in self._waiters if not w[3].done())
+
+    def estimated_wait(self, priority: int, cost: int = 1) -> Optional[float]:
+        """Seconds until a new request of ``priority`` would start, from recent slot times (None until known)."""
+        if self._service_sec is None:
+            return None
+        ahead = sum(c for p, _, c, f in self._waiters if p <= priority and not f.done())
+        if not ahead and self._fits(priority, cost):
+            return 0.0
+        return self._service_sec * (ahead + cost) / self.limit
+
+    def _reject(self, reason: str, priority: int, wait: Optional[float]) -> AdmissionRejected:
+        self._stats[reason] += 1
+        if wait is None:
+            wait = (self._service_sec or 1.0) * max(1, self.waiting()) / self.limit
+        lane = _PRIORITY_NAMES.get(priority, str(priority))
+        return AdmissionRejected(reason, f"Server busy ({self.name}, {lane} lane: {reason}), retry shortly", math.ceil(wait))
+
+    async def acquire(self, priority: int = INTERACTIVE, cost: int = 1):
+        cost = max(1, min(self.limit, int(cost)))
+        if not self.waiting() and self._fits(priority, cost):
+            self._grant(priority, cost)
+            return
+        if self.waiting() >= self.max_queue:
+            raise self._reject("queue_full", priority, None)
+        deadline = self.deadlines.get(priority)
+        expected = self.estimated_wait(priority, cost)
+        if deadline is not None and expected is not None and expected > deadline:
+            raise self._reject("predicted", priority, expected)
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), cost, fut))
+        self._stats["peak_waiting"] = max(self._stats["peak_waiting"], self.waiting())
+        # Waiters queued ahead may only be blocked by their lane cap; a free slot goes to us right away
+        self._wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), deadline)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return  # granted as the deadline fired
+            fut.cancel()
+            raise self._reject("deadline", priority, self.estimated_wait(priority, cost))
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(priority, cost)
+            else:
+                fut.cancel()
+            raise
+
+    def release(self, priority: int, cost: int = 1, held_sec: Optional[float] = None):
+        cost = max(1, min(self.limit, int(cost)))
+        self._in_use -= cost
+        self._lane_use[priority] = self._lane_use.get(priority, 0) - cost
+        if held_sec is not None:
+            prev = self._service_sec
+            self._service_sec = held_sec if prev is None else prev + _EWMA_ALPHA * (held_sec - prev)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE, cost: int = 1):
+        start = time.perf_counter()
+        await self.acquire(priority, cost)
+        granted = time.perf_counter()
+        observe_stage(f"admission_{self.name}", granted - start)
+        try:
+            yield
+        finally:
+            self.release(priority, cost, time.perf_counter() - granted)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_use": self._in_use,
+            "lanes": {_PRIORITY_NAMES.get(p, str(p)): n for p, n in self._lane_use.items()},
+            "lane_limits": {_PRIORITY_NAMES.get(p, str(p)): n for p, n in self.lane_limits.items()},
+            "waiting": self.waiting(),
+            "avg_slot_sec": round(self._service_sec, 4) if self._service_sec is not None else None,
+            **self._stats,
+        }
+
+
+class InflightBytes:
+    """Upload bytes currently admitted; a lone request is always let through."""
+
+    def __init__(self, limit: int):
+        self.limit = int(limit)
+        self.current = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def reserve(self, n: int):
+        if self.limit > 0 and self.current > 0 and self.current + n > self.limit:
+            self.rejected += 1
+            raise AdmissionRejected("memory", "Server busy (upload memory budget), retry shortly", 1)
+        self.current += n
+        self.peak = max(self.peak, self.current)
+
+    def release(self, n: int):
+        self.current -= n
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "current": self.current, "peak": self.peak, "rejected": self.rejected}
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting ``routes`` = ``{(method, path): (gate, priority, count_bytes)}``."""
+
+    def __init__(self, app, routes: Dict[Tuple[str, str], Tuple[Gate, int, bool]], inflight: InflightBytes):
+        self.app = app
+        self.routes = routes
+        self.inflight = inflight
+
+    async def __call__(self, scope, receive, send):
+        route = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+        gate, priority, count_bytes = route
+        nbytes = 0
+        if count_bytes:
+            for key, value in scope.get("headers", ()):
+                if key == b"content-length":
+                    nbytes = int(value) if value.isdigit() else 0
+                    break
+        try:
+            self.inflight.reserve(nbytes)
+        except AdmissionRejected as e:
+            await _send_rejection(send, e)
+            return
+        try:
+            start = time.perf_counter()
+            try:
+                await gate.acquire(priority)
+            except AdmissionRejected as e:
+                await _send_rejection(send, e)
+                return
+            observe_stage(f"admission_{gate.name}", time.perf_counter() - start)
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                gate.release(priority, 1, time.perf_counter() - start)
+        finally:
+            self.inflight.release(nbytes)
+
+
+async def _send_rejection(send, e: AdmissionRejected):
+    body = json.dumps({"detail": e.detail, "reason": e.reason}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(e.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -1,47 +1,242 @@
-import io, os, json, time, uuid, threading, base64, shutil
-from typing import Dict, Any, Optional
-
-import torch
-import torchvision
-import torchxrayvision as xrv
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body, BackgroundTasks
-from fastapi.responses import JSONResponse
+from __future__ import annotations
+
+import io, os, json, time, uuid, threading, base64, asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Tuple
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import skimage.io
-from llm import generate_structured_report, chat_followup
+from fastapi.concurrency import run_in_threadpool
+from starlette.routing import Match
+from llm import agenerate_structured_report, achat_followup, astream_structured_report, astream_chat_followup, report_cache_stats, llm_stats
+from batching import InferenceBatcher, QueueFullError
+from cache import ResultCache
+from store import TimedPredictionStore, open_store
+from sessions import ChatSessions
+from assets import LocalAssetStore
+from admission import BATCH, INTERACTIVE, AdmissionMiddleware, AdmissionRejected, Gate, InflightBytes
+from jobs import CallbackURLError, JobDeferred, JobError, JobQueue, JobQueueFull, JobRunner, check_callback_url
+import metrics
+from metrics import observe_stage, stage
+from thresholds import decode_outputs, encode_outputs, output_schema, parse_sweep, resolve_thresholds, schema_weights, stack_outputs, sweep_counts
+from rsna_index import RSNAMaskIndex
+from uploader import FirebaseBackend, LocalObjectStore, Uploader, UploadQueueFull
+from startup import lazy_import, preload, profile as startup_profile
+
+# Heavy modules load on first use (LAZY_IMPORTS=1), normally during warmup, so the port is up within a second
+torch = lazy_import("torch")
+xrv = lazy_import("torchxrayvision")
+preprocess = lazy_import("preprocess")
+explainers = lazy_import("explain")
+engines = lazy_import("engines")
+ensemble = lazy_import("ensemble")
 
 PNEUMONIA_THRESHOLD = float(os.getenv("PNEUMONIA_THRESHOLD", "0.70"))
 STORAGE_PREFIX = os.getenv("STORAGE_PREFIX", "")  # e.g. gs://bucket-name (if provided skips firebase upload logic)
 FIREBASE_BUCKET = os.getenv("FIREBASE_BUCKET")  # bucket-name (without gs://) for firebase-admin
 FIREBASE_CRED_JSON = os.getenv("FIREBASE_CREDENTIALS_JSON")  # inline JSON credentials (optional)
 RSNA_DATASET_PATH = os.getenv("RSNA_DATASET_PATH")  # optional path to RSNA images
+RSNA_INDEX_PATH = os.getenv("RSNA_INDEX_PATH")  # prebuilt mask index (python rsna_index.py build); preferred over the dataset scan
+RSNA_MASK_CACHE_SIZE = int(os.getenv("RSNA_MASK_CACHE_SIZE", "256"))  # rendered mask PNGs kept in memory
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))  # max images per forward pass
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))  # how long the first request waits for company
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "64"))  # pending requests before /predict returns 503
+PREDICT_BATCH_MAX_FILES = int(os.getenv("PREDICT_BATCH_MAX_FILES", "32"))  # files per /predict/batch request
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(32 * 1024 * 1024)))  # per image; 0 = unlimited
+PREDICT_BATCH_MAX_BYTES = int(os.getenv("PREDICT_BATCH_MAX_BYTES", str(128 * 1024 * 1024)))  # whole /predict/batch body; 0 = unlimited
+UPLOAD_READ_CHUNK = 1024 * 1024
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))  # 0 disables the upload-hash result cache
+RESULT_CACHE_TTL_SEC = float(os.getenv("RESULT_CACHE_TTL_SEC", "3600"))
+PREDICTION_STORE = os.getenv("PREDICTION_STORE", "memory")  # memory | sqlite
+PREDICTION_STORE_PATH = os.getenv("PREDICTION_STORE_PATH", os.path.join("stored_images", "predictions.sqlite3"))
+PREDICTION_STORE_MAX = int(os.getenv("PREDICTION_STORE_MAX", "100000"))  # LRU capacity; 0 = unbounded
+PREDICTION_STORE_TTL_SEC = float(os.getenv("PREDICTION_STORE_TTL_SEC", str(7 * 24 * 3600)))  # 0 = keep forever
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "eager")  # eager | torchscript | onnx | int8 | ensemble (see engines.py)
+EXPLAIN_METHOD = os.getenv("EXPLAIN_METHOD", "gradient").lower()  # default method: gradient | gradcam | none
+SALIENCY_MODE = os.getenv("SALIENCY_MODE", "inline").lower()  # inline | deferred (background workers)
+SALIENCY_WORKERS = int(os.getenv("SALIENCY_WORKERS", "1"))
+UPLOAD_BACKEND = os.getenv("UPLOAD_BACKEND", "auto").lower()  # auto (firebase if configured) | firebase | local | none
+LOCAL_OBJECT_STORE_DIR = os.getenv("LOCAL_OBJECT_STORE_DIR", "object_store")  # root for UPLOAD_BACKEND=local
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "256"))
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", "3"))
+UPLOAD_BACKOFF_SEC = float(os.getenv("UPLOAD_BACKOFF_SEC", "0.5"))
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"  # load + warm the model before /readyz passes
+WARMUP_ITERATIONS = int(os.getenv("WARMUP_ITERATIONS", "2"))  # synthetic forward passes per batch size
+# Imported first during warmup, dependencies before dependents, so /readyz times each one separately
+HEAVY_MODULES = ["numpy", "torch", "torchvision", "skimage.io", "torchxrayvision", "preprocess", "explain", "engines"]
+if INFERENCE_ENGINE.lower() == "ensemble":
+    HEAVY_MODULES.append("ensemble")
+WARMUP_BATCH_SIZES = [int(b) for b in os.getenv("WARMUP_BATCH_SIZES", f"1,{BATCH_MAX_SIZE}").split(",") if b.strip()]
+WARMUP_RSNA = os.getenv("WARMUP_RSNA", "0") == "1"  # also build the RSNA mask index at startup
+CHAT_SESSION_STORE_PATH = os.getenv("CHAT_SESSION_STORE_PATH", os.path.join("stored_images", "chat_sessions.sqlite3"))  # used when PREDICTION_STORE=sqlite
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "10000"))
+CHAT_SESSION_TTL_SEC = float(os.getenv("CHAT_SESSION_TTL_SEC", "1800"))  # idle sessions expire
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "600"))  # verbatim history budget per prompt
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "6"))  # max exchanges kept verbatim
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "200"))  # budget for compacted older exchanges
+ASSET_STORE_DIR = os.getenv("ASSET_STORE_DIR", "stored_images")  # local assets when no upload backend takes them
+ASSET_MAX_BYTES = int(os.getenv("ASSET_MAX_BYTES", str(2 * 1024 ** 3)))  # quota; 0 = unlimited
+ASSET_TTL_SEC = float(os.getenv("ASSET_TTL_SEC", str(PREDICTION_STORE_TTL_SEC)))  # 0 = keep while the prediction lives
+ASSET_GC_INTERVAL_SEC = float(os.getenv("ASSET_GC_INTERVAL_SEC", "300"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join("stored_images", "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # per process; 0 = accept jobs but run them elsewhere
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))  # queued + running before POST /jobs returns 503
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SEC = float(os.getenv("JOB_RETRY_BACKOFF_SEC", "5"))
+JOB_LEASE_SEC = float(os.getenv("JOB_LEASE_SEC", "600"))  # a job still running after this is assumed lost and rerun
+JOB_TTL_SEC = float(os.getenv("JOB_TTL_SEC", str(7 * 24 * 3600)))  # finished jobs kept for polling
+JOB_POLL_SEC = float(os.getenv("JOB_POLL_SEC", "1"))
+JOB_CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", "5"))
+JOB_CALLBACK_BACKOFF_SEC = float(os.getenv("JOB_CALLBACK_BACKOFF_SEC", "2"))
+JOB_CALLBACK_TIMEOUT_SEC = float(os.getenv("JOB_CALLBACK_TIMEOUT_SEC", "10"))
+JOB_CALLBACK_SECRET = os.getenv("JOB_CALLBACK_SECRET")  # signs callback bodies (HMAC-SHA256)
+JOB_CALLBACK_ALLOW_PRIVATE = os.getenv("JOB_CALLBACK_ALLOW_PRIVATE", "0") == "1"  # allow loopback/private callback hosts (local testing)
+JOB_CALLBACK_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()]  # exact allow-list; overrides the address check
+ADMISSION_INFERENCE_CONCURRENCY = int(os.getenv("ADMISSION_INFERENCE_CONCURRENCY", str(2 * BATCH_MAX_SIZE)))  # /predict* requests in progress
+ADMISSION_BATCH_SHARE = float(os.getenv("ADMISSION_BATCH_SHARE", "0.5"))  # max share of inference slots for /predict/batch
+ADMISSION_LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CONCURRENCY", "32"))  # /report and /chat requests in progress
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))  # waiting requests per budget before 503
+ADMISSION_QUEUE_DEADLINE_SEC = float(os.getenv("ADMISSION_QUEUE_DEADLINE_SEC", "5"))  # interactive lane
+ADMISSION_BATCH_QUEUE_DEADLINE_SEC = float(os.getenv("ADMISSION_BATCH_QUEUE_DEADLINE_SEC", "30"))
+ADMISSION_MAX_INFLIGHT_BYTES = int(os.getenv("ADMISSION_MAX_INFLIGHT_BYTES", str(256 * 1024 * 1024)))  # 0 = unlimited
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"  # per-stage Server-Timing header on every response (else only with X-Server-Timing: 1)
+
+# Prediction store {id: prediction_dict}; LRU + TTL, in memory or SQLite-backed
+_PREDICTION_STORE = TimedPredictionStore(
+    open_store(PREDICTION_STORE, PREDICTION_STORE_PATH, PREDICTION_STORE_MAX, PREDICTION_STORE_TTL_SEC), observe_stage
+)
+
+# Local assets (content-addressed, quota + TTL); GC drops assets of predictions the store has evicted
+_assets = LocalAssetStore(ASSET_STORE_DIR, ASSET_MAX_BYTES, ASSET_TTL_SEC, is_live=_PREDICTION_STORE.live_ids)
+
+# Chat sessions per prediction, same backend as the prediction store (shared across workers with sqlite)
+_CHAT_SESSIONS = ChatSessions(
+    open_store(PREDICTION_STORE, CHAT_SESSION_STORE_PATH, CHAT_SESSION_MAX, CHAT_SESSION_TTL_SEC),
+    history_tokens=CHAT_HISTORY_TOKENS, max_turns=CHAT_HISTORY_TURNS, summary_tokens=CHAT_SUMMARY_TOKENS,
+)
+
+# Repeated uploads of the same file reuse the first prediction (keyed by sha256 of the upload)
+_result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_SEC)
 
-# In-memory prediction store {id: prediction_dict}
-_PREDICTION_STORE: Dict[str, Dict[str, Any]] = {}
-_STORE_LOCK = threading.Lock()
-_MAX_STORE = 500  # simple cap to avoid unbounded memory growth
+# Deferred saliency: pending jobs by prediction id (removed once applied to the stored record)
+_saliency_pool = ThreadPoolExecutor(max_workers=max(1, SALIENCY_WORKERS), thread_name_prefix="saliency")
+_saliency_jobs: Dict[str, Future] = {}
 
 # Lazy global model to avoid reload on every request
 _model = None
-_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+_engine = None
+_model_lock = threading.RLock()
+_device = None  # resolved with the model (needs torch)
 
 # RSNA dataset (optional) lazy load for Lung Opacity masks
 _rsna_dataset = None
 _rsna_index = {}
 _rsna_lock = threading.Lock()
+_rsna_mask_index: Optional[RSNAMaskIndex] = None
+
+# Startup warmup state reported by /readyz
+_readiness: Dict[str, Any] = {"ready": not WARMUP_ON_STARTUP, "status": "pending" if WARMUP_ON_STARTUP else "skipped", "steps": []}
 
 # Firebase admin lazy init
 _fb_init = False
 _fb_bucket = None
 _fb_lock = threading.Lock()
 
-# Preprocessing transforms
-_transform = torchvision.transforms.Compose([
-    xrv.datasets.XRayCenterCrop(),
-    xrv.datasets.XRayResizer(224)
-])
+# Upload pool (lazy; None means assets stay in the local asset store)
+_uploader: Optional[Uploader] = None
+_uploader_init = False
+_uploader_lock = threading.Lock()
+
+
+def _warmup():
+    """Load the model/engine (and optionally the RSNA index), then run synthetic batches."""
+    _readiness.update({"status": "warming", "started_at": time.time()})
+
+    def _step(name: str, fn, **extra):
+        start = time.time()
+        fn()
+        _readiness["steps"].append({"step": name, "sec": round(time.time() - start, 4), **extra})
+
+    try:
+        _step("imports", lambda: preload(HEAVY_MODULES))
+        _step("load_model", get_model)
+        _step("load_engine", get_engine, engine=INFERENCE_ENGINE)
+        if WARMUP_RSNA:
+            _step("rsna_index", _ensure_rsna_index if RSNA_INDEX_PATH else _ensure_rsna_dataset)
+        for batch_size in WARMUP_BATCH_SIZES:
+            tensors = list(engines.synthetic_batch(batch_size))
+            for i in range(WARMUP_ITERATIONS):
+                _step("forward", lambda: _forward_batch(tensors), batch_size=batch_size, iteration=i)
+        if EXPLAIN_METHOD == "gradient":
+            pneu_index = get_model().pathologies.index("Pneumonia")
+            _step("saliency", lambda: _gen_saliency(engines.synthetic_batch(1)[0].to(get_device()), get_model(), pneu_index))
+        _readiness.update({"ready": True, "status": "ready"})
+    except Exception as e:
+        _readiness.update({"status": "failed", "error": str(e)})
+    _readiness["total_sec"] = round(time.time() - _readiness["started_at"], 4)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    await _batcher.start()
+    _assets.start_gc(ASSET_GC_INTERVAL_SEC)
+    await _job_runner.start()
+    warmup = None
+    if WARMUP_ON_STARTUP:
+        # Off the event loop so /healthz answers while the model warms up; /readyz waits for it
+        warmup = asyncio.get_running_loop().run_in_executor(None, _warmup)
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    await _job_runner.stop()
+    await _batcher.stop()
+    _assets.stop_gc()
+    _saliency_pool.shutdown(wait=False, cancel_futures=True)
+    if _uploader is not None:
+        _uploader.shutdown(wait=True)
+
+
+app = FastAPI(title="PneumonAI API", version="1.0.0", lifespan=_lifespan)
+
+# Admission control: bounded budgets for inference and LLM work, interactive before batch, 503 + Retry-After
+# when the queue deadline cannot be met or upload bytes in flight exceed the budget
+_DEADLINES = {INTERACTIVE: ADMISSION_QUEUE_DEADLINE_SEC, BATCH: ADMISSION_BATCH_QUEUE_DEADLINE_SEC}
+_inference_gate = Gate(
+    "inference", ADMISSION_INFERENCE_CONCURRENCY, ADMISSION_QUEUE_SIZE, _DEADLINES,
+    lane_limits={BATCH: max(1, int(ADMISSION_INFERENCE_CONCURRENCY * ADMISSION_BATCH_SHARE))},
+)
+_llm_gate = Gate("llm", ADMISSION_LLM_CONCURRENCY, ADMISSION_QUEUE_SIZE, _DEADLINES)
+_inflight_bytes = InflightBytes(ADMISSION_MAX_INFLIGHT_BYTES)
+app.add_middleware(
+    AdmissionMiddleware,
+    routes={
+        ("POST", "/predict"): (_inference_gate, INTERACTIVE, True),
+        ("POST", "/predict/batch"): (_inference_gate, BATCH, True),
+        ("POST", "/report"): (_llm_gate, INTERACTIVE, False),
+        ("POST", "/report/stream"): (_llm_gate, INTERACTIVE, False),
+        ("POST", "/chat"): (_llm_gate, INTERACTIVE, False),
+        ("POST", "/chat/stream"): (_llm_gate, INTERACTIVE, False),
+    },
+    inflight=_inflight_bytes,
+)
+
+
+# Registered before CORS and _instrument so its 413s carry CORS headers and show up in request metrics
+@app.middleware("http")
+async def _limit_upload_size(request: Request, call_next):
+    # Refuse oversized bodies from Content-Length before the multipart parser spools them
+    if request.method == "POST" and request.url.path.startswith(("/predict", "/jobs")):
+        batch = request.url.path == "/predict/batch"
+        limit = PREDICT_BATCH_MAX_BYTES if batch else MAX_UPLOAD_BYTES
+        length = request.headers.get("content-length")
+        if limit and length and length.isdigit() and int(length) > limit + 64 * 1024:
+            detail = f"Batch upload exceeds {limit} bytes" if batch else f"Upload exceeds {limit} bytes per image"
+            return JSONResponse({"detail": detail}, status_code=413)
+    return await call_next(request)
 
-app = FastAPI(title="PneumonAI API", version="1.0.0")
 
 # Allow all origins for simplicity (tighten in production)
 app.add_middleware(
@@ -52,14 +247,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+_HTTP_SECONDS = metrics.histogram("pneumonai_http_request_seconds", "HTTP request latency by route")
+_HTTP_REQUESTS = metrics.counter("pneumonai_http_requests_total", "HTTP requests by route and status")
+
+
+def _route_template(request: Request) -> str:
+    # Label by route template (/prediction/{prediction_id}), never by raw path
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+@app.middleware("http")
+async def _instrument(request: Request, call_next):
+    token = metrics.begin_request()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        breakdown = metrics.end_request(token)
+        route = _route_template(request)
+        _HTTP_SECONDS.observe(elapsed, route=route, method=request.method)
+        _HTTP_REQUESTS.inc(route=route, method=request.method, status=str(status))
+    if SERVER_TIMING or request.headers.get("x-server-timing") == "1":
+        breakdown["total"] = elapsed
+        response.headers["Server-Timing"] = metrics.server_timing(breakdown)
+    return response
+
+
+def get_device():
+    global _device
+    if _device is None:
+        _device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    return _device
+
+
 def get_model():
     global _model
     if _model is None:
-        _model = xrv.models.DenseNet(weights="densenet121-res224-all").to(_device)
-        _model.eval()
+        with _model_lock:
+            if _model is None:
+                _model = engines.load_model(get_device())
     return _model
 
 
+def use_preloaded_model(model, engine=None):
+    """Adopt a model (and engine) loaded before fork (serve.py) so workers share its weights instead of loading their own."""
+    global _model, _engine
+    with _model_lock:
+        _model = model
+        if engine is not None:
+            _engine = engine
+
+
+def get_engine():
+    """Inference engine used for the batched forward pass (eager model stays available for saliency)."""
+    global _engine
+    if _engine is None:
+        with _model_lock:
+            if _engine is None:
+                _engine = engines.load_engine(INFERENCE_ENGINE, get_model(), get_device())
+    return _engine
+
+
 def _init_firebase():
     global _fb_init, _fb_bucket
     if _fb_init or not FIREBASE_BUCKET or STORAGE_PREFIX:
@@ -84,6 +340,52 @@ def _init_firebase():
     return _fb_bucket
 
 
+def _get_uploader() -> Optional[Uploader]:
+    global _uploader, _uploader_init
+    if _uploader_init:
+        return _uploader
+    with _uploader_lock:
+        if _uploader_init:
+            return _uploader
+        backend = None
+        if UPLOAD_BACKEND == "local":
+            backend = LocalObjectStore(LOCAL_OBJECT_STORE_DIR)
+        elif UPLOAD_BACKEND in ("auto", "firebase"):
+            bucket = _init_firebase()
+            backend = FirebaseBackend(bucket) if bucket else None
+        if backend is not None:
+            _uploader = Uploader(
+                backend,
+                workers=UPLOAD_WORKERS,
+                max_queue=UPLOAD_QUEUE_SIZE,
+                retries=UPLOAD_RETRIES,
+                backoff_sec=UPLOAD_BACKOFF_SEC,
+            )
+        _uploader_init = True
+    return _uploader
+
+
+def _persist_asset(pred_id: str, filename: str, data: bytes, content_type: str):
+    """Upload an asset from memory, or keep it in the local asset store when no upload backend is configured."""
+    uploader = _get_uploader()
+    if uploader is not None:
+        try:
+            with stage("upload_enqueue"):
+                # Still unreachable after the retries: keep the bytes in the local asset store, as without a backend
+                fut = uploader.submit(
+                    f"predictions/{pred_id}/{filename}", data, content_type,
+                    fallback=lambda d: "file://" + _assets.put(pred_id, filename, d),
+                )
+            submitted = time.perf_counter()
+            # Queue wait + transfer + retries, recorded when the worker finishes
+            fut.add_done_callback(lambda _: observe_stage("upload", time.perf_counter() - submitted))
+            return
+        except UploadQueueFull:
+            pass  # keep a local copy rather than dropping the asset
+    with stage("asset_write"):
+        _assets.put(pred_id, filename, data)
+
+
 def _ensure_rsna_dataset():
     """Lazy load RSNA dataset and build index by basename for Lung Opacity masks."""
     global _rsna_dataset, _rsna_index
@@ -116,6 +418,42 @@ def _ensure_rsna_dataset():
     return _rsna_dataset
 
 
+def _ensure_rsna_index() -> Optional[RSNAMaskIndex]:
+    """Memory-map the prebuilt RSNA index (cheap: no dataset load, no scan)."""
+    global _rsna_mask_index
+    if _rsna_mask_index is not None or not RSNA_INDEX_PATH or not os.path.isdir(RSNA_INDEX_PATH):
+        return _rsna_mask_index
+    with _rsna_lock:
+        if _rsna_mask_index is None:
+            try:
+                _rsna_mask_index = RSNAMaskIndex(RSNA_INDEX_PATH, cache_size=RSNA_MASK_CACHE_SIZE)
+            except Exception:
+                _rsna_mask_index = None
+    return _rsna_mask_index
+
+
+def _get_rsna_mask_png(original_filename: str) -> Optional[bytes]:
+    """PNG bytes of the RSNA Lung Opacity mask for this filename, if any."""
+    if not original_filename:
+        return None
+    index = _ensure_rsna_index()
+    if index is not None:
+        with stage("rsna_mask"):
+            return index.mask_png(original_filename)
+    # Fallback: scan the dataset (slow first call) and render the sample mask
+    rsna_raw = _get_rsna_mask(original_filename)
+    if rsna_raw is None:
+        return None
+    import numpy as np
+    from PIL import Image
+    m = np.squeeze(rsna_raw).astype('float32')
+    if m.max() > 0:
+        m = m / m.max()
+    buf = io.BytesIO()
+    Image.fromarray((m * 255).astype('uint8')).save(buf, format='PNG')
+    return buf.getvalue()
+
+
 def _get_rsna_mask(original_filename: str):
     ds = _ensure_rsna_dataset()
     if ds is None or not original_filename:
@@ -144,79 +482,188 @@ def _get_rsna_mask(original_filename: str):
 def _gen_saliency(img_tensor: torch.Tensor, model, pneu_index: int):
     """Fast gradient magnitude saliency (grayscale 224x224)."""
     try:
-        x = img_tensor[None, ...].requires_grad_(True)
-        model.zero_grad()
-        out = model(x)
-        if pneu_index >= out.shape[1]:
-            return None
-        target = out[0, pneu_index]
-        target.backward()
-        grads = x.grad.detach().cpu()[0, 0]
-        sal = grads.abs()
-        sal = (sal - sal.min()) / (sal.max() - sal.min() + 1e-8)
-        import numpy as np
-        sal_np = (sal.numpy() * 255).astype('uint8')
-        from PIL import Image
-        sal_img = Image.fromarray(sal_np, mode='L')
-        return sal_img
+        return explainers.gradient_saliency(img_tensor, model, pneu_index)
     except Exception:
         return None
 
 
-def _storage_objects(pred_id: str, original_ext: str):
-    base_dir = os.path.join("stored_images", "predictions", pred_id)
-    os.makedirs(base_dir, exist_ok=True)
+def _render_saliency(
+    img_tensor: torch.Tensor,
+    features: Optional[torch.Tensor],
+    pneu_index: int,
+    saliency_fn: str,
+    prediction_id: str,
+    method: str,
+) -> Optional[Dict[str, Any]]:
+    """Generate and save the saliency PNG; returns the ``masks.saliency`` entry or None."""
+    try:
+        sal_img, timing = explainers.explain(method, img_tensor.to(get_device()), features, get_model(), pneu_index)
+    except Exception:
+        return None
+    observe_stage("saliency_" + method, timing["compute_sec"])
+    if sal_img is None:
+        return None
+    start = time.time()
+    buf = io.BytesIO()
+    sal_img.save(buf, format='PNG')
+    timing["encode_sec"] = round(time.time() - start, 4)
+    observe_stage("png_encode", timing["encode_sec"])
+    _persist_asset(prediction_id, saliency_fn, buf.getvalue(), "image/png")
+    sal_object_name = f"predictions/{prediction_id}/{saliency_fn}"
+    sal_url, sal_object, _ = _compose_storage_ref(sal_object_name)
+    return {
+        "available": True,
+        "object": sal_object,
+        "url": sal_url,
+        "method": method,
+        "timing": timing
+    }
+
+
+def _attach_saliency(pred_id: str):
+    """Once a deferred saliency job finishes, write its outcome into the stored record."""
+    fut = _saliency_jobs.get(pred_id)
+    if fut is not None:
+        fut.add_done_callback(lambda f: _apply_saliency(pred_id, f))
+
+
+def _apply_saliency(pred_id: str, fut: Future):
+    try:
+        entry = fut.result()
+    except Exception:
+        entry = None
+    record = _PREDICTION_STORE.get(pred_id)
+    if record is not None:
+        masks = dict(record.get("masks") or {})
+        if entry is not None:
+            masks["saliency"] = entry
+            masks["has_any"] = True
+        else:
+            masks["saliency"] = {"available": False, "status": "failed"}
+        _PREDICTION_STORE.update(pred_id, {"masks": masks, "has_mask": masks.get("has_any", False)})
+    _saliency_jobs.pop(pred_id, None)
+
+
+def _storage_objects(original_ext: str):
     image_filename = f"image{original_ext}" if original_ext else "image"
     saliency_filename = "saliency.png"
     rsna_filename = "rsna_mask.png"
-    return base_dir, image_filename, saliency_filename, rsna_filename
+    return image_filename, saliency_filename, rsna_filename
 
 
 def _compose_storage_ref(obj_name: str):
     if STORAGE_PREFIX:
         return f"{STORAGE_PREFIX.rstrip('/')}/{obj_name}", obj_name, 'static'
-    # For Firebase uploads we return temporary local path placeholder; URL computed after upload
-    return obj_name, obj_name, 'firebase'
+    # For uploads we return the object name as placeholder; URL computed after upload
+    uploader = _get_uploader()
+    return obj_name, obj_name, uploader.backend.name if uploader is not None else 'firebase'
 
 
 def prepare_image(file_bytes: bytes) -> torch.Tensor:
     try:
-        # Read image from bytes
-        img = skimage.io.imread(io.BytesIO(file_bytes))
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read image: {e}")
+        with stage("decode"):
+            return preprocess.prepare_image(file_bytes)
+    except preprocess.ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    img = xrv.datasets.normalize(img, 255)
-    # Channel handling
-    if img.ndim == 3:
-        if img.shape[2] > 1:
-            img = img.mean(2)
-        else:
-            img = img[:, :, 0]
-    elif img.ndim != 2:
-        raise HTTPException(status_code=400, detail=f"Unexpected image shape {img.shape}")
 
-    img = img[None, ...]  # (1, H, W)
-    img = _transform(img)
-    tensor = torch.from_numpy(img).float()  # (1, H, W)
-    return tensor
+_BATCH_SIZES = metrics.histogram("pneumonai_inference_batch_size", "Images per forward pass", (1, 2, 4, 8, 16, 32, 64))
 
 
-def run_inference_bytes(file_bytes: bytes, prediction_id: Optional[str] = None, original_filename: Optional[str] = None) -> Dict[str, Any]:
-    """Run model inference and return ONLY pneumonia probability info (minimal default)."""
-    img_tensor = prepare_image(file_bytes).to(_device)
-    model = get_model()
+def _forward_batch(tensors: List[torch.Tensor]) -> List[Dict[str, Any]]:
+    """Single forward pass over a list of (1, 224, 224) tensors; one result per tensor.
+
+    Last dense-block features come back with the outputs so Grad-CAM needs no second pass.
+    """
+    engine = get_engine()
+    batch = torch.stack(tensors).to(get_device())
     start = time.time()
-    with torch.no_grad():
-        outputs = model(img_tensor[None, ...])
+    details = None
+    if engine.name == "ensemble":
+        outputs, features, details = engine.run_detailed(batch)
+    else:
+        outputs, features = engine.run(batch)
     elapsed = time.time() - start
-    probs = outputs[0].detach().cpu().numpy().tolist()
+    observe_stage("forward", elapsed)
+    _BATCH_SIZES.observe(len(tensors))
+    probs = outputs.detach().cpu().numpy().tolist()
+    results = [
+        {
+            "probs": p,
+            "features": features[i] if features is not None else None,
+            "inference_time_sec": elapsed,
+            "batch_size": len(tensors),
+        }
+        for i, p in enumerate(probs)
+    ]
+    if details is not None:
+        timing = {name: round(sec, 4) for name, sec in details["timing_sec"].items()}
+        for i, res in enumerate(results):
+            res["ensemble"] = {
+                **engine.describe(),
+                **(ensemble.summarize(details["pneumonia"][i], details["members"]) if details["pneumonia"] is not None else {}),
+                "member_time_sec": timing,  # per batch, like inference_time_sec
+            }
+    return results
+
+
+_batcher = InferenceBatcher(
+    _forward_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue=BATCH_QUEUE_SIZE,
+)
+
+
+def run_inference_bytes(
+    file_bytes: bytes,
+    prediction_id: Optional[str] = None,
+    original_filename: Optional[str] = None,
+    explain_method: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Run model inference and return ONLY pneumonia probability info (minimal default)."""
+    img_tensor = prepare_image(file_bytes)
+    forward = _forward_batch([img_tensor])[0]
+    return build_prediction(file_bytes, img_tensor, forward, prediction_id, original_filename, explain_method)
+
+
+_schema: Optional[str] = None
+
+
+def _output_schema() -> str:
+    """Schema of the vectors this process stores: weights, engine and (for ensembles) its configuration."""
+    global _schema
+    if _schema is None:
+        engine = get_engine()
+        _schema = output_schema(engines.MODEL_WEIGHTS, engine.name, engine.describe() if engine.name == "ensemble" else None)
+    return _schema
+
+
+def build_prediction(
+    file_bytes: bytes,
+    img_tensor: torch.Tensor,
+    forward: Dict[str, Any],
+    prediction_id: Optional[str] = None,
+    original_filename: Optional[str] = None,
+    explain_method: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Turn a forward-pass result into the prediction payload (threshold, stored image, masks)."""
+    method = explain_method or EXPLAIN_METHOD
+    model = get_model()
+    probs = forward["probs"]
     try:
         pneu_index = model.pathologies.index("Pneumonia")
         pneu_prob = float(probs[pneu_index])
     except ValueError:
         pneu_prob = None
-    result: Dict[str, Any] = {"inference_time_sec": round(elapsed, 4)}
+    result: Dict[str, Any] = {
+        "inference_time_sec": round(forward["inference_time_sec"], 4),
+        "batch_size": forward["batch_size"],
+        # Full pathology vector (float16) so other thresholds/labels can be evaluated later without the model
+        "outputs": encode_outputs(probs, _output_schema()),
+    }
+    if forward.get("ensemble") is not None:
+        result["ensemble"] = forward["ensemble"]
     if pneu_prob is not None:
         meets = pneu_prob >= PNEUMONIA_THRESHOLD
         result.update({
@@ -236,17 +683,16 @@ def run_inference_bytes(file_bytes: bytes, prediction_id: Optional[str] = None,
     if prediction_id is None:
         return result
 
-    # Canonical storage object names (not uploading here; frontend will upload to Firebase Storage)
+    # Canonical storage object names
     ext = ""
     if original_filename and "." in original_filename:
         ext = os.path.splitext(original_filename)[1].lower()
         if ext not in [".jpg", ".jpeg", ".png"]:
             ext = ".jpg"
-    base_dir, image_fn, saliency_fn, rsna_fn = _storage_objects(prediction_id, ext)
-    # Persist original image locally (raw bytes) for subsequent upload pipeline
+    image_fn, saliency_fn, rsna_fn = _storage_objects(ext)
+    # Hand the original image (raw bytes) to the upload pipeline
     try:
-        with open(os.path.join(base_dir, image_fn), 'wb') as f:
-            f.write(file_bytes)
+        _persist_asset(prediction_id, image_fn, file_bytes, "image/png" if ext == ".png" else "image/jpeg")
     except Exception:
         pass
 
@@ -262,33 +708,27 @@ def run_inference_bytes(file_bytes: bytes, prediction_id: Optional[str] = None,
     if result.get("Pneumonia") is not None and result.get("meets_threshold"):
         # Saliency mask
         try:
-            if pneu_prob is not None and pneu_prob >= PNEUMONIA_THRESHOLD:
-                sal_img = _gen_saliency(img_tensor, model, pneu_index)
-                if sal_img is not None:
-                    sal_path = os.path.join(base_dir, saliency_fn)
-                    sal_img.save(sal_path, format='PNG')
-                    sal_object_name = f"predictions/{prediction_id}/{saliency_fn}"
-                    sal_url, sal_object, _ = _compose_storage_ref(sal_object_name)
-                    masks["saliency"] = {
-                        "available": True,
-                        "object": sal_object,
-                        "url": sal_url
-                    }
-                    masks["has_any"] = True
+            features = forward.get("features")
+            if method == "none":
+                masks["saliency"] = {"available": False, "status": "disabled"}
+            elif pneu_prob is not None and pneu_prob >= PNEUMONIA_THRESHOLD:
+                if SALIENCY_MODE == "deferred":
+                    _saliency_jobs[prediction_id] = _saliency_pool.submit(
+                        _render_saliency, img_tensor, features, pneu_index, saliency_fn, prediction_id, method
+                    )
+                    masks["saliency"] = {"available": False, "status": "pending", "method": method}
+                else:
+                    sal_entry = _render_saliency(img_tensor, features, pneu_index, saliency_fn, prediction_id, method)
+                    if sal_entry is not None:
+                        masks["saliency"] = sal_entry
+                        masks["has_any"] = True
         except Exception:
             pass
         # RSNA mask (if dataset configured and filename matches)
         try:
-            rsna_raw = _get_rsna_mask(original_filename or "")
-            if rsna_raw is not None:
-                import numpy as np
-                from PIL import Image
-                m = rsna_raw.astype('float32')
-                if m.max() > 0:
-                    m = m / m.max()
-                mask_img = Image.fromarray((m * 255).astype('uint8'))
-                mask_path = os.path.join(base_dir, rsna_fn)
-                mask_img.save(mask_path, format='PNG')
+            rsna_png = _get_rsna_mask_png(original_filename or "")
+            if rsna_png is not None:
+                _persist_asset(prediction_id, rsna_fn, rsna_png, "image/png")
                 rsna_object_name = f"predictions/{prediction_id}/{rsna_fn}"
                 rsna_url, rsna_object, _ = _compose_storage_ref(rsna_object_name)
                 masks["rsna"] = {
@@ -312,96 +752,573 @@ def run_inference_bytes(file_bytes: bytes, prediction_id: Optional[str] = None,
 
 
 @app.get("/healthz")
-async def health() -> Dict[str, str]:
-    return {"status": "ok", "device": str(_device)}
+async def health() -> Dict[str, Any]:
+    """Liveness: in-memory counters only. Table-backed counts (store, sessions, assets, jobs) are on /metrics."""
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "device": str(_device) if _device is not None else None,
+        "engine": INFERENCE_ENGINE,
+        "ensemble": _engine.describe() if _engine is not None and _engine.name == "ensemble" else None,
+        "inference_queue": {"depth": _batcher.qsize(), **_batcher.stats},
+        "result_cache": _result_cache.stats(),
+        "rsna_index": _rsna_mask_index.stats() if _rsna_mask_index is not None else None,
+        "uploads": _uploader.stats() if _uploader is not None else None,
+        "report_cache": report_cache_stats(),
+        "llm": llm_stats(),
+        "admission": {"inference": _inference_gate.stats(), "llm": _llm_gate.stats(), "upload_bytes": _inflight_bytes.stats()},
+    }
+
+
+def _collect_gauges():
+    """Scrape-time gauges and counters from the components that already keep their own stats."""
+    yield ("pneumonai_inference_queue_depth", "gauge", "Images waiting for the batcher", {}, _batcher.qsize())
+    batch = _batcher.stats
+    yield ("pneumonai_inference_batches_total", "counter", "Forward passes run by the batcher", {}, batch.get("batches"))
+    yield ("pneumonai_inference_items_total", "counter", "Images run by the batcher", {}, batch.get("items"))
+    rc = _result_cache.stats()
+    for kind in ("hits", "misses", "coalesced"):
+        yield ("pneumonai_result_cache_lookups_total", "counter", "Upload-hash result cache lookups", {"result": kind}, rc[kind])
+    yield ("pneumonai_cache_hit_ratio", "gauge", "Cache hit ratio since start", {"cache": "result"}, rc["hit_rate"])
+    yield ("pneumonai_cache_entries", "gauge", "Entries held by each cache", {"cache": "result"}, rc["entries"])
+    rep = report_cache_stats()
+    yield ("pneumonai_cache_hit_ratio", "gauge", "Cache hit ratio since start", {"cache": "report"}, rep["hit_rate"])
+    yield ("pneumonai_cache_entries", "gauge", "Entries held by each cache", {"cache": "report"}, rep["entries"])
+    if _rsna_mask_index is not None:
+        rs = _rsna_mask_index.stats()
+        yield ("pneumonai_cache_entries", "gauge", "Entries held by each cache", {"cache": "rsna_png"}, rs["png_cache"])
+    yield ("pneumonai_prediction_store_entries", "gauge", "Records in the prediction store", {"backend": _PREDICTION_STORE.backend}, len(_PREDICTION_STORE))
+    yield ("pneumonai_saliency_pending", "gauge", "Deferred saliency jobs not yet applied", {}, len(_saliency_jobs))
+    if _uploader is not None:
+        up = _uploader.stats()
+        for kind in ("queued", "in_flight"):
+            yield ("pneumonai_upload_queue", "gauge", "Uploads waiting or running", {"state": kind}, up[kind])
+        for kind in ("uploaded", "failed", "retries", "spooled"):
+            yield ("pneumonai_upload_events_total", "counter", "Upload outcomes, retries and local fallbacks", {"event": kind}, up[kind])
+    llm = llm_stats()
+    for kind in ("in_flight", "waiting"):
+        yield ("pneumonai_llm_queue", "gauge", "LLM calls running or waiting for a slot", {"state": kind}, llm[kind])
+    for kind in ("calls", "timeouts", "failures", "fallbacks", "rejected"):
+        yield ("pneumonai_llm_events_total", "counter", "LLM calls and degraded outcomes", {"event": kind}, llm[kind])
+    ast = _assets.stats()
+    yield ("pneumonai_asset_bytes", "gauge", "Bytes held by the local asset store", {}, ast["bytes"])
+    yield ("pneumonai_asset_blobs", "gauge", "Unique blobs in the local asset store", {}, ast["blobs"])
+    yield ("pneumonai_asset_refs", "gauge", "Prediction assets referencing a blob", {}, ast["refs"])
+    yield ("pneumonai_asset_dedup_total", "counter", "Asset writes served by an existing blob", {}, ast["dedup_hits"])
+    for reason in ("ttl", "evicted", "quota"):
+        yield ("pneumonai_asset_gc_removed_total", "counter", "Asset refs removed by GC", {"reason": reason}, ast["removed_" + reason])
+    yield ("pneumonai_asset_gc_freed_bytes_total", "counter", "Bytes freed by asset GC", {}, ast["bytes_freed"])
+    for gate in (_inference_gate, _llm_gate):
+        st = gate.stats()
+        yield ("pneumonai_admission_in_use", "gauge", "Admitted requests holding a slot", {"budget": gate.name}, st["in_use"])
+        yield ("pneumonai_admission_waiting", "gauge", "Requests waiting for a slot", {"budget": gate.name}, st["waiting"])
+        for kind in ("admitted", "queue_full", "predicted", "deadline"):
+            yield ("pneumonai_admission_events_total", "counter", "Admission decisions (rejections by reason)", {"budget": gate.name, "event": kind}, st[kind])
+    ib = _inflight_bytes.stats()
+    yield ("pneumonai_admission_upload_bytes", "gauge", "Upload bytes of admitted requests in flight", {}, ib["current"])
+    yield ("pneumonai_admission_events_total", "counter", "Admission decisions (rejections by reason)", {"budget": "upload_bytes", "event": "memory"}, ib["rejected"])
+    js = _job_runner.stats()
+    for state in ("queued", "running"):
+        yield ("pneumonai_jobs", "gauge", "Jobs in the queue by state", {"state": state}, js[state])
+    yield ("pneumonai_job_oldest_queued_seconds", "gauge", "Age of the oldest queued job (current queue lag)", {}, js["oldest_queued_sec"])
+    yield ("pneumonai_job_workers_busy", "gauge", "Job workers in this process running a job", {}, js["busy"])
+    yield ("pneumonai_job_callbacks_pending", "gauge", "Finished jobs with a webhook still to deliver", {}, js["callbacks_pending"])
+    cs = _CHAT_SESSIONS.stats()
+    yield ("pneumonai_chat_sessions", "gauge", "Live chat sessions", {}, cs["active"])
+    for kind in ("created", "resumed", "expired", "turns", "compactions"):
+        yield ("pneumonai_chat_session_events_total", "counter", "Chat session lifecycle events", {"event": kind}, cs[kind])
+    for state in ("closed", "half_open", "open"):
+        yield ("pneumonai_llm_breaker_state", "gauge", "1 for the circuit breaker's current state", {"state": state}, int(llm["breaker"]["state"] == state))
+
+
+metrics.register_collector(_collect_gauges)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition of stage latencies, queue depths and cache hit rates."""
+    return PlainTextResponse(await run_in_threadpool(metrics.render), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/readyz")
+async def ready():
+    """Readiness: 503 until startup warmup has loaded and exercised the model."""
+    body = {k: v for k, v in _readiness.items() if k != "ready"}
+    body["startup"] = startup_profile()
+    if not _readiness["ready"]:
+        return JSONResponse(body, status_code=503)
+    return body
+
+
+_ALLOWED_CONTENT_TYPES = {"image/jpeg", "image/png", "image/jpg", "application/octet-stream"}
+
+
+def _explain_method_or_400(explain: Optional[str]) -> str:
+    explain_method = (explain or EXPLAIN_METHOD).lower()
+    if explain_method not in explainers.EXPLAIN_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown explain method; use one of {', '.join(explainers.EXPLAIN_METHODS)}")
+    return explain_method
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """Read an upload from Starlette's spooled temp file in chunks, refusing it past MAX_UPLOAD_BYTES."""
+    if MAX_UPLOAD_BYTES and file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    buf = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_READ_CHUNK)
+        if not chunk:
+            break
+        buf += chunk
+        if MAX_UPLOAD_BYTES and len(buf) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    return bytes(buf)
+
+
+def _result_cache_key(data: bytes, filename: Optional[str], explain_method: str) -> str:
+    # RSNA masks are matched by filename, so the filename is part of the key when that lookup is on
+    salt = explain_method + "|" + (os.path.basename(filename or "").lower() if (RSNA_DATASET_PATH or RSNA_INDEX_PATH) else "")
+    with stage("hash"):
+        return _result_cache.key_for(data, salt)
+
+
+def _timed_build_prediction(*args) -> Dict[str, Any]:
+    with stage("postprocess"):  # masks, saliency, asset hand-off
+        return build_prediction(*args)
+
+
+async def _submit_one(img_tensor: torch.Tensor) -> Dict[str, Any]:
+    try:
+        return await _batcher.submit(img_tensor)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Inference queue full, retry shortly", headers={"Retry-After": "1"})
+
+
+def _share_cached_assets(prediction: Dict[str, Any], source_id: str, pred_id: str) -> Dict[str, Any]:
+    """Copy of a cached prediction whose local image/mask refs point at ``pred_id``.
+
+    Uploaded objects (an upload backend is configured) stay where they are and keep the source's references.
+    """
+    prediction = dict(prediction)
+    if _get_uploader() is not None or not _assets.share(source_id, pred_id):
+        return prediction
+    old, new = f"predictions/{source_id}/", f"predictions/{pred_id}/"
+
+    def _rebase(entry):
+        if not isinstance(entry, dict):
+            return entry
+        return {k: v.replace(old, new, 1) if k in ("object", "url") and isinstance(v, str) else v for k, v in entry.items()}
+
+    if "image" in prediction:
+        prediction["image"] = _rebase(prediction["image"])
+    if isinstance(prediction.get("masks"), dict):
+        prediction["masks"] = {k: _rebase(v) for k, v in prediction["masks"].items()}
+    return prediction
+
+
+def _store_prediction(pred_id: str, record: Dict[str, Any]):
+    _PREDICTION_STORE.put(pred_id, record)
+    # Off the event loop too: a saliency job that already finished applies its result right here
+    _attach_saliency(pred_id)
+
+
+async def _predict_one(
+    data: bytes,
+    filename: Optional[str],
+    explain_method: str,
+    cache_key: str,
+    img_tensor: Optional[torch.Tensor] = None,
+    forward_fn=_submit_one,
+    on_shared=None,
+) -> Dict[str, Any]:
+    """Cache lookup or inference for one upload; stores and returns the prediction record.
+
+    ``img_tensor`` skips the decode when the caller already has it; ``forward_fn``
+    runs the forward pass (default: one batcher slot). ``on_shared`` is called when
+    the result comes from the cache or a concurrent request instead.
+    """
+    pred_id = uuid.uuid4().hex
+
+    async def _compute():
+        # Decode off the event loop, batch the forward pass, then finish (masks, disk) off the loop too
+        tensor = img_tensor if img_tensor is not None else await run_in_threadpool(prepare_image, data)
+        with stage("inference"):  # batcher queue wait + shared forward pass
+            forward = await forward_fn(tensor)
+        prediction = await run_in_threadpool(_timed_build_prediction, data, tensor, forward, pred_id, filename, explain_method)
+        return {"source_id": pred_id, "prediction": prediction}
+
+    cached, cache_status = await _result_cache.get_or_compute(cache_key, _compute, on_shared)
+    prediction = cached["prediction"]
+    if cache_status != "miss":
+        # Probabilities come from the first upload; local assets get refs under this id so they outlive its eviction
+        prediction = await run_in_threadpool(_share_cached_assets, prediction, cached["source_id"], pred_id)
+        prediction["cache"] = {"status": cache_status, "source_id": cached["source_id"]}
+    # pred_id retained (previously regenerated causing mismatch with stored assets)
+    prediction_record = {"id": pred_id, **prediction, "created_at": time.time()}
+    await run_in_threadpool(_store_prediction, pred_id, prediction_record)
+    return prediction_record
 
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
-    if file.content_type not in {"image/jpeg", "image/png", "image/jpg", "application/octet-stream"}:
+async def predict(file: UploadFile = File(...), explain: Optional[str] = None):
+    if file.content_type not in _ALLOWED_CONTENT_TYPES:
         raise HTTPException(status_code=415, detail="Unsupported file type")
+    explain_method = _explain_method_or_400(explain)
 
-    data = await file.read()
+    data = await _read_upload(file)
     if len(data) == 0:
         raise HTTPException(status_code=400, detail="Empty file")
-    pred_id = uuid.uuid4().hex
-    prediction = run_inference_bytes(data, prediction_id=pred_id, original_filename=file.filename)
-    # pred_id retained (previously regenerated causing mismatch with stored assets)
-    prediction_record = {"id": pred_id, **prediction, "created_at": time.time()}
-    with _STORE_LOCK:
-        if len(_PREDICTION_STORE) >= _MAX_STORE:
-            # Drop oldest (naive strategy)
-            oldest = sorted(_PREDICTION_STORE.items(), key=lambda kv: kv[1].get("created_at", 0))[0][0]
-            _PREDICTION_STORE.pop(oldest, None)
-        _PREDICTION_STORE[pred_id] = prediction_record
-    # Schedule firebase upload if needed
-    if background_tasks:
-        background_tasks.add_task(_upload_and_cleanup, pred_id, prediction_record)
-    return JSONResponse(prediction_record)
-
-
-def _upload_and_cleanup(pred_id: str, prediction: Dict[str, Any]):
-    bucket = _init_firebase()
-    if not bucket:
-        return
-    base_dir = os.path.join("stored_images", "predictions", pred_id)
-    if not os.path.isdir(base_dir):
-        return
-    # Upload files present
+    cache_key = await run_in_threadpool(_result_cache_key, data, file.filename, explain_method)
+    return JSONResponse(await _predict_one(data, file.filename, explain_method, cache_key))
+
+
+class _ForwardGroup:
+    """Collects the cache-miss tensors of one multi-image request into a single batcher submission.
+
+    ``expected`` are the items planned as misses. The group flushes once each of them
+    has either registered its tensor or learned that its result comes from elsewhere
+    (cache, or another request computing the same upload), however many awaits its
+    path to the forward pass takes. Items that never wait on the group keep requests
+    sharing uploads from waiting on each other.
+    """
+
+    def __init__(self, expected):
+        self._waiting = set(expected)
+        self._tensors: List[torch.Tensor] = []
+        self._futures: List[asyncio.Future] = []
+        self._flush: Optional[asyncio.Future] = None
+        if not self._waiting:
+            self._flush = asyncio.ensure_future(self._submit())
+
+    def forward_for(self, n: int):
+        async def _forward(img_tensor: torch.Tensor) -> Dict[str, Any]:
+            if n not in self._waiting:
+                # Not planned as a miss (cache entry evicted since) or the group already went: go on its own
+                return await _submit_one(img_tensor)
+            fut = asyncio.get_running_loop().create_future()
+            self._tensors.append(img_tensor)
+            self._futures.append(fut)
+            self._arrived(n)
+            return await fut
+        return _forward
+
+    def finished(self, n: int):
+        """Item ``n`` is done; if it never registered a tensor, stop waiting for it."""
+        if n in self._waiting:
+            self._arrived(n)
+
+    def _arrived(self, n: int):
+        self._waiting.discard(n)
+        if not self._waiting and self._flush is None:
+            self._flush = asyncio.ensure_future(self._submit())
+
+    async def wait(self):
+        if self._flush is not None:
+            await self._flush
+
+    async def _submit(self):
+        if not self._tensors:
+            return
+        try:
+            results = await _batcher.submit_many(self._tensors)
+        except Exception as e:
+            if isinstance(e, QueueFullError):
+                e = HTTPException(status_code=503, detail="Inference queue full, retry shortly")
+            for fut in self._futures:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for fut, result in zip(self._futures, results):
+            if not fut.done():
+                fut.set_result(result)
+
+
+def _decode_item(data: bytes) -> Tuple[Optional[torch.Tensor], Optional[str]]:
     try:
-        for fname in os.listdir(base_dir):
-            fpath = os.path.join(base_dir, fname)
-            if not os.path.isfile(fpath):
-                continue
-            object_name = f"predictions/{pred_id}/{fname}"
-            blob = bucket.blob(object_name)
-            blob.upload_from_filename(fpath)
-            blob.make_public()  # For hackathon simplicity; tighten later
-        # Cleanup local directory
-        shutil.rmtree(base_dir, ignore_errors=True)
-    except Exception:
-        pass
+        with stage("decode"):
+            return preprocess.prepare_image(data), None
+    except preprocess.ImageDecodeError as e:
+        return None, str(e)
+
+
+def _item_error(index: int, filename: Optional[str], status_code: int, detail: str) -> Dict[str, Any]:
+    return {"index": index, "original_filename": filename, "error": {"status_code": status_code, "detail": detail}}
+
+
+@app.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(...),
+    explain: Optional[str] = None,
+    stream: bool = Query(False, description="NDJSON: one line per image as it completes"),
+):
+    """Predict several films in one request.
+
+    Uploads are decoded concurrently and every cache miss goes through the model in
+    one batcher submission. Each image gets its own prediction id and stored record,
+    exactly like ``/predict``; per-image failures are reported in place. With
+    ``stream=true`` the response is NDJSON, one line per image in completion order.
+    """
+    explain_method = _explain_method_or_400(explain)
+    if not files:
+        raise HTTPException(status_code=400, detail="No files")
+    if len(files) > PREDICT_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {PREDICT_BATCH_MAX_FILES} files per batch")
+
+    items: List[Tuple[int, Optional[str], bytes]] = []
+    errors: Dict[int, Dict[str, Any]] = {}
+    total = 0
+    for i, f in enumerate(files):
+        if f.content_type not in _ALLOWED_CONTENT_TYPES:
+            errors[i] = _item_error(i, f.filename, 415, "Unsupported file type")
+            continue
+        try:
+            data = await _read_upload(f)
+        except HTTPException as e:
+            errors[i] = _item_error(i, f.filename, e.status_code, str(e.detail))
+            continue
+        if len(data) == 0:
+            errors[i] = _item_error(i, f.filename, 400, "Empty file")
+            continue
+        total += len(data)
+        if PREDICT_BATCH_MAX_BYTES and total > PREDICT_BATCH_MAX_BYTES:
+            # Chunked bodies have no Content-Length for the middleware to check
+            raise HTTPException(status_code=413, detail=f"Batch upload exceeds {PREDICT_BATCH_MAX_BYTES} bytes")
+        items.append((i, f.filename, data))
+
+    keys = await asyncio.gather(*(run_in_threadpool(_result_cache_key, data, name, explain_method) for _, name, data in items))
+    # Decode everything that is not already cached, concurrently
+    to_decode = [n for n, key in enumerate(keys) if key not in _result_cache]
+    decoded = await asyncio.gather(*(run_in_threadpool(_decode_item, items[n][2]) for n in to_decode))
+    tensors: Dict[int, torch.Tensor] = {}
+    for n, (tensor, err) in zip(to_decode, decoded):
+        if err is not None:
+            i, name, _ = items[n]
+            errors[i] = _item_error(i, name, 400, err)
+        else:
+            tensors[n] = tensor
+
+    # One planned miss per key: a duplicate file waits on the first one's result, not on the group
+    first_by_key: Dict[str, int] = {}
+    for n in tensors:
+        first_by_key.setdefault(keys[n], n)
+    group = _ForwardGroup(first_by_key.values())
+
+    async def _one(n: int) -> Dict[str, Any]:
+        i, name, data = items[n]
+        try:
+            record = await _predict_one(
+                data, name, explain_method, keys[n], tensors.get(n), group.forward_for(n), lambda: group.finished(n)
+            )
+        except HTTPException as e:
+            return _item_error(i, name, e.status_code, str(e.detail))
+        except Exception as e:
+            return _item_error(i, name, 500, f"Inference failed: {e}")
+        finally:
+            group.finished(n)
+        return {"index": i, **record}
+
+    tasks = [asyncio.ensure_future(_one(n)) for n in range(len(items)) if items[n][0] not in errors]
+
+    if stream:
+        async def _lines():
+            for i in sorted(errors):
+                yield json.dumps(errors[i]) + "\n"
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task, default=str) + "\n"
+            await group.wait()
+
+        return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+    results = list(errors.values()) + list(await asyncio.gather(*tasks))
+    await group.wait()
+    results.sort(key=lambda r: r["index"])
+    return JSONResponse({
+        "count": len(results),
+        "succeeded": sum(1 for r in results if "error" not in r),
+        "results": results,
+    })
+
 
 @app.get("/prediction/{prediction_id}")
-async def get_prediction(prediction_id: str):
-    with _STORE_LOCK:
-        pred = _PREDICTION_STORE.get(prediction_id)
+async def get_prediction(prediction_id: str, pathologies: bool = False):
+    """Stored prediction; ``pathologies=true`` adds every decoded pathology probability."""
+    pred = await run_in_threadpool(_PREDICTION_STORE.get, prediction_id)
     if not pred:
         raise HTTPException(status_code=404, detail="Prediction ID not found")
+    outputs = pred.get("outputs")
+    if pathologies and outputs and schema_weights(outputs.get("schema", "")) == engines.MODEL_WEIGHTS:
+        labels = get_model().pathologies
+        pred = {**pred, "pathologies": {label: round(float(p), 4) for label, p in zip(labels, decode_outputs(outputs))}}
     return pred
 
 
-@app.post("/report")
-async def report(body: Dict[str, Any] = Body(...)):
-    """Generate LLM report from an existing prediction id.
+@app.get("/prediction/{prediction_id}/saliency")
+async def get_saliency(prediction_id: str):
+    """Poll the saliency mask state: ``pending``, ``ready``, ``failed`` or ``unavailable``."""
+    pred = await run_in_threadpool(_PREDICTION_STORE.get, prediction_id)
+    if not pred:
+        raise HTTPException(status_code=404, detail="Prediction ID not found")
+    source_id = (pred.get("cache") or {}).get("source_id")
+    if source_id:
+        # Cache hits share the source prediction's saliency, which may have finished since
+        pred = await run_in_threadpool(_PREDICTION_STORE.get, source_id) or pred
+    saliency = (pred.get("masks") or {}).get("saliency") or {"available": False}
+    if saliency.get("available"):
+        status = "ready"
+    else:
+        status = saliency.get("status", "unavailable")
+    return {"prediction_id": prediction_id, "status": status, "saliency": saliency}
 
-    Body JSON: { "prediction_id": "<id>" }
-    Optional: allow direct embedding of prediction JSON with key 'prediction'.
+
+def _rethreshold(body: Dict[str, Any]) -> Dict[str, Any]:
+    labels_all = list(get_model().pathologies)
+    labels = body.get("labels") or ["Pneumonia"]
+    if not isinstance(labels, list) or not all(isinstance(label, str) for label in labels):
+        raise HTTPException(status_code=400, detail="labels must be a list of label names")
+    unknown = [label for label in labels if label not in labels_all]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown labels {unknown}; choose from {labels_all}")
+    try:
+        thresholds = resolve_thresholds(labels, body.get("threshold"), body.get("thresholds"), PNEUMONIA_THRESHOLD)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ids = body.get("ids")
+    if ids is None and not body.get("all"):
+        raise HTTPException(status_code=400, detail="Provide 'ids' or 'all': true")
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(pred_id, str) for pred_id in ids)):
+        raise HTTPException(status_code=400, detail="ids must be a list of prediction ids")
+    limit = body.get("limit")
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+        raise HTTPException(status_code=400, detail="limit must be a positive integer")
+    grid = body.get("sweep")
+    if grid:
+        try:
+            grid = parse_sweep(grid)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    # Vectors from another engine or ensemble configuration are not comparable with these
+    schema = body.get("schema") or _output_schema()
+    if not isinstance(schema, str) or schema_weights(schema) != engines.MODEL_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"schema must be one stored by {engines.MODEL_WEIGHTS}")
+
+    found: List[str] = []
+    encoded: List[str] = []
+    missing: List[str] = []
+    skipped = 0
+    other_schema = 0
+    if ids is not None:
+        for pred_id in ids:
+            pred = _PREDICTION_STORE.get(pred_id)
+            if pred is None:
+                missing.append(pred_id)
+                continue
+            outputs = pred.get("outputs")
+            if not outputs:
+                skipped += 1
+                continue
+            if outputs.get("schema") != schema:
+                other_schema += 1
+                continue
+            found.append(pred_id)
+            encoded.append(outputs["f16"])
+    else:
+        for pred_id, outputs in _PREDICTION_STORE.iter_field("outputs"):
+            if limit and len(found) >= limit:
+                break
+            if not isinstance(outputs, dict):
+                skipped += 1
+                continue
+            if outputs.get("schema") != schema:
+                other_schema += 1
+                continue
+            found.append(pred_id)
+            encoded.append(outputs["f16"])
+
+    columns = [labels_all.index(label) for label in labels]
+    matrix = stack_outputs(encoded, len(labels_all))[:, columns]
+    cutoffs = [thresholds[label] for label in labels]
+    meets = matrix >= cutoffs
+    result: Dict[str, Any] = {
+        "evaluated": len(found),
+        "missing": missing,
+        "skipped_no_outputs": skipped,
+        "skipped_other_schema": other_schema,
+        "schema": schema,
+        "labels": labels,
+        "thresholds": thresholds,
+        "positives": {label: int(meets[:, j].sum()) for j, label in enumerate(labels)},
+    }
+    if body.get("include_results", ids is not None):
+        result["results"] = [
+            {
+                "id": pred_id,
+                "probs": {label: round(float(matrix[i, j]), 4) for j, label in enumerate(labels)},
+                "meets_threshold": {label: bool(meets[i, j]) for j, label in enumerate(labels)},
+            }
+            for i, pred_id in enumerate(found)
+        ]
+    if grid:
+        result["sweep"] = {
+            "thresholds": grid,
+            "positives": {label: sweep_counts(matrix[:, j], grid) for j, label in enumerate(labels)},
+        }
+    return result
+
+
+@app.post("/rethreshold")
+async def rethreshold(body: Dict[str, Any] = Body(...)):
+    """Re-evaluate stored predictions against new thresholds/labels from their stored output vectors.
+
+    Body JSON: ``{"ids": [...]} | {"all": true, "limit": N}``, plus optional
+    ``labels`` (default ["Pneumonia"]), ``threshold`` (all labels) and/or
+    ``thresholds`` ({label: value}), ``sweep`` (list of thresholds to count
+    positives at) and ``include_results``. Only vectors stored under ``schema``
+    (default: this server's engine and ensemble configuration) are evaluated;
+    others are counted in ``skipped_other_schema``. Stored records are not modified.
     """
+    return JSONResponse(await run_in_threadpool(_rethreshold, body))
+
+
+def _report_inputs(prediction: Dict[str, Any]):
+    # Build pneumonia-only dict for report generation
+    pneu_prob = prediction.get("Pneumonia")
+    pneu_map = {"Pneumonia": pneu_prob} if pneu_prob is not None else {}
+    return pneu_map, prediction.get("report")
+
+
+def _store_report(prediction: Dict[str, Any], report_obj: Dict[str, Any], prior: Optional[Dict[str, Any]]):
+    pred_id = prediction.get("id")
+    # Template fallbacks are not stored, so the next request retries the LLM
+    if pred_id and report_obj is not prior and not report_obj.get("error") and not report_obj.get("fallback"):
+        _PREDICTION_STORE.update(pred_id, {"report": report_obj})
+
+
+async def _report_for_prediction(prediction: Dict[str, Any]) -> Dict[str, Any]:
+    """Structured report for a prediction, cached alongside it in the prediction store."""
+    pneu_map, prior = _report_inputs(prediction)
+    report_obj = await agenerate_structured_report(pneu_map, prior=prior)
+    await run_in_threadpool(_store_report, prediction, report_obj, prior)
+    return report_obj
+
+
+async def _resolve_report_request(body: Dict[str, Any]):
+    """Returns (prediction_id, prediction, prediction to report on) for /report and /report/stream."""
     prediction_id = body.get("prediction_id")
     prediction = body.get("prediction")
     if prediction_id:
-        with _STORE_LOCK:
-            prediction = _PREDICTION_STORE.get(prediction_id)
+        prediction = await run_in_threadpool(_PREDICTION_STORE.get, prediction_id)
         if not prediction:
             raise HTTPException(status_code=404, detail="Prediction ID not found")
     if not prediction:
         raise HTTPException(status_code=400, detail="Provide 'prediction_id' or 'prediction' JSON")
-
-    # Build pneumonia-only dict for report generation
-    pneu_prob = prediction.get("Pneumonia")
-    pneu_map = {"Pneumonia": pneu_prob} if pneu_prob is not None else {}
-    report_obj = generate_structured_report(pneu_map)
-    return JSONResponse({
-        "prediction_id": prediction.get("id", prediction_id),
-        "prediction": prediction,
-        "has_mask": prediction.get("has_mask", False),
-        "report": report_obj
-    })
+    if prediction_id:
+        return prediction_id, prediction, prediction
+    # Client-supplied JSON: don't trust an embedded report or write into another record
+    return prediction_id, prediction, {k: v for k, v in prediction.items() if k not in ("id", "report")}
 
 
-@app.post("/chat")
-async def chat(query: Dict[str, Any] = Body(...)):
+async def _resolve_chat_request(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Shared /chat and /chat/stream input handling; returns chat_followup kwargs plus metadata."""
     user_msg = query.get("message")
     report_obj = query.get("report")
     prediction_id = query.get("prediction_id")
@@ -409,36 +1326,218 @@ async def chat(query: Dict[str, Any] = Body(...)):
         raise HTTPException(status_code=400, detail="Missing 'message'")
     prediction = None
     if prediction_id:
-        with _STORE_LOCK:
-            prediction = _PREDICTION_STORE.get(prediction_id)
+        prediction = await run_in_threadpool(_PREDICTION_STORE.get, prediction_id)
         if not prediction:
             # Soft fail: still allow generic conversation if desired
             prediction_id = None
-    # Auto-generate report if absent and we have prediction
+    # Reuse the report stored with the prediction (generated on first use) if the client left it out
     if not report_obj and prediction:
-        pneu_prob = prediction.get("Pneumonia")
-        pneu_map = {"Pneumonia": pneu_prob} if pneu_prob is not None else {}
-        report_obj = generate_structured_report(pneu_map)
-    pneumonia_prob = prediction.get("Pneumonia") if prediction else None
+        report_obj = await _report_for_prediction(prediction)
     masks = prediction.get("masks") if prediction else None
-    threshold = prediction.get("threshold") if prediction else None
-    meets_threshold = prediction.get("meets_threshold") if prediction else None
-    answer = chat_followup(
-        user_msg,
-        report_obj,
-        pneumonia_prob=pneumonia_prob,
-        masks=masks,
-        threshold=threshold,
-        meets_threshold=meets_threshold,
-    )
+    # Server-side history only when asked for (session_id to continue, "session": true to start), so stateless chats store nothing
+    session, resumed = None, False
+    if prediction_id and query.get("session") is not False and (query.get("session_id") or query.get("session") is True):
+        session, resumed = await run_in_threadpool(_CHAT_SESSIONS.open, query.get("session_id"), prediction_id)
     return {
+        "prediction_id": prediction_id,
+        "session": session,
+        "session_resumed": resumed,
+        "history": _CHAT_SESSIONS.history(session) if session else "",
+        "message": user_msg,
+        "report": report_obj,
+        "pneumonia_prob": prediction.get("Pneumonia") if prediction else None,
+        "masks": masks,
+        "threshold": prediction.get("threshold") if prediction else None,
+        "meets_threshold": prediction.get("meets_threshold") if prediction else None,
+        "has_mask": bool(masks and (masks.get("has_any") or masks.get("saliency", {}).get("available") or masks.get("rsna", {}).get("available"))),
+    }
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/report")
+async def report(body: Dict[str, Any] = Body(...)):
+    """Generate LLM report from an existing prediction id.
+
+    Body JSON: { "prediction_id": "<id>" }
+    Optional: allow direct embedding of prediction JSON with key 'prediction'.
+    """
+    prediction_id, prediction, target = await _resolve_report_request(body)
+    report_obj = await _report_for_prediction(target)
+    return JSONResponse({
+        "prediction_id": prediction.get("id", prediction_id),
+        "prediction": prediction,
+        "has_mask": prediction.get("has_mask", False),
+        "report": report_obj
+    })
+
+
+@app.post("/report/stream")
+async def report_stream(body: Dict[str, Any] = Body(...)):
+    """Server-Sent Events variant of /report (same body).
+
+    Emits ``prediction`` first, then ``token`` chunks as the LLM writes, ``parsed``
+    as soon as the JSON object is complete, the final ``report`` (also stored with
+    the prediction) and ``done`` with ``ttft_sec``/``total_sec``. Cached reports are
+    sent as a single ``report`` event.
+    """
+    prediction_id, prediction, target = await _resolve_report_request(body)
+    pneu_map, prior = _report_inputs(target)
+
+    async def _events():
+        yield _sse("prediction", {
+            "prediction_id": prediction.get("id", prediction_id),
+            "prediction": prediction,
+            "has_mask": prediction.get("has_mask", False),
+        })
+        async for ev in astream_structured_report(pneu_map, prior=prior):
+            if ev["event"] == "report":
+                await run_in_threadpool(_store_report, target, ev["data"], prior)
+            yield _sse(ev["event"], ev["data"])
+
+    return _sse_response(_events())
+
+
+@app.post("/chat")
+async def chat(query: Dict[str, Any] = Body(...)):
+    req = await _resolve_chat_request(query)
+    answer = await achat_followup(
+        req["message"],
+        req["report"],
+        pneumonia_prob=req["pneumonia_prob"],
+        masks=req["masks"],
+        threshold=req["threshold"],
+        meets_threshold=req["meets_threshold"],
+        history=req["history"],
+    )
+    out = {
         "answer": answer,
-        "used_prediction_id": prediction_id,
-        "pneumonia_prob": pneumonia_prob,
-        "has_mask": bool(masks and (masks.get("has_any") or masks.get("saliency", {}).get("available") or masks.get("rsna", {}).get("available")))
+        "used_prediction_id": req["prediction_id"],
+        "pneumonia_prob": req["pneumonia_prob"],
+        "has_mask": req["has_mask"]
     }
+    if req["session"] is not None:
+        session = await run_in_threadpool(_CHAT_SESSIONS.record, req["session"], req["message"], answer)
+        out["session"] = _CHAT_SESSIONS.describe(session, req["session_resumed"])
+    return out
+
+
+@app.post("/chat/stream")
+async def chat_stream(query: Dict[str, Any] = Body(...)):
+    """Server-Sent Events variant of /chat: ``meta``, then ``token`` chunks, then ``done`` (full answer + timings)."""
+    req = await _resolve_chat_request(query)
+
+    async def _events():
+        yield _sse("meta", {
+            "used_prediction_id": req["prediction_id"],
+            "pneumonia_prob": req["pneumonia_prob"],
+            "has_mask": req["has_mask"],
+            "session_id": req["session"]["id"] if req["session"] is not None else None,
+        })
+        async for ev in astream_chat_followup(
+            req["message"],
+            req["report"],
+            pneumonia_prob=req["pneumonia_prob"],
+            masks=req["masks"],
+            threshold=req["threshold"],
+            meets_threshold=req["meets_threshold"],
+            history=req["history"],
+        ):
+            if ev["event"] == "done" and req["session"] is not None:
+                session = await run_in_threadpool(_CHAT_SESSIONS.record, req["session"], req["message"], ev["data"]["answer"])
+                ev["data"]["session"] = _CHAT_SESSIONS.describe(session, req["session_resumed"])
+            yield _sse(ev["event"], ev["data"])
+
+    return _sse_response(_events())
+
+
+async def _run_job(job: Dict[str, Any], data: bytes) -> Dict[str, Any]:
+    """Job handler: the /predict pipeline, then the /report one, both in the batch admission lane."""
+    options = job["options"]
+    explain_method = options["explain"]
+    try:
+        async with _inference_gate.slot(BATCH):
+            cache_key = await run_in_threadpool(_result_cache_key, data, job["filename"], explain_method)
+            prediction = await _predict_one(data, job["filename"], explain_method, cache_key)
+        report_obj = None
+        if options.get("report", True):
+            async with _llm_gate.slot(BATCH):
+                report_obj = await _report_for_prediction(prediction)
+    except AdmissionRejected as e:
+        raise JobDeferred(e.retry_after)
+    except HTTPException as e:
+        if e.status_code == 503:
+            raise JobDeferred(float((e.headers or {}).get("Retry-After", 1)))
+        # Undecodable or oversized uploads will not get better on retry
+        raise JobError(str(e.detail), retry=e.status_code >= 500)
+    return {"prediction_id": prediction["id"], "prediction": prediction, "report": report_obj}
+
+
+# Durable jobs (SQLite, shared by serve.py workers); each process runs JOB_WORKERS of them on its event loop
+_job_queue = JobQueue(JOB_DB_PATH, JOB_MAX_ATTEMPTS, JOB_LEASE_SEC, JOB_TTL_SEC, JOB_QUEUE_MAX)
+_job_runner = JobRunner(
+    _job_queue, _run_job, JOB_WORKERS, JOB_POLL_SEC, JOB_RETRY_BACKOFF_SEC,
+    JOB_CALLBACK_RETRIES, JOB_CALLBACK_BACKOFF_SEC, JOB_CALLBACK_TIMEOUT_SEC, JOB_CALLBACK_SECRET,
+    JOB_CALLBACK_ALLOW_PRIVATE, JOB_CALLBACK_ALLOWED_HOSTS,
+)
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    explain: Optional[str] = None,
+    report: bool = True,
+    callback_url: Optional[str] = None,
+):
+    """Queue a /predict (+ /report) run; returns the job id at once.
+
+    Poll ``GET /jobs/{id}`` or pass ``callback_url`` to have the finished job
+    document POSTed there (retried with backoff until a 2xx answer).
+    """
+    if file.content_type not in _ALLOWED_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Unsupported file type")
+    explain_method = _explain_method_or_400(explain)
+    if callback_url:
+        try:
+            await run_in_threadpool(check_callback_url, callback_url, JOB_CALLBACK_ALLOW_PRIVATE, JOB_CALLBACK_ALLOWED_HOSTS)
+        except CallbackURLError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    data = await _read_upload(file)
+    if len(data) == 0:
+        raise HTTPException(status_code=400, detail="Empty file")
+    try:
+        job = await run_in_threadpool(
+            _job_queue.submit, data, file.filename, {"explain": explain_method, "report": report}, callback_url
+        )
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Job queue full, retry later", headers={"Retry-After": "30"})
+    _job_runner.wake()
+    return JSONResponse(
+        {"id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"},
+        status_code=202,
+        headers={"Location": f"/jobs/{job['id']}"},
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status; ``result`` (prediction + report) once ``status`` is ``done``."""
+    job = await run_in_threadpool(_job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(job)
 
 
 @app.get("/")
 async def root():
-    return {"message": "Chest X-ray API. 1) POST /predict (image) -> id; 2) POST /report {prediction_id}; 3) POST /chat {message, prediction_id|report}."}
+    return {"message": "Chest X-ray API. 1) POST /predict (image) -> id, or POST /predict/batch (files) -> ids; 2) POST /report {prediction_id}; 3) POST /chat {message, prediction_id|report, session_id?}. Streaming (SSE): /report/stream, /chat/stream. Async: POST /jobs (image, callback_url?) -> GET /jobs/{id}."}
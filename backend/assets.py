@@ -0,0 +1,307 @@
+"""Bounded local store for prediction assets (uploads, saliency and RSNA PNGs).
+
+Used when no upload backend takes the assets. Layout under ``root``::
+
+    blobs/ab/cd/<sha256><ext>    content-addressed files; identical uploads share one
+    predictions/<id>/<name>      hard link to the blob per ref (the path clients are given,
+                                 e.g. behind ``STORAGE_PREFIX``)
+    assets.sqlite3               refs (prediction id, name) -> blob, blob sizes
+
+A background collector runs every ``gc_interval`` seconds, and immediately when a
+write pushes usage past the quota. It drops references:
+
+- older than ``ttl_sec``
+- whose prediction is no longer in the prediction store (``is_live``), so assets
+  follow the store's LRU/TTL eviction
+- oldest first until usage is back under ``max_bytes``
+
+It then deletes blobs that no reference points to. ``predictions/<id>/``
+directories (links, and files from the pre-blob layout) are removed with their refs
+and swept on the same rules. The index is
+SQLite (WAL), so several workers can share one store.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+_LIVENESS_GRACE_SEC = 600  # assets are written before their prediction record is stored
+_QUOTA_TARGET = 0.9  # quota GC frees down to this fraction of max_bytes
+_QUOTA_BATCH = 256  # max predictions considered per quota round
+
+
+class LocalAssetStore:
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int = 0,
+        ttl_sec: float = 0.0,
+        is_live: Optional[Callable[[Iterable[str]], Set[str]]] = None,
+    ):
+        self.root = os.path.abspath(root)
+        self.max_bytes = int(max_bytes)
+        self.ttl_sec = float(ttl_sec)
+        self.is_live = is_live
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"writes": 0, "bytes_written": 0, "dedup_hits": 0, "bytes_deduped": 0,
+                       "gc_runs": 0, "gc_errors": 0, "removed_ttl": 0, "removed_evicted": 0,
+                       "removed_quota": 0, "blobs_deleted": 0, "bytes_freed": 0, "last_gc_sec": None}
+        self._bytes = 0  # approximate usage for the quota trigger; refreshed by every GC
+        self._gc_wake = threading.Event()
+        self._gc_stop = threading.Event()
+        self._gc_thread: Optional[threading.Thread] = None
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs (pred_id TEXT NOT NULL, name TEXT NOT NULL, sha TEXT NOT NULL, "
+            "created_at REAL NOT NULL, PRIMARY KEY (pred_id, name))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_refs_sha ON refs(sha)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_refs_created ON refs(created_at)")
+        self._bytes = self._used_bytes()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, "assets.sqlite3"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, n in deltas.items():
+                self._stats[key] += n
+
+    def blob_path(self, sha: str, ext: str) -> str:
+        return os.path.join(self.root, "blobs", sha[:2], sha[2:4], sha + ext)
+
+    def view_path(self, pred_id: str, name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, "predictions", pred_id, name))
+        if not path.startswith(os.path.join(self.root, "predictions") + os.sep):
+            raise ValueError(f"Asset name escapes store root: {pred_id}/{name}")
+        return path
+
+    def _link_view(self, pred_id: str, name: str, blob: str):
+        """Point ``predictions/<pred_id>/<name>`` at ``blob`` (hard link; a copy where links are unsupported)."""
+        view = self.view_path(pred_id, name)
+        os.makedirs(os.path.dirname(view), exist_ok=True)
+        tmp = f"{view}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            shutil.copyfile(blob, tmp)
+        os.replace(tmp, view)
+
+    def _drop_views(self, pred_ids: Iterable[str]):
+        for pred_id in pred_ids:
+            shutil.rmtree(os.path.join(self.root, "predictions", pred_id), ignore_errors=True)
+
+    def _used_bytes(self) -> int:
+        return self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def put(self, pred_id: str, name: str, data: bytes) -> str:
+        """Store ``data`` as ``name`` of ``pred_id``; returns the blob path (shared with identical content)."""
+        sha = hashlib.sha256(data).hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        path = self.blob_path(sha, ext)
+        conn = self._conn()
+        # One writer at a time, so the collector cannot delete a blob between the check and the new ref
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT ext FROM blobs WHERE sha = ?", (sha,)).fetchone()
+            if row is not None and os.path.exists(self.blob_path(sha, row[0])):
+                path, deduped = self.blob_path(sha, row[0]), True
+            else:
+                _write_atomic(path, data)
+                conn.execute("INSERT OR REPLACE INTO blobs (sha, ext, size, created_at) VALUES (?, ?, ?, ?)",
+                             (sha, ext, len(data), time.time()))
+                deduped = False
+            conn.execute("INSERT OR REPLACE INTO refs (pred_id, name, sha, created_at) VALUES (?, ?, ?, ?)",
+                         (pred_id, name, sha, time.time()))
+            self._link_view(pred_id, name, path)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if deduped:
+            self._count(writes=1, dedup_hits=1, bytes_deduped=len(data))
+        else:
+            self._count(writes=1, bytes_written=len(data))
+            with self._stats_lock:
+                self._bytes += len(data)
+            if self.max_bytes > 0 and self._bytes > self.max_bytes:
+                self._gc_wake.set()
+        return path
+
+    def share(self, src_id: str, dst_id: str) -> int:
+        """Reference every asset of ``src_id`` under ``dst_id`` too (result-cache hits); returns the refs added.
+
+        The blobs then live as long as either prediction does.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT r.name, b.sha, b.ext FROM refs r JOIN blobs b ON b.sha = r.sha WHERE r.pred_id = ?", (src_id,)
+            ).fetchall()
+            now = time.time()
+            for name, sha, ext in rows:
+                conn.execute("INSERT OR REPLACE INTO refs (pred_id, name, sha, created_at) VALUES (?, ?, ?, ?)",
+                             (dst_id, name, sha, now))
+                self._link_view(dst_id, name, self.blob_path(sha, ext))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def path(self, pred_id: str, name: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT b.sha, b.ext FROM refs r JOIN blobs b ON b.sha = r.sha WHERE r.pred_id = ? AND r.name = ?",
+            (pred_id, name),
+        ).fetchone()
+        return self.blob_path(*row) if row is not None else None
+
+    def get(self, pred_id: str, name: str) -> Optional[bytes]:
+        path = self.path(pred_id, name)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _drop_predictions(self, pred_ids: Iterable[str]) -> int:
+        conn = self._conn()
+        removed = 0
+        for pred_id in pred_ids:
+            removed += conn.execute("DELETE FROM refs WHERE pred_id = ?", (pred_id,)).rowcount
+            self._drop_views([pred_id])
+        return removed
+
+    def _delete_orphans(self) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            orphans = conn.execute("SELECT sha, ext, size FROM blobs WHERE sha NOT IN (SELECT sha FROM refs)").fetchall()
+            for sha, ext, _ in orphans:
+                try:
+                    os.unlink(self.blob_path(sha, ext))
+                except FileNotFoundError:
+                    pass
+            conn.executemany("DELETE FROM blobs WHERE sha = ?", [(sha,) for sha, _, _ in orphans])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._count(blobs_deleted=len(orphans), bytes_freed=sum(size for _, _, size in orphans))
+
+    def _sweep_legacy(self, now: float) -> None:
+        """``predictions/<id>/`` directories left without refs (and those written before the blob layout)."""
+        legacy = os.path.join(self.root, "predictions")
+        if not os.path.isdir(legacy):
+            return
+        entries = [e for e in os.scandir(legacy) if e.is_dir()]
+        old = {e.name for e in entries if self.ttl_sec > 0 and e.stat().st_mtime <= now - self.ttl_sec}
+        settled = [e.name for e in entries if e.stat().st_mtime <= now - _LIVENESS_GRACE_SEC]
+        dead = set(settled) - self.is_live(settled) if self.is_live is not None else set()
+        for name in old | dead:
+            shutil.rmtree(os.path.join(legacy, name), ignore_errors=True)
+
+    def gc(self) -> Dict[str, Any]:
+        """One collection pass; returns the refs removed per reason."""
+        start = time.time()
+        conn = self._conn()
+        removed = {"removed_ttl": 0, "removed_evicted": 0, "removed_quota": 0}
+        if self.ttl_sec > 0:
+            cutoff = start - self.ttl_sec
+            expired = [row[0] for row in conn.execute("SELECT DISTINCT pred_id FROM refs WHERE created_at <= ?", (cutoff,))]
+            removed["removed_ttl"] = conn.execute("DELETE FROM refs WHERE created_at <= ?", (cutoff,)).rowcount
+            # A view directory goes once none of its refs is left
+            self._drop_views(pred_id for pred_id in expired
+                             if conn.execute("SELECT 1 FROM refs WHERE pred_id = ? LIMIT 1", (pred_id,)).fetchone() is None)
+        if self.is_live is not None:
+            settled = [row[0] for row in conn.execute(
+                "SELECT DISTINCT pred_id FROM refs WHERE created_at <= ?", (start - _LIVENESS_GRACE_SEC,))]
+            removed["removed_evicted"] = self._drop_predictions(set(settled) - self.is_live(settled))
+        self._delete_orphans()
+        if self.max_bytes > 0:
+            target = int(self.max_bytes * _QUOTA_TARGET)
+            while (excess := self._used_bytes() - target) > 0:
+                # Oldest predictions first, just enough of them to cover the excess (shared blobs may need another round)
+                oldest, freed = [], 0
+                for pred_id, size in conn.execute(
+                    "SELECT r.pred_id, SUM(b.size) FROM refs r JOIN blobs b ON b.sha = r.sha "
+                    "GROUP BY r.pred_id ORDER BY MIN(r.created_at) LIMIT ?", (_QUOTA_BATCH,)
+                ).fetchall():
+                    oldest.append(pred_id)
+                    freed += size
+                    if freed >= excess:
+                        break
+                if not oldest:
+                    break
+                removed["removed_quota"] += self._drop_predictions(oldest)
+                self._delete_orphans()
+        self._sweep_legacy(start)
+        self._bytes = self._used_bytes()
+        self._count(gc_runs=1, **removed)
+        with self._stats_lock:
+            self._stats["last_gc_sec"] = round(time.time() - start, 4)
+        return removed
+
+    def _gc_loop(self, interval: float):
+        while not self._gc_stop.is_set():
+            self._gc_wake.wait(interval)
+            self._gc_wake.clear()
+            if self._gc_stop.is_set():
+                break
+            try:
+                self.gc()
+            except Exception:
+                self._count(gc_errors=1)
+
+    def start_gc(self, interval: float):
+        if self._gc_thread is None and interval > 0:
+            self._gc_stop.clear()
+            self._gc_thread = threading.Thread(target=self._gc_loop, args=(interval,), name="asset-gc", daemon=True)
+            self._gc_thread.start()
+
+    def stop_gc(self):
+        if self._gc_thread is not None:
+            self._gc_stop.set()
+            self._gc_wake.set()
+            self._gc_thread.join(timeout=10)
+            self._gc_thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        blobs, used = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        refs, predictions = conn.execute("SELECT COUNT(*), COUNT(DISTINCT pred_id) FROM refs").fetchone()
+        with self._stats_lock:
+            counters = dict(self._stats)
+        return {"root": self.root, "bytes": used, "max_bytes": self.max_bytes, "ttl_sec": self.ttl_sec,
+                "blobs": blobs, "refs": refs, "predictions": predictions, **counters}
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".asset-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
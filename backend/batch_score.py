@@ -0,0 +1,255 @@
+"""Offline batch scoring of X-ray directories and archives.
+
+Streams images from a directory, ``.zip`` or ``.tar[.gz|.bz2|.xz]`` archive,
+decodes them in a process pool with the same ``prepare_image`` the API uses,
+runs them through the selected inference engine in batches and appends every
+pathology probability (not only Pneumonia) to a CSV file or a Parquet dataset
+directory. Already-scored sources are skipped, so an interrupted run can simply
+be restarted::
+
+    python batch_score.py /data/films.zip --out scores.csv --threshold 0.6
+    python batch_score.py /data/films/ --out scores/ --format parquet --workers 8
+"""
+import argparse
+import collections
+import csv
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Set, Tuple
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+
+
+def iter_sources(path: str, skip: Optional[Set[str]] = None) -> Iterator[Tuple[str, bytes]]:
+    """Yield ``(source_name, bytes)`` for every image under ``path`` in a stable order.
+
+    Names in ``skip`` are filtered before their bytes are read, so resuming a large run
+    does not re-read (or, for compressed tars, decompress into memory) what is already scored.
+    """
+    skip = skip or set()
+
+    def _wanted(name: str) -> bool:
+        return os.path.splitext(name)[1].lower() in IMAGE_EXTS and name not in skip
+
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, path)
+                if _wanted(rel):
+                    with open(full, "rb") as f:
+                        yield rel, f.read()
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and _wanted(info.filename):
+                    yield info.filename, zf.read(info)
+    elif tarfile.is_tarfile(path):
+        # Stream mode: members are read in archive order without seeking; skipped members are never extracted
+        with tarfile.open(path, "r|*") as tf:
+            for member in tf:
+                if member.isfile() and _wanted(member.name):
+                    yield member.name, tf.extractfile(member).read()
+    else:
+        raise ValueError(f"{path} is not a directory, zip or tar archive")
+
+
+def _init_worker():
+    # One intra-op thread per decode process; the model process gets the rest
+    import torch
+    torch.set_num_threads(1)
+
+
+def _decode(item: Tuple[str, bytes]):
+    from preprocess import prepare_image
+    name, data = item
+    try:
+        return name, prepare_image(data).numpy(), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+def decode_parallel(items: Iterator[Tuple[str, bytes]], pool: ProcessPoolExecutor, max_in_flight: int):
+    """Ordered parallel decode that keeps at most ``max_in_flight`` images in memory."""
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.submit(_decode, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class CSVSink:
+    def __init__(self, path: str, columns: List[str]):
+        self.path = path
+        self.columns = columns
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, "a", newline="")
+        self._writer = csv.DictWriter(self._f, fieldnames=columns)
+        if new:
+            self._writer.writeheader()
+
+    @staticmethod
+    def done_sources(path: str) -> Set[str]:
+        if not os.path.exists(path):
+            return set()
+        with open(path, newline="") as f:
+            return {row["source"] for row in csv.DictReader(f) if row.get("source")}
+
+    def write(self, rows: List[dict]):
+        self._writer.writerows(rows)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+
+class ParquetSink:
+    """Each flush writes a new ``part-NNNNN.parquet`` file, so a crash never corrupts earlier parts."""
+
+    def __init__(self, path: str, columns: List[str]):
+        try:
+            import pandas  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("--format parquet requires pandas and pyarrow (pip install pyarrow)") from e
+        self.path = path
+        self.columns = columns
+        os.makedirs(path, exist_ok=True)
+        self._part = len([p for p in os.listdir(path) if p.endswith(".parquet")])
+
+    @staticmethod
+    def done_sources(path: str) -> Set[str]:
+        if not os.path.isdir(path):
+            return set()
+        import pandas as pd
+        done: Set[str] = set()
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".parquet"):
+                done.update(pd.read_parquet(os.path.join(path, name), columns=["source"])["source"])
+        return done
+
+    def write(self, rows: List[dict]):
+        import pandas as pd
+        tmp = os.path.join(self.path, f".part-{self._part:05d}.tmp")
+        pd.DataFrame(rows, columns=self.columns).to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(self.path, f"part-{self._part:05d}.parquet"))
+        self._part += 1
+
+    def close(self):
+        pass
+
+
+def score(
+    source: str,
+    out: str,
+    fmt: str,
+    batch_size: int,
+    workers: int,
+    engine_name: str,
+    threshold: float,
+    resume: bool,
+    flush_every: int,
+    limit: Optional[int] = None,
+) -> int:
+    sink_cls = ParquetSink if fmt == "parquet" else CSVSink
+    if not resume and os.path.exists(out):
+        raise SystemExit(f"{out} exists; remove it or drop --no-resume")
+    done = sink_cls.done_sources(out) if resume else set()
+    if done:
+        print(f"Resuming: {len(done)} sources already scored in {out}", file=sys.stderr)
+
+    # Spawned (not forked) decoders: forking after torch has started its thread pool can deadlock
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, mp_context=multiprocessing.get_context("spawn"))
+    import numpy as np
+    import torch
+    from engines import load_engine, load_model
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = load_model(device)
+    engine = load_engine(engine_name, model, device)
+    pathologies = list(engine.pathologies)
+    pneu_index = pathologies.index("Pneumonia") if "Pneumonia" in pathologies else None
+    columns = ["source", "status", "error", "meets_threshold", "threshold"] + pathologies
+    sink = sink_cls(out, columns)
+
+    todo = iter_sources(source, skip=done)
+    if limit:
+        import itertools
+        todo = itertools.islice(todo, limit)
+
+    scored = failed = 0
+    start = time.time()
+    buffer: List[dict] = []
+    names: List[str] = []
+    tensors = []
+
+    def _flush_batch():
+        nonlocal scored
+        if not tensors:
+            return
+        batch = torch.from_numpy(np.stack(tensors)).to(device)
+        outputs, _ = engine.run(batch)
+        probs = outputs.detach().float().cpu().numpy()
+        for name, row in zip(names, probs):
+            rec = {"source": name, "status": "ok", "error": "", "threshold": threshold}
+            rec.update({p: float(v) for p, v in zip(pathologies, row)})
+            rec["meets_threshold"] = bool(pneu_index is not None and row[pneu_index] >= threshold)
+            buffer.append(rec)
+        scored += len(names)
+        names.clear()
+        tensors.clear()
+
+    try:
+        for name, arr, err in decode_parallel(todo, pool, max_in_flight=max(batch_size, workers) * 4):
+            if err is not None:
+                failed += 1
+                buffer.append({"source": name, "status": "error", "error": err, "threshold": threshold})
+            else:
+                names.append(name)
+                tensors.append(arr)
+                if len(tensors) >= batch_size:
+                    _flush_batch()
+            if len(buffer) >= flush_every:
+                sink.write(buffer)
+                buffer.clear()
+                rate = (scored + failed) / max(time.time() - start, 1e-9)
+                print(f"{scored} scored, {failed} failed ({rate:.1f} img/s)", file=sys.stderr)
+        _flush_batch()
+        if buffer:
+            sink.write(buffer)
+    finally:
+        sink.close()
+        pool.shutdown(cancel_futures=True)
+    elapsed = time.time() - start
+    print(f"Done: {scored} scored, {failed} failed in {elapsed:.1f}s -> {out}", file=sys.stderr)
+    return 0 if failed == 0 else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Batch-score chest X-rays offline")
+    parser.add_argument("source", help="directory, .zip or .tar[.gz] of JPEG/PNG images")
+    parser.add_argument("--out", required=True, help="CSV file, or directory for --format parquet")
+    parser.add_argument("--format", choices=("csv", "parquet"), default=None, help="default: from --out extension")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="decode processes")
+    parser.add_argument("--engine", default=os.getenv("INFERENCE_ENGINE", "eager"))
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("PNEUMONIA_THRESHOLD", "0.70")))
+    parser.add_argument("--flush-every", type=int, default=256, help="rows per write (resume granularity)")
+    parser.add_argument("--limit", type=int, default=None, help="score at most N new images")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", help="fail if --out already exists")
+    args = parser.parse_args(argv)
+    fmt = args.format or ("csv" if args.out.lower().endswith(".csv") else "parquet")
+    return score(args.source, args.out, fmt, args.batch_size, args.workers, args.engine,
+                 args.threshold, args.resume, args.flush_every, args.limit)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Dynamic micro-batching scheduler for model inference.
+
+Requests are submitted from the event loop into a bounded queue. A single
+worker collects them into batches (up to ``max_batch_size`` items, or whatever
+arrived within ``max_wait_ms`` of the first one) and runs ``batch_fn`` on a
+dedicated thread, so the event loop stays free while the model runs.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class QueueFullError(RuntimeError):
+    """Raised by ``submit`` when the scheduler queue is at capacity."""
+
+
+class InferenceBatcher:
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_queue: int = 64,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(1, int(max_queue))
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending_get: Optional[asyncio.Future] = None
+        # One thread: batches are serialized, torch parallelizes inside the op
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.stats: Dict[str, Any] = {"batches": 0, "items": 0, "largest_batch": 0, "last_batch_sec": 0.0}
+
+    async def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._pending_get is not None:
+            self._pending_get.cancel()
+            self._pending_get = None
+        # Fail anything still waiting so callers are not left hanging
+        while self._queue is not None and not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Inference scheduler stopped"))
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its slot of the batch result."""
+        return (await self.submit_many([item]))[0]
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        """Queue several items at once so they can share a batch."""
+        if self._worker is None:
+            await self.start()
+        if self._queue.qsize() + len(items) > self.max_queue:
+            raise QueueFullError("Inference queue is full")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            fut = loop.create_future()
+            self._queue.put_nowait((item, fut))
+            futures.append(fut)
+        return list(await asyncio.gather(*futures))
+
+    async def _next(self, timeout: Optional[float]):
+        # Keep a single outstanding get() across timeouts so no item is lost
+        if self._pending_get is None:
+            self._pending_get = asyncio.ensure_future(self._queue.get())
+        done, _ = await asyncio.wait({self._pending_get}, timeout=timeout)
+        if not done:
+            return None
+        task, self._pending_get = self._pending_get, None
+        return task.result()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._next(None)]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0 and self._queue.empty():
+                    break
+                entry = await self._next(max(remaining, 0))
+                if entry is None:
+                    break
+                batch.append(entry)
+            # Skip requests whose client already went away
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            start = time.time()
+            try:
+                results = await loop.run_in_executor(self._executor, self.batch_fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+            self.stats["last_batch_sec"] = round(time.time() - start, 4)
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
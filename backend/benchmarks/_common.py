@@ -0,0 +1,119 @@
+"""Shared helpers for the benchmark scripts: synthetic films, timing summaries, JSON results."""
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def synthetic_film(height: int, fmt: str = "JPEG", seed: int = 0) -> bytes:
+    """Radiograph-like grayscale image: smooth anatomy-scale structure plus sensor noise."""
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    h, w = height, int(height * 0.85)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    lungs = np.exp(-(((np.abs(xx / w - 0.5) - 0.22) / 0.13) ** 2 + ((yy / h - 0.5) / 0.3) ** 2))
+    img = 200 - 140 * lungs + 12 * np.sin(yy / 37.0 + seed) + rng.normal(0, 6, (h, w))
+    buf = io.BytesIO()
+    Image.fromarray(img.clip(0, 255).astype(np.uint8), mode="L").save(
+        buf, format=fmt, **({"quality": 92} if fmt == "JPEG" else {})
+    )
+    return buf.getvalue()
+
+
+def synthetic_films(sizes: Iterable[int], formats: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+    for size in sizes:
+        for fmt in formats:
+            yield f"synthetic-{int(size * 0.85)}x{size}.{fmt.lower()}", synthetic_film(size, fmt)
+
+
+def summarize(latencies: Sequence[float], wall_sec: Optional[float] = None, errors: int = 0) -> Dict[str, float]:
+    """p50/p95/p99/mean in ms plus throughput (ops/s over ``wall_sec``, else over summed latency)."""
+    if not latencies:
+        return {"n": 0, "errors": errors}
+    arr = np.asarray(latencies, dtype=np.float64) * 1000
+    wall = wall_sec if wall_sec is not None else float(np.sum(latencies))
+    return {
+        "n": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+        "max_ms": round(float(arr.max()), 3),
+        "throughput_per_sec": round(len(latencies) / wall, 3) if wall > 0 else None,
+    }
+
+
+def time_calls(fn, repeats: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    out = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - start)
+    return out
+
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Peak resident set size of this process, or of ``pid`` (Linux /proc VmHWM)."""
+    if pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def run_metadata(args) -> Dict[str, object]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        rev = None
+    env_keys = sorted(k for k in os.environ if k.startswith((
+        "BATCH_", "INFERENCE_", "INT8_", "PREPROCESS_", "EXPLAIN_", "SALIENCY_", "RESULT_CACHE_",
+        "PREDICTION_STORE", "UPLOAD_", "LLM_", "FAKE_LLM_", "OMP_", "TORCH_", "WEB_", "SERVE_",
+    )))
+    return {
+        "timestamp": time.time(),
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "env": {k: os.environ[k] for k in env_keys},
+    }
+
+
+def write_results(path: Optional[str], payload: Dict[str, object]):
+    text = json.dumps(payload, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+        print(f"wrote {path}", file=sys.stderr)
+
+
+def print_table(results: Dict[str, Dict[str, float]]):
+    print(f"{'benchmark':<40} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'err':>5}")
+    for name, r in results.items():
+        if not r.get("n"):
+            print(f"{name:<40} {'-':>6}  skipped{(' (' + r['skipped'] + ')') if r.get('skipped') else ''}")
+            continue
+        print(f"{name:<40} {r['n']:>6} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+              f"{(r.get('throughput_per_sec') or 0):>9.1f} {r.get('errors', 0):>5}")
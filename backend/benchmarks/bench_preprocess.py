@@ -0,0 +1,79 @@
+"""Compare the fast and reference preprocessing paths on large radiographs.
+
+Reports per-image latency, peak traced (numpy) memory and the difference between
+the two (1, 224, 224) outputs in xrv units ([-1024, 1024]). Exits non-zero if
+the mean absolute difference exceeds ``--tolerance``::
+
+    python benchmarks/bench_preprocess.py                      # synthetic 2048/3000/4096 px JPEG + PNG
+    python benchmarks/bench_preprocess.py --images /data/films --repeats 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from _common import synthetic_films  # also puts backend/ on sys.path
+from preprocess import prepare_image_fast, prepare_image_reference  # noqa: E402
+
+
+def directory_films(path):
+    for name in sorted(os.listdir(path)):
+        if os.path.splitext(name)[1].lower() in {".jpg", ".jpeg", ".png"}:
+            with open(os.path.join(path, name), "rb") as f:
+                yield name, f.read()
+
+
+def measure(fn, data: bytes, repeats: int):
+    out = fn(data)  # warm (imports, allocator)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(data)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return np.asarray(out, dtype=np.float32), statistics.median(times), peak
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="fast vs reference preprocessing")
+    parser.add_argument("--images", help="directory of JPEG/PNG films (default: synthetic)")
+    parser.add_argument("--sizes", default="2048,3000,4096", help="synthetic image heights")
+    parser.add_argument("--formats", default="JPEG,PNG")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=8.0, help="max mean |fast - reference| in xrv units")
+    args = parser.parse_args(argv)
+
+    if args.images:
+        films = directory_films(args.images)
+    else:
+        sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+        films = synthetic_films(sizes, [f.strip().upper() for f in args.formats.split(",") if f.strip()])
+
+    print(f"{'image':<28} {'ref ms':>8} {'fast ms':>8} {'speedup':>8} {'ref MiB':>8} {'fast MiB':>9} {'mean diff':>10} {'max diff':>9}")
+    failures = 0
+    speedups = []
+    for name, data in films:
+        ref, ref_t, ref_mem = measure(prepare_image_reference, data, args.repeats)
+        fast, fast_t, fast_mem = measure(prepare_image_fast, data, args.repeats)
+        diff = np.abs(ref - fast)
+        ok = float(diff.mean()) <= args.tolerance
+        failures += 0 if ok else 1
+        speedups.append(ref_t / fast_t)
+        print(f"{name:<28} {ref_t * 1000:>8.1f} {fast_t * 1000:>8.1f} {ref_t / fast_t:>8.2f} "
+              f"{ref_mem / 2**20:>8.1f} {fast_mem / 2**20:>9.1f} {diff.mean():>10.3f} {diff.max():>9.2f}"
+              f"{'' if ok else '  FAIL'}")
+    if speedups:
+        print(f"median speedup {statistics.median(speedups):.2f}x; tolerance {args.tolerance} "
+              f"({'ok' if not failures else f'{failures} over'})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Micro-benchmarks for each stage of the /predict and /report pipeline.
+
+Runs fully offline: synthetic chest-X-ray-sized films at several resolutions,
+the stub LLM (``LLM_PROVIDER=fake``) and the local object store in a temporary
+directory. Results (p50/p95/p99, throughput, peak RSS) are printed and
+optionally written as JSON for ``compare.py``::
+
+    python benchmarks/bench_stages.py --out stages.json
+    python benchmarks/bench_stages.py --only codec,model --sizes 2048,4096 --repeats 50
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+from _common import (peak_rss_mb, print_table, run_metadata, summarize, synthetic_film, time_calls,
+                     write_results)
+
+_TMP = tempfile.mkdtemp(prefix="pneumonai-bench-")
+# Offline, deterministic settings; must be in place before api/llm are imported
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("FAKE_LLM_TOKEN_DELAY_MS", "0")
+os.environ.setdefault("UPLOAD_BACKEND", "local")
+os.environ.setdefault("LOCAL_OBJECT_STORE_DIR", os.path.join(_TMP, "object_store"))
+os.environ.setdefault("REPORT_CACHE_SIZE", "0")
+os.environ.setdefault("RESULT_CACHE_SIZE", "0")
+os.environ.setdefault("PNEUMONIA_THRESHOLD", "0")  # every image takes the saliency/mask path
+os.environ.setdefault("WARMUP_ON_STARTUP", "0")
+
+
+def bench_codec(results, sizes, repeats):
+    from cache import ResultCache
+    from preprocess import prepare_image_fast, prepare_image_reference
+    for size in sizes:
+        for fmt in ("JPEG", "PNG"):
+            data = synthetic_film(size, fmt)
+            tag = f"{fmt.lower()}@{size}"
+            results[f"hash/{tag}"] = summarize(time_calls(lambda: ResultCache.key_for(data, "gradient|"), repeats))
+            results[f"decode_fast/{tag}"] = summarize(time_calls(lambda: prepare_image_fast(data), repeats))
+            results[f"decode_reference/{tag}"] = summarize(time_calls(lambda: prepare_image_reference(data), repeats))
+
+
+def bench_model(results, engines, batch_sizes, repeats):
+    import torch
+    from engines import load_engine, load_model, synthetic_batch
+    from explain import explain, forward_with_features
+    torch.set_grad_enabled(False)
+    device = torch.device("cpu")
+    model = load_model(device)
+    pneu_index = model.pathologies.index("Pneumonia")
+    for name in engines:
+        try:
+            engine = load_engine(name, model, device)
+        except Exception as e:
+            results[f"forward/{name}"] = {"n": 0, "skipped": str(e)}
+            continue
+        for bs in batch_sizes:
+            batch = synthetic_batch(bs)
+            lat = time_calls(lambda: engine.run(batch), repeats)
+            r = summarize(lat)
+            r["images_per_sec"] = round(bs * len(lat) / sum(lat), 2)
+            results[f"forward/{name}/bs{bs}"] = r
+    img = synthetic_batch(1)[0]
+    features = forward_with_features(model, img[None])[1][0]
+    torch.set_grad_enabled(True)
+    for method in ("gradient", "gradcam"):
+        results[f"saliency/{method}"] = summarize(time_calls(lambda: explain(method, img, features, model, pneu_index), repeats))
+    sal_img, _ = explain("gradient", img, features, model, pneu_index)
+
+    def _encode():
+        buf = io.BytesIO()
+        sal_img.save(buf, format="PNG")
+    results["png_encode/saliency"] = summarize(time_calls(_encode, repeats))
+
+
+def bench_inference_bytes(results, sizes, repeats):
+    """api.run_inference_bytes end to end (decode, forward, saliency, PNG, local store), no HTTP."""
+    import uuid
+    import api
+    for size in sizes:
+        data = synthetic_film(size, "JPEG")
+        results[f"run_inference_bytes/jpeg@{size}"] = summarize(time_calls(
+            lambda: api.run_inference_bytes(data, uuid.uuid4().hex, "bench.jpg"), repeats))
+    for size in sizes[:1]:
+        data = synthetic_film(size, "JPEG")
+        tensor = api.prepare_image(data)
+        model = api.get_model()
+        pneu_index = model.pathologies.index("Pneumonia")
+        results["gen_saliency/gradient"] = summarize(time_calls(lambda: api._gen_saliency(tensor, model, pneu_index), repeats))
+    if api._uploader is not None:
+        api._uploader.shutdown(wait=True)
+
+
+def bench_store(results, repeats):
+    import uuid
+    from store import open_store
+    record = {"Pneumonia": 0.42, "threshold": 0.7, "meets_threshold": False,
+              "outputs": {"schema": "bench", "f16": "A" * 48}, "masks": {"has_any": False}}
+    for kind in ("memory", "sqlite"):
+        store = open_store(kind, os.path.join(_TMP, f"{kind}.sqlite3"), 100000, 0)
+        ids = [uuid.uuid4().hex for _ in range(repeats + 1)]
+        it = iter(ids)
+        results[f"store_put/{kind}"] = summarize(time_calls(lambda: store.put(next(it), record), repeats))
+        it = iter(ids)
+        results[f"store_get/{kind}"] = summarize(time_calls(lambda: store.get(next(it)), repeats))
+        it = iter(ids)
+        results[f"store_update/{kind}"] = summarize(time_calls(lambda: store.update(next(it), {"report": {"x": 1}}), repeats))
+
+
+def bench_thresholds(results, repeats):
+    import numpy as np
+    from thresholds import encode_outputs, stack_outputs, sweep_counts
+    rng = np.random.default_rng(0)
+    encoded = [encode_outputs(rng.random(18), "bench")["f16"] for _ in range(10000)]
+
+    def _sweep():
+        m = stack_outputs(encoded, 18)
+        sweep_counts(m[:, 0], [i / 20 for i in range(21)])
+    results["rethreshold_sweep/10k"] = summarize(time_calls(_sweep, max(3, repeats // 10)))
+
+
+def bench_llm(results, repeats):
+    import llm
+
+    async def _run(coro_fn):
+        lat = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            await coro_fn()
+            lat.append(time.perf_counter() - start)
+        return lat
+    results["report/fake_llm"] = summarize(asyncio.run(_run(lambda: llm.agenerate_structured_report({"Pneumonia": 0.42}))))
+    results["chat/fake_llm"] = summarize(asyncio.run(_run(lambda: llm.achat_followup("Is pneumonia likely?", {}, 0.42))))
+
+
+GROUPS = ("codec", "model", "inference", "store", "thresholds", "llm")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Per-stage micro-benchmarks")
+    parser.add_argument("--sizes", default="1024,2048,3000", help="synthetic film heights (px)")
+    parser.add_argument("--engines", default="eager", help="comma list from engines.ENGINES")
+    parser.add_argument("--batch-sizes", default="1,8")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"groups to run: {','.join(GROUPS)}")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    only = {g.strip() for g in args.only.split(",") if g.strip()}
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    results = {}
+    runners = {
+        "codec": lambda: bench_codec(results, sizes, args.repeats),
+        "model": lambda: bench_model(results, [e.strip() for e in args.engines.split(",") if e.strip()],
+                                     [int(b) for b in args.batch_sizes.split(",") if b.strip()], args.repeats),
+        "inference": lambda: bench_inference_bytes(results, sizes, args.repeats),
+        "store": lambda: bench_store(results, max(args.repeats, 200)),
+        "thresholds": lambda: bench_thresholds(results, args.repeats),
+        "llm": lambda: bench_llm(results, args.repeats),
+    }
+    for group in GROUPS:
+        if group not in only:
+            continue
+        try:
+            runners[group]()
+        except ImportError as e:
+            results[group] = {"n": 0, "skipped": f"missing dependency: {e.name}"}
+    print_table(results)
+    rss = peak_rss_mb()
+    print(f"peak RSS {rss} MiB")
+    write_results(args.out, {"kind": "stages", "meta": run_metadata(args), "peak_rss_mb": rss, "results": results})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Compare two benchmark JSON files (from bench_stages.py or loadtest.py).
+
+Prints p50/p95/p99/throughput per benchmark with the relative change, plus
+peak RSS. Exits non-zero when any latency percentile grows (or throughput
+drops) by more than ``--threshold`` percent::
+
+    python benchmarks/compare.py baseline.json candidate.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+_LATENCY = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _pct(old, new):
+    if old is None or new is None or old == 0:
+        return None
+    return (new - old) / old * 100.0
+
+
+def _cell(old, new):
+    change = _pct(old, new)
+    if new is None:
+        return f"{'-':>18}"
+    return f"{new:>9.2f} {'' if change is None else f'{change:+7.1f}%':>8}"
+
+
+def compare(base, cand, threshold: float, min_ms: float = 0.0):
+    """Returns (rows, regressions) for benchmarks present in both runs.
+
+    Latencies where both runs are under ``min_ms`` are timer noise and never count as regressions.
+    """
+    regressions = []
+    rows = []
+    b_results, c_results = base.get("results", {}), cand.get("results", {})
+    for name in [n for n in c_results if n in b_results]:
+        b, c = b_results[name], c_results[name]
+        if not b.get("n") or not c.get("n"):
+            continue
+        rows.append((name, b, c))
+        for key in _LATENCY:
+            if max(b.get(key) or 0, c.get(key) or 0) < min_ms:
+                continue
+            change = _pct(b.get(key), c.get(key))
+            if change is not None and change > threshold:
+                regressions.append(f"{name} {key} {b[key]:.2f} -> {c[key]:.2f} ({change:+.1f}%)")
+        change = _pct(b.get("throughput_per_sec"), c.get("throughput_per_sec"))
+        if change is not None and -change > threshold and max(b.get("p50_ms") or 0, c.get("p50_ms") or 0) >= min_ms:
+            regressions.append(f"{name} throughput {b['throughput_per_sec']:.2f} -> {c['throughput_per_sec']:.2f} ({change:+.1f}%)")
+        if c.get("errors", 0) > b.get("errors", 0):
+            regressions.append(f"{name} errors {b.get('errors', 0)} -> {c['errors']}")
+    return rows, regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    parser.add_argument("--min-ms", type=float, default=0.1, help="ignore latencies below this in both runs")
+    args = parser.parse_args(argv)
+    base, cand = _load(args.baseline), _load(args.candidate)
+    if base.get("kind") != cand.get("kind"):
+        print(f"warning: comparing {base.get('kind')} with {cand.get('kind')} results", file=sys.stderr)
+
+    rows, regressions = compare(base, cand, args.threshold, args.min_ms)
+    print(f"baseline  {base.get('meta', {}).get('git_rev')}  candidate {cand.get('meta', {}).get('git_rev')}")
+    print(f"{'benchmark':<40} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} {'ops/s':>18}")
+    for name, b, c in rows:
+        print(f"{name:<40} " + " ".join(_cell(b.get(k), c.get(k)) for k in _LATENCY + ("throughput_per_sec",)))
+    print(f"{'peak RSS MiB':<40} {_cell(base.get('peak_rss_mb'), cand.get('peak_rss_mb'))}")
+    missing = sorted(set(base.get("results", {})) ^ set(cand.get("results", {})))
+    if missing:
+        print(f"only in one run: {', '.join(missing)}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold}%:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nno regressions over {args.threshold}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""End-to-end HTTP load test for /predict, /report and /chat.
+
+By default starts its own ``uvicorn api:app`` on a free port, fully offline:
+stub LLM (``LLM_PROVIDER=fake``), local object store in a temporary directory,
+in-memory prediction store. ``--url`` targets an already running server
+instead (peak RSS is then only reported if ``--server-pid`` is given)::
+
+    python benchmarks/loadtest.py --requests 200 --concurrency 8 --out load.json
+    python benchmarks/loadtest.py --url http://localhost:8000 --phases predict --concurrency 32
+
+Each phase fires ``--requests`` calls from ``--concurrency`` client threads;
+``/report`` and ``/chat`` reuse the ids returned by the ``/predict`` phase.
+Images are unique per request unless ``--reuse-images`` (exercises the result cache).
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from _common import BACKEND_DIR, peak_rss_mb, run_metadata, summarize, synthetic_film, write_results
+
+PHASES = ("predict", "report", "chat")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workdir: str, extra_env: dict, token_delay_ms: int, workers: int = 1) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("LLM_PROVIDER", "fake")
+    env.setdefault("FAKE_LLM_TOKEN_DELAY_MS", str(token_delay_ms))
+    env.setdefault("UPLOAD_BACKEND", "local")
+    env.setdefault("LOCAL_OBJECT_STORE_DIR", os.path.join(workdir, "object_store"))
+    env.setdefault("PREDICTION_STORE_PATH", os.path.join(workdir, "predictions.sqlite3"))
+    # Every on-disk store in the temp dir, so runs never share (or leave behind) state in stored_images/
+    env.setdefault("CHAT_SESSION_STORE_PATH", os.path.join(workdir, "chat_sessions.sqlite3"))
+    env.setdefault("ASSET_STORE_DIR", os.path.join(workdir, "assets"))
+    env.setdefault("JOB_DB_PATH", os.path.join(workdir, "jobs.sqlite3"))
+    env.update(extra_env)
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    if workers > 1:
+        env.update({"SERVE_WORKERS": str(workers), "SERVE_HOST": "127.0.0.1", "SERVE_PORT": str(port), "SERVE_LOG_LEVEL": "warning"})
+        cmd = [sys.executable, "serve.py"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def server_rss_mb(pid: int):
+    """Peak RSS of ``pid`` plus its direct children (serve.py workers; shared weights count once per process)."""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    values = [v for v in (peak_rss_mb(p) for p in pids) if v is not None]
+    return round(sum(values), 1) if values else None
+
+
+def wait_ready(url: str, timeout: float, proc=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            if requests.get(url + "/readyz", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url}/readyz not ready after {timeout:.0f}s")
+
+
+def run_phase(name, call, n: int, concurrency: int):
+    """Run ``call(i)`` ``n`` times from ``concurrency`` threads; returns (summary, results)."""
+    latencies, statuses, outputs = [], Counter(), []
+    lock = threading.Lock()
+
+    def _one(i):
+        start = time.perf_counter()
+        try:
+            resp = call(i)
+            status, body = resp.status_code, (resp.json() if resp.headers.get("content-type", "").startswith("application/json") else None)
+        except requests.RequestException as e:
+            status, body = type(e).__name__, None
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] += 1
+            if status == 200:
+                outputs.append(body)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(_one, range(n)))
+    wall = time.perf_counter() - start
+    errors = sum(c for s, c in statuses.items() if s != "200")
+    summary = summarize(latencies, wall_sec=wall, errors=errors)
+    summary["status"] = dict(statuses)
+    summary["concurrency"] = concurrency
+    print(f"{name:<10} n={summary['n']:<5} p50={summary.get('p50_ms', 0):>8.1f}ms p95={summary.get('p95_ms', 0):>8.1f}ms "
+          f"p99={summary.get('p99_ms', 0):>8.1f}ms {summary.get('throughput_per_sec') or 0:>7.1f} req/s  status={dict(statuses)}")
+    return summary, outputs
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="HTTP load test (offline by default)")
+    parser.add_argument("--url", help="existing server; default starts a local uvicorn")
+    parser.add_argument("--server-pid", type=int, help="pid of --url server for peak RSS")
+    parser.add_argument("--phases", default=",".join(PHASES))
+    parser.add_argument("--requests", type=int, default=100, help="requests per phase")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size", type=int, default=2048, help="synthetic film height (px)")
+    parser.add_argument("--format", default="JPEG")
+    parser.add_argument("--reuse-images", action="store_true", help="send the same image every time")
+    parser.add_argument("--explain", default=None, help="explain method for /predict")
+    parser.add_argument("--workers", type=int, default=1, help="spawn serve.py with this many workers")
+    parser.add_argument("--token-delay-ms", type=int, default=20, help="fake LLM per-token delay")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE for the spawned server")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout")
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args(argv)
+    phases = [p.strip() for p in args.phases.split(",") if p.strip()]
+
+    proc, pid, url = None, args.server_pid, args.url
+    workdir = tempfile.mkdtemp(prefix="pneumonai-load-")
+    if not url:
+        port = _free_port()
+        proc = start_server(port, workdir, dict(kv.split("=", 1) for kv in args.env), args.token_delay_ms, args.workers)
+        pid, url = proc.pid, f"http://127.0.0.1:{port}"
+    url = url.rstrip("/")
+
+    results, rss = {}, None
+    try:
+        start = time.perf_counter()
+        wait_ready(url, args.startup_timeout, proc)
+        results["startup"] = {"ready_sec": round(time.perf_counter() - start, 2)} if proc else {}
+
+        n_images = 1 if args.reuse_images else args.requests
+        ext = "jpg" if args.format.upper() == "JPEG" else args.format.lower()
+        images = [synthetic_film(args.size, args.format.upper(), seed=i) for i in range(n_images)]
+        params = {"explain": args.explain} if args.explain else None
+        session = threading.local()
+
+        def _http():
+            if not hasattr(session, "s"):
+                session.s = requests.Session()
+            return session.s
+
+        ids = []
+        if {"predict", "report", "chat"} & set(phases):
+            def _predict(i):
+                data = images[i % len(images)]
+                return _http().post(url + "/predict", params=params, timeout=args.timeout,
+                                    files={"file": (f"bench.{ext}", data, "image/jpeg" if ext == "jpg" else f"image/{ext}")})
+            summary, outputs = run_phase("predict", _predict, args.requests, args.concurrency)
+            ids = [o["id"] for o in outputs if o and o.get("id")]
+            if "predict" in phases:
+                results["predict"] = summary
+        if not ids and ({"report", "chat"} & set(phases)):
+            raise RuntimeError("no prediction ids collected; cannot run report/chat phases")
+        if "report" in phases:
+            results["report"], _ = run_phase(
+                "report", lambda i: _http().post(url + "/report", json={"prediction_id": ids[i % len(ids)]}, timeout=args.timeout),
+                args.requests, args.concurrency)
+        if "chat" in phases:
+            results["chat"], _ = run_phase(
+                "chat", lambda i: _http().post(url + "/chat", json={"prediction_id": ids[i % len(ids)],
+                                                                    "message": "What should the next step be?"}, timeout=args.timeout),
+                args.requests, args.concurrency)
+        rss = server_rss_mb(pid) if pid else None
+        if rss is not None:
+            print(f"server peak RSS {rss} MiB")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    write_results(args.out, {"kind": "loadtest", "meta": run_metadata(args), "peak_rss_mb": rss, "results": results})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""In-process caches: a thread-safe LRU/TTL map and a single-flight result cache."""
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """Thread-safe LRU mapping with an optional TTL; every operation is O(1).
+
+    ``max_entries <= 0`` means unbounded, ``ttl_sec <= 0`` means entries never expire.
+    ``on_evict(key, value)`` is called (outside the lock) for capacity evictions and expirations.
+    """
+
+    def __init__(self, max_entries: int, ttl_sec: float = 0.0, on_evict: Optional[Callable[[Any, Any], None]] = None):
+        self.max_entries = int(max_entries)
+        self.ttl_sec = float(ttl_sec)
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, expires_at: float, now: float) -> bool:
+        return self.ttl_sec > 0 and expires_at <= now
+
+    def _notify(self, evicted):
+        if self.on_evict:
+            for key, value in evicted:
+                try:
+                    self.on_evict(key, value)
+                except Exception:
+                    pass
+
+    def get(self, key, default=None):
+        evicted = []
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if self._expired(entry[0], time.time()):
+                del self._data[key]
+                evicted.append((key, entry[1]))
+                value = default
+            else:
+                self._data.move_to_end(key)
+                value = entry[1]
+        self._notify(evicted)
+        return value
+
+    def put(self, key, value):
+        now = time.time()
+        evicted = []
+        with self._lock:
+            self._data[key] = (now + self.ttl_sec, value)
+            self._data.move_to_end(key)
+            # Expired entries sit at the cold end when TTL is uniform
+            while self._data and self.ttl_sec > 0:
+                oldest_key, (expires_at, old_value) = next(iter(self._data.items()))
+                if oldest_key == key or not self._expired(expires_at, now):
+                    break
+                self._data.popitem(last=False)
+                evicted.append((oldest_key, old_value))
+            while self.max_entries > 0 and len(self._data) > self.max_entries:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+        self._notify(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Snapshot of live ``(key, value)`` pairs, coldest first; does not touch recency."""
+        now = time.time()
+        with self._lock:
+            return [(k, v) for k, (expires_at, v) in self._data.items() if not self._expired(expires_at, now)]
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class ResultCache:
+    """Content-addressed prediction cache with single-flight deduplication.
+
+    Concurrent ``get_or_compute`` calls for the same key share one computation;
+    only successful results are cached.
+    """
+
+    def __init__(self, max_entries: int, ttl_sec: float = 0.0):
+        self.enabled = max_entries > 0
+        self._entries = LRUTTLCache(max_entries, ttl_sec)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key_for(data: bytes, salt: str = "") -> str:
+        h = hashlib.sha256(data)
+        if salt:
+            h.update(b"\0" + salt.encode("utf-8"))
+        return h.hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        return self.enabled and key in self._entries
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        on_shared: Optional[Callable[[], None]] = None,
+    ) -> Tuple[Any, str]:
+        """Return ``(value, status)`` where status is ``hit``, ``coalesced`` or ``miss``.
+
+        ``on_shared`` is called as soon as the value is known to come from the cache or
+        another caller's computation, before waiting for it (``compute`` will not run).
+        """
+        if not self.enabled:
+            self.misses += 1
+            return await compute(), "miss"
+        cached = self._entries.get(key, _MISSING)
+        if cached is not _MISSING:
+            self.hits += 1
+            if on_shared is not None:
+                on_shared()
+            return copy.deepcopy(cached), "hit"
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            if on_shared is not None:
+                on_shared()
+            return copy.deepcopy(await asyncio.shield(inflight)), "coalesced"
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self._entries.put(key, value)
+        fut.set_result(value)
+        return copy.deepcopy(value), "miss"
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,393 @@
+"""Selectable CPU inference engines for the xrv DenseNet.
+
+All engines take the batched ``prepare_image`` output, a (N, 1, 224, 224) float
+tensor, and return ``(outputs, features)``: the (N, P) pathology outputs and the
+last dense-block features used by Grad-CAM (None when unavailable).
+
+- ``eager``: the PyTorch module as-is (reference)
+- ``torchscript``: traced + frozen TorchScript graph
+- ``onnx``: ONNX export run with ONNX Runtime (``pip install onnxruntime``)
+- ``int8``: quantized copy; ``INT8_MODE=static`` (default: FX post-training
+  quantization of the conv trunk, calibrated on ``INT8_CALIBRATION_DIR`` images
+  or synthetic ones) or ``dynamic``. Dynamic quantization only covers Linear
+  layers, which in DenseNet121 is the single classifier, so it saves next to nothing
+- ``ensemble``: several xrv models x test-time augmentations (``ensemble.py``);
+  not a drop-in for ``verify``, its scores differ from eager by design
+
+Exported artifacts are cached under ``ENGINE_CACHE_DIR``, keyed by the weights and
+the torch / torchxrayvision / ONNX versions that produced them (written to a temp file
+and renamed into place, so concurrent workers never load a partial one).
+``prepare_engine`` builds the engine before ``serve.py`` forks, so workers share
+it copy-on-write. Compare engines against
+eager on your hardware with::
+
+    python engines.py verify --images assets/ --tolerance 0.02
+
+``load_model`` prefers a baked artifact in ``MODEL_ARTIFACT_DIR``, a pickled
+module loaded with memory-mapped weights. It needs no weights download and no
+state-dict copy, and its pages come from the page cache, shared by every
+process that maps the file. Bake at image build time with::
+
+    python engines.py bake --weights densenet121-res224-all
+"""
+import argparse
+import copy
+import hashlib
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+from explain import forward_with_features
+
+ENGINES = ("eager", "torchscript", "onnx", "int8")
+MODEL_WEIGHTS = "densenet121-res224-all"
+ENGINE_CACHE_DIR = os.getenv("ENGINE_CACHE_DIR", "engine_cache")
+INT8_MODE = os.getenv("INT8_MODE", "static").lower()  # static (conv trunk) | dynamic (classifier Linear only)
+INT8_CALIBRATION_DIR = os.getenv("INT8_CALIBRATION_DIR")
+MODEL_ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR", "model_artifacts")
+
+
+def _library_versions(*packages: str) -> str:
+    from importlib import metadata
+    versions = []
+    for pkg in packages:
+        try:
+            versions.append(f"{pkg}={metadata.version(pkg)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{pkg}=none")
+    return ",".join(versions)
+
+
+def engine_artifact_path(suffix: str, *packages: str) -> str:
+    """Cache path for an exported engine; a library upgrade changes the name, so stale exports are never loaded."""
+    key = hashlib.sha256(_library_versions("torch", "torchxrayvision", *packages).encode()).hexdigest()[:12]
+    return os.path.join(ENGINE_CACHE_DIR, f"{MODEL_WEIGHTS}-{key}{suffix}")
+
+
+def artifact_path(weights: str = MODEL_WEIGHTS) -> str:
+    return os.path.join(MODEL_ARTIFACT_DIR, f"{weights}.pt")
+
+
+def _build_model(device, weights: str):
+    import torchxrayvision as xrv
+    model = xrv.models.DenseNet(weights=weights).to(device)
+    model.eval()
+    return model
+
+
+def _load_artifact(path: str, device):
+    try:
+        model = torch.load(path, map_location="cpu", mmap=True, weights_only=False)
+        model.mmap_artifact = path
+    except TypeError:  # torch < 2.1: no mmap
+        model = torch.load(path, map_location="cpu")
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+def load_model(device, weights: str = MODEL_WEIGHTS):
+    """Eager reference DenseNet (or another xrv ``weights``) in eval mode on ``device``; baked artifact if present."""
+    path = artifact_path(weights)
+    if os.path.exists(path):
+        return _load_artifact(path, device)
+    return _build_model(device, weights)
+
+
+def share_weights(model):
+    """Prepare ``model`` for sharing across fork; memory-mapped weights are shared through the page cache already."""
+    if getattr(model, "mmap_artifact", None) is None:
+        model.share_memory()
+
+
+class _WithFeatures(torch.nn.Module):
+    """Wrap the model so export/tracing returns (outputs, features) in one graph."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return forward_with_features(self.model, x)
+
+
+class Engine:
+    name = "base"
+
+    def __init__(self, model):
+        self.pathologies: List[str] = list(model.pathologies)
+
+    def run(self, batch: torch.Tensor) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        raise NotImplementedError
+
+    def share_memory(self):
+        """Prepare for sharing across fork; weights left untouched after fork stay shared copy-on-write."""
+
+
+def _atomic_write(path: str, write):
+    """Call ``write(tmp_path)``, then rename the result to ``path`` (readers see no partial file)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class EagerEngine(Engine):
+    name = "eager"
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.model = model
+
+    def run(self, batch):
+        with torch.no_grad():
+            return forward_with_features(self.model, batch)
+
+
+class TorchScriptEngine(Engine):
+    name = "torchscript"
+
+    def __init__(self, model, device):
+        super().__init__(model)
+        path = engine_artifact_path(".ts.pt")
+        if os.path.exists(path):
+            self.module = torch.jit.load(path, map_location=device)
+        else:
+            example = torch.zeros(1, 1, 224, 224, device=device)
+            with torch.no_grad():
+                traced = torch.jit.trace(_WithFeatures(model).eval(), example, check_trace=False)
+            self.module = torch.jit.freeze(traced)
+            _atomic_write(path, lambda tmp: torch.jit.save(self.module, tmp))
+        self.module = torch.jit.optimize_for_inference(self.module)
+
+    def run(self, batch):
+        with torch.no_grad():
+            out, features = self.module(batch)
+        return out, features
+
+
+class OnnxEngine(Engine):
+    name = "onnx"
+
+    def __init__(self, model, device):
+        super().__init__(model)
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("INFERENCE_ENGINE=onnx requires onnxruntime (pip install onnxruntime)") from e
+        path = self.export(model, device)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+
+    @staticmethod
+    def export(model, device) -> str:
+        """Path of the cached ONNX export, writing it first if missing."""
+        path = engine_artifact_path(".onnx", "onnx", "onnxruntime")
+        if not os.path.exists(path):
+            example = torch.zeros(1, 1, 224, 224, device=device)
+
+            def _export(tmp):
+                with torch.no_grad():
+                    torch.onnx.export(
+                        _WithFeatures(model).eval(), (example,), tmp,
+                        input_names=["image"], output_names=["outputs", "features"],
+                        dynamic_axes={"image": {0: "batch"}, "outputs": {0: "batch"}, "features": {0: "batch"}},
+                        opset_version=17,
+                    )
+
+            _atomic_write(path, _export)
+        return path
+
+    def run(self, batch):
+        out, features = self.session.run(None, {"image": batch.detach().cpu().numpy()})
+        return torch.from_numpy(out), torch.from_numpy(features)
+
+
+class Int8Engine(EagerEngine):
+    name = "int8"
+
+    def __init__(self, model, device):
+        if device.type != "cpu":
+            raise RuntimeError("INFERENCE_ENGINE=int8 runs on CPU only")
+        qmodel = copy.deepcopy(model).cpu().eval()
+        if INT8_MODE == "static":
+            from torch.ao.quantization import get_default_qconfig_mapping
+            from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+            example = torch.zeros(1, 1, 224, 224)
+            prepared = prepare_fx(qmodel.features, get_default_qconfig_mapping("x86"), example_inputs=(example,))
+            with torch.no_grad():
+                for batch in _calibration_batches():
+                    prepared(batch)
+            qmodel.features = convert_fx(prepared)
+        else:
+            qmodel = torch.ao.quantization.quantize_dynamic(qmodel, {torch.nn.Linear}, dtype=torch.qint8)
+        super().__init__(qmodel)
+
+
+def _calibration_batches(batch_size: int = 8):
+    if INT8_CALIBRATION_DIR and os.path.isdir(INT8_CALIBRATION_DIR):
+        tensors = [t for _, t in _load_images(INT8_CALIBRATION_DIR)]
+    else:
+        print("INT8 static: no INT8_CALIBRATION_DIR, calibrating on synthetic images", file=sys.stderr)
+        tensors = list(synthetic_batch(32))
+    for i in range(0, len(tensors), batch_size):
+        yield torch.stack(tensors[i:i + batch_size])
+
+
+def synthetic_batch(n: int, seed: int = 0) -> torch.Tensor:
+    """Chest-X-ray-like synthetic inputs in the xrv [-1024, 1024] range."""
+    g = torch.Generator().manual_seed(seed)
+    yy, xx = torch.meshgrid(torch.linspace(-1, 1, 224), torch.linspace(-1, 1, 224), indexing="ij")
+    lungs = torch.exp(-(((xx.abs() - 0.45) / 0.25) ** 2 + (yy / 0.6) ** 2))
+    base = (1 - lungs) * 1400 - 700  # bright mediastinum/ribs, dark lung fields
+    noise = torch.randn(n, 1, 224, 224, generator=g) * 120
+    smooth = F.avg_pool2d(noise, 9, stride=1, padding=4)
+    return (base + smooth).clamp(-1024, 1024)
+
+
+def _load_images(directory: str):
+    from preprocess import prepare_image
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1].lower() not in {".jpg", ".jpeg", ".png"}:
+            continue
+        with open(os.path.join(directory, name), "rb") as f:
+            yield name, prepare_image(f.read())
+
+
+def load_engine(name: str, model, device) -> Engine:
+    name = (name or "eager").lower()
+    if name == "eager":
+        return EagerEngine(model)
+    if name == "torchscript":
+        return TorchScriptEngine(model, device)
+    if name == "onnx":
+        return OnnxEngine(model, device)
+    if name == "int8":
+        return Int8Engine(model, device)
+    if name == "ensemble":
+        from ensemble import EnsembleEngine
+        return EnsembleEngine(model, device)
+    raise ValueError(f"Unknown INFERENCE_ENGINE: {name} (choose from {', '.join(ENGINES)})")
+
+
+def prepare_engine(name: str, model, device) -> Optional[Engine]:
+    """Build engine ``name`` in a parent process before fork; None when workers should build their own.
+
+    Frozen, quantized and ensemble weights are then inherited copy-on-write instead
+    of rebuilt per worker. ONNX Runtime sessions own thread pools that do not
+    survive fork, so for ``onnx`` only the export is written here and each worker
+    opens its own session on it. ``eager`` needs nothing beyond the shared model.
+    """
+    name = (name or "eager").lower()
+    if name == "eager":
+        return None
+    if name == "onnx":
+        OnnxEngine.export(model, device)
+        return None
+    engine = load_engine(name, model, device)
+    engine.share_memory()
+    return engine
+
+
+def verify(engines: List[str], images: Optional[str], n: int, batch_size: int, tolerance: float, repeats: int) -> int:
+    """Compare each engine's Pneumonia probability with eager; returns a process exit code."""
+    device = torch.device("cpu")
+    model = load_model(device)
+    pneu_index = model.pathologies.index("Pneumonia")
+    if images:
+        tensors = [t for _, t in _load_images(images)]
+    else:
+        tensors = list(synthetic_batch(n))
+    if not tensors:
+        print("No images to verify against", file=sys.stderr)
+        return 2
+    batches = [torch.stack(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
+
+    def _run(engine):
+        outs = [engine.run(b)[0] for b in batches]  # warm once
+        start = time.perf_counter()
+        for _ in range(repeats):
+            outs = [engine.run(b)[0] for b in batches]
+        per_image = (time.perf_counter() - start) / (repeats * len(tensors))
+        return torch.cat(outs)[:, pneu_index].float(), per_image
+
+    reference, ref_time = _run(EagerEngine(model))
+    print(f"{'engine':<12} {'max_abs_diff':>12} {'ms/image':>10} {'speedup':>8}  status")
+    print(f"{'eager':<12} {0.0:>12.5f} {ref_time * 1000:>10.2f} {1.0:>8.2f}  reference")
+    failures, best = 0, ("eager", ref_time)
+    for name in engines:
+        if name == "eager":
+            continue
+        try:
+            probs, t = _run(load_engine(name, model, device))
+        except Exception as e:
+            print(f"{name:<12} {'-':>12} {'-':>10} {'-':>8}  unavailable ({e})")
+            continue
+        diff = float((probs - reference).abs().max())
+        ok = diff <= tolerance
+        failures += 0 if ok else 1
+        print(f"{name:<12} {diff:>12.5f} {t * 1000:>10.2f} {ref_time / t:>8.2f}  {'ok' if ok else 'FAIL'}")
+        if ok and t < best[1]:
+            best = (name, t)
+    print(f"Fastest engine within tolerance {tolerance}: INFERENCE_ENGINE={best[0]}")
+    return 1 if failures else 0
+
+
+def bake(weights: List[str]) -> int:
+    """Serialize each xrv model to ``MODEL_ARTIFACT_DIR``, then check the mmap reload matches; returns an exit code."""
+    device = torch.device("cpu")
+    os.makedirs(MODEL_ARTIFACT_DIR, exist_ok=True)
+    batch = synthetic_batch(2)
+    failures = 0
+    for name in weights:
+        start = time.perf_counter()
+        model = _build_model(device, name)
+        build_sec = time.perf_counter() - start
+        path = artifact_path(name)
+        tmp = path + ".tmp"
+        torch.save(model, tmp)
+        os.replace(tmp, path)
+        start = time.perf_counter()
+        baked = _load_artifact(path, device)
+        load_sec = time.perf_counter() - start
+        diff = float((baked(batch) - model(batch)).abs().max())
+        ok = diff == 0.0
+        failures += 0 if ok else 1
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"{name}: {path} ({size_mb:.1f} MB) build {build_sec:.2f}s -> mmap load {load_sec:.3f}s, "
+              f"max_abs_diff {diff:.2e} {'ok' if ok else 'FAIL'}")
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inference engine utilities")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    v = sub.add_parser("verify", help="compare engines against eager PyTorch")
+    v.add_argument("--engines", default=",".join(ENGINES))
+    v.add_argument("--images", help="directory of JPEG/PNG X-rays (default: synthetic images)")
+    v.add_argument("--n", type=int, default=16, help="synthetic image count")
+    v.add_argument("--batch-size", type=int, default=8)
+    v.add_argument("--tolerance", type=float, default=0.02, help="max allowed |p - p_eager| for Pneumonia")
+    v.add_argument("--repeats", type=int, default=3)
+    b = sub.add_parser("bake", help="write memory-mappable model artifacts to MODEL_ARTIFACT_DIR")
+    b.add_argument("--weights", default=MODEL_WEIGHTS, help="comma list of xrv weights (e.g. ensemble members)")
+    args = parser.parse_args(argv)
+    torch.set_grad_enabled(False)
+    if args.cmd == "bake":
+        return bake([w.strip() for w in args.weights.split(",") if w.strip()])
+    return verify([e.strip() for e in args.engines.split(",") if e.strip()],
+                  args.images, args.n, args.batch_size, args.tolerance, args.repeats)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
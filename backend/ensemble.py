@@ -0,0 +1,164 @@
+"""Ensemble + test-time-augmentation engine (``INFERENCE_ENGINE=ensemble``).
+
+Takes the same batched ``prepare_image`` tensors as the other engines. Each
+image is expanded into ``ENSEMBLE_TTA`` views (identity plus flips/small
+crops) with tensor ops on the device, so the (N x views) batch is built once
+and fed to every member in ``ENSEMBLE_MODELS`` in turn. The served model is
+always a member (added when not listed) and is reused rather than loaded again.
+Each member's views are averaged, members are aligned to the served model's
+labels by pathology name, and then combined by mean or by ``ENSEMBLE_WEIGHTS``.
+Labels a member was not trained on are left out of its vote.
+
+Cost grows with images x views x members per batch, independent of how many
+HTTP requests the images came in. ``run_detailed`` also returns each member's
+Pneumonia score per image and each member's forward time; Grad-CAM features
+come from the served model's identity view.
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+from engines import MODEL_WEIGHTS, Engine, load_model, share_weights
+from explain import forward_with_features
+from metrics import observe_stage
+
+ENSEMBLE_MODELS = os.getenv(
+    "ENSEMBLE_MODELS", f"{MODEL_WEIGHTS},densenet121-res224-rsna,densenet121-res224-nih,densenet121-res224-chex"
+)  # xrv 224px weights; the served model is always included
+ENSEMBLE_WEIGHTS = os.getenv("ENSEMBLE_WEIGHTS", "")  # one per member, e.g. "2,1,1,1"; empty = plain mean
+ENSEMBLE_TTA = os.getenv("ENSEMBLE_TTA", "hflip,crop")  # views besides identity: hflip | crop | shift; "none" = identity only
+_CROP_SCALE = 0.9  # "crop" view: center 90%, resized back to 224
+_SHIFT_PX = 8  # "shift" views: +/- this many pixels diagonally
+TTA_VIEWS = ("identity", "hflip", "crop", "shift")
+
+
+def _views(batch: torch.Tensor, tta: List[str]) -> torch.Tensor:
+    """(N, 1, H, W) -> (N * V, 1, H, W), image-major (the V views of image i are rows i*V .. i*V+V-1)."""
+    n, _, h, w = batch.shape
+    views = [batch]
+    for name in tta:
+        if name == "hflip":
+            views.append(torch.flip(batch, dims=[3]))
+        elif name == "crop":
+            ch, cw = int(h * _CROP_SCALE), int(w * _CROP_SCALE)
+            top, left = (h - ch) // 2, (w - cw) // 2
+            crop = batch[:, :, top:top + ch, left:left + cw]
+            views.append(F.interpolate(crop, size=(h, w), mode="bilinear", align_corners=False))
+        elif name == "shift":
+            views.append(torch.roll(batch, shifts=(_SHIFT_PX, _SHIFT_PX), dims=(2, 3)))
+            views.append(torch.roll(batch, shifts=(-_SHIFT_PX, -_SHIFT_PX), dims=(2, 3)))
+    return torch.stack(views, dim=1).reshape(n * len(views), 1, h, w)
+
+
+def _parse_list(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+class EnsembleEngine(Engine):
+    name = "ensemble"
+
+    def __init__(
+        self,
+        model,
+        device,
+        members: Optional[List[str]] = None,
+        weights: Optional[List[float]] = None,
+        tta: Optional[List[str]] = None,
+    ):
+        super().__init__(model)
+        names = list(dict.fromkeys(members if members is not None else _parse_list(ENSEMBLE_MODELS)))
+        if MODEL_WEIGHTS not in names:
+            names.insert(0, MODEL_WEIGHTS)
+        for name in names:
+            if "res224" not in name:
+                raise ValueError(f"Ensemble member {name} does not take the shared 224px input")
+        if weights is None:
+            weights = [float(w) for w in _parse_list(ENSEMBLE_WEIGHTS)] or [1.0] * len(names)
+        if len(weights) != len(names) or min(weights) < 0 or sum(weights) <= 0:
+            raise ValueError(f"ENSEMBLE_WEIGHTS needs {len(names)} non-negative values (members: {', '.join(names)})")
+        self.tta = [t for t in (tta if tta is not None else _parse_list(ENSEMBLE_TTA)) if t not in ("none", "identity")]
+        unknown = set(self.tta) - set(TTA_VIEWS)
+        if unknown:
+            raise ValueError(f"Unknown ENSEMBLE_TTA view(s): {', '.join(sorted(unknown))} (choose from {', '.join(TTA_VIEWS[1:])})")
+        self.device = device
+        self.member_names = names
+        self.primary = names.index(MODEL_WEIGHTS)
+        self.models = [model if name == MODEL_WEIGHTS else load_model(device, name) for name in names]
+        self.weights = torch.tensor(weights, dtype=torch.float32)
+        self.method = "weighted_mean" if len(set(weights)) > 1 else "mean"
+        # Column of each served label in every member's output (-1: the member lacks that label)
+        columns = []
+        for m in self.models:
+            labels = {label: j for j, label in enumerate(m.pathologies) if label}
+            columns.append([labels.get(label, -1) if label else -1 for label in self.pathologies])
+        self.columns = torch.tensor(columns, dtype=torch.long)  # (M, P)
+        self.columns[self.primary] = torch.arange(len(self.pathologies))  # the served model covers every column
+        self.n_views = 1 + sum(2 if t == "shift" else 1 for t in self.tta)
+        self._pneu = self.pathologies.index("Pneumonia") if "Pneumonia" in self.pathologies else None
+
+    def share_memory(self):
+        for m in self.models:
+            share_weights(m)
+
+    def run(self, batch):
+        outputs, features, _ = self.run_detailed(batch)
+        return outputs, features
+
+    def run_detailed(self, batch: torch.Tensor) -> Tuple[torch.Tensor, Optional[torch.Tensor], Dict[str, Any]]:
+        """``(outputs, features, details)``; details hold per-member Pneumonia scores (N x M) and forward times."""
+        n = batch.shape[0]
+        views = _views(batch.to(self.device), self.tta)
+        per_member, timing = [], {}
+        features = None
+        with torch.no_grad():
+            for i, (name, m) in enumerate(zip(self.member_names, self.models)):
+                start = time.perf_counter()
+                if i == self.primary:
+                    out, captured = forward_with_features(m, views)
+                    if captured is not None:
+                        features = captured[::self.n_views]
+                else:
+                    out = m(views)
+                out = out.float().reshape(n, self.n_views, -1).mean(dim=1)  # (N, P_m)
+                elapsed = time.perf_counter() - start
+                timing[name] = elapsed
+                observe_stage(f"ensemble_{name}", elapsed)
+                cols = self.columns[i]
+                aligned = out[:, cols.clamp(min=0).to(out.device)]
+                per_member.append(torch.where((cols >= 0).to(out.device), aligned, torch.full_like(aligned, float("nan"))))
+        stacked = torch.stack(per_member)  # (M, N, P), NaN where a member lacks the label
+        present = ~torch.isnan(stacked)
+        w = self.weights.to(stacked.device).view(-1, 1, 1) * present
+        outputs = (torch.nan_to_num(stacked) * w).sum(0) / w.sum(0).clamp(min=1e-12)
+        details = {
+            "members": self.member_names,
+            "pneumonia": stacked[:, :, self._pneu].T.cpu() if self._pneu is not None else None,  # (N, M)
+            "timing_sec": timing,
+        }
+        return outputs, features, details
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "members": self.member_names,
+            "weights": self.weights.tolist(),
+            "method": self.method,
+            "tta": ["identity"] + self.tta,
+            "views_per_image": self.n_views,
+        }
+
+
+def summarize(scores: torch.Tensor, members: List[str]) -> Dict[str, Any]:
+    """Per-member Pneumonia scores of one image and their spread."""
+    valid = [(name, float(s)) for name, s in zip(members, scores.tolist()) if s == s]
+    values = torch.tensor([s for _, s in valid]) if valid else torch.zeros(0)
+    return {
+        "members": {name: round(s, 4) for name, s in valid},
+        "spread": {
+            "std": round(float(values.std(unbiased=False)), 4) if len(values) else None,
+            "min": round(float(values.min()), 4) if len(values) else None,
+            "max": round(float(values.max()), 4) if len(values) else None,
+        },
+    }
@@ -0,0 +1,84 @@
+"""Saliency / explanation maps for the xrv DenseNet.
+
+``gradient``: input-gradient magnitude (needs its own forward + backward pass).
+``gradcam``: class activation map from the last dense-block features returned
+by the main (no_grad) forward pass (``forward_with_features``). The xrv DenseNet ends in ReLU -> global
+average pool -> linear, and the Pneumonia output is a monotonic function of its
+logit, so Grad-CAM weights reduce to the classifier row for that class (up to a
+positive scale that normalization removes); no second pass is needed.
+"""
+import time
+from typing import Dict, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+EXPLAIN_METHODS = ("gradient", "gradcam", "none")
+
+
+def forward_with_features(model, x: torch.Tensor) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+    """``(outputs, features)`` for ``x``; features are the rectified last dense-block maps (None if unavailable).
+
+    Runs the xrv DenseNet head on the trunk output directly rather than hooking
+    ``model.features``: the model is shared by the batcher, saliency workers and
+    warmup, and a module hook would see every concurrent pass.
+    """
+    trunk = getattr(model, "features", None)
+    classifier = getattr(model, "classifier", None)
+    if trunk is None or classifier is None:
+        return model(x), None
+    # Same stages as xrv DenseNet.forward (inputs are already 224x224 from prepare_image)
+    features = F.relu(trunk(x))
+    out = classifier(F.adaptive_avg_pool2d(features, (1, 1)).flatten(1))
+    if getattr(model, "apply_sigmoid", False):
+        out = torch.sigmoid(out)
+    op_threshs = getattr(model, "op_threshs", None)
+    if op_threshs is not None:
+        from torchxrayvision.models import op_norm
+        out = op_norm(torch.sigmoid(out), op_threshs)
+    return out, features.detach()
+
+
+def _to_image(sal: torch.Tensor):
+    import numpy as np
+    from PIL import Image
+    sal = (sal - sal.min()) / (sal.max() - sal.min() + 1e-8)
+    sal_np = (sal.numpy() * 255).astype(np.uint8)
+    return Image.fromarray(sal_np, mode='L')
+
+
+def gradient_saliency(img_tensor: torch.Tensor, model, class_index: int):
+    """Gradient magnitude of the class output w.r.t. input pixels (grayscale 224x224)."""
+    x = img_tensor[None, ...].detach().requires_grad_(True)
+    out = model(x)
+    if class_index >= out.shape[1]:
+        return None
+    # autograd.grad leaves parameter .grad untouched, so concurrent callers don't interfere
+    (grads,) = torch.autograd.grad(out[0, class_index], x)
+    return _to_image(grads.detach().cpu()[0, 0].abs())
+
+
+def gradcam_saliency(features: Optional[torch.Tensor], model, class_index: int, size: Tuple[int, int] = (224, 224)):
+    """Class activation map from captured (C, h, w) features, upsampled to ``size``."""
+    classifier = getattr(model, "classifier", None)
+    if features is None or classifier is None or class_index >= classifier.weight.shape[0]:
+        return None
+    with torch.no_grad():
+        weights = classifier.weight[class_index].to(features.device, features.dtype)
+        cam = torch.einsum("c,chw->hw", weights, F.relu(features))
+        cam = F.relu(cam)
+        cam = F.interpolate(cam[None, None], size=size, mode="bilinear", align_corners=False)[0, 0]
+    return _to_image(cam.cpu())
+
+
+def explain(method: str, img_tensor: torch.Tensor, features: Optional[torch.Tensor], model, class_index: int):
+    """Return ``(PIL image or None, timing dict)`` for the requested method."""
+    start = time.time()
+    if method == "gradcam":
+        img = gradcam_saliency(features, model, class_index, size=tuple(img_tensor.shape[-2:]))
+    elif method == "gradient":
+        img = gradient_saliency(img_tensor, model, class_index)
+    else:
+        img = None
+    timing: Dict[str, float] = {"compute_sec": round(time.time() - start, 4)}
+    return img, timing
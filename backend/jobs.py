@@ -0,0 +1,578 @@
+"""Durable asynchronous prediction jobs with webhook callbacks.
+
+``POST /jobs`` writes the upload and its options to a SQLite queue
+(``JOB_DB_PATH``, WAL) and returns a job id at once. ``JobRunner`` workers on
+the event loop claim jobs under a lease and run the handler (predict, then
+report, in ``api.py``), then store the result for ``GET /jobs/{id}``.
+
+- **Restarts.** Jobs survive them: a job whose worker died is claimed again
+  once its lease expires, up to ``max_attempts``. Every ``serve.py`` worker
+  runs its own runner on the shared queue.
+- **Retries.** Transient failures are retried with backoff. ``JobError(retry=False)``
+  fails the job at once. ``JobDeferred`` puts it back without using up an
+  attempt, for example when admission control is shedding load.
+- **Callbacks.** Finished jobs with a ``callback_url`` are POSTed there as JSON,
+  the same document ``GET /jobs/{id}`` returns. Failed deliveries are retried
+  with exponential backoff, and with a secret each body is signed
+  (``X-PneumonAI-Signature: sha256=<hmac>``). Due callbacks are claimed under
+  a lease like jobs, so each attempt is made by one worker. URLs that resolve
+  to loopback, private or link-local addresses are refused unless allowed.
+
+Try the whole flow locally against the built-in receiver::
+
+    python jobs.py receive --port 9000 --fail-first 1
+    JOB_CALLBACK_ALLOW_PRIVATE=1 python serve.py
+    curl -F file=@assets/xray.jpg "localhost:8000/jobs?callback_url=http://localhost:9000/hook"
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import counter, histogram
+
+_JOBS = counter("pneumonai_jobs_total", "Job outcomes (submitted, done, failed, retried, deferred)")
+_CALLBACKS = counter("pneumonai_job_callbacks_total", "Webhook deliveries (delivered, retried, failed)")
+_QUEUE_LAG = histogram("pneumonai_job_queue_lag_seconds", "Time from submission to first start",
+                       (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+_RUN_SECONDS = histogram("pneumonai_job_run_seconds", "Handler time per attempt",
+                         (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+_CALLBACK_MAX_BACKOFF_SEC = 300
+log = logging.getLogger("pneumonai.jobs")
+_PURGE_EVERY_SEC = 60
+
+
+class JobQueueFull(RuntimeError):
+    """Raised by ``submit`` when ``max_queued`` jobs are already waiting."""
+
+
+class CallbackURLError(ValueError):
+    """``callback_url`` is malformed or points somewhere deliveries are not allowed."""
+
+
+def check_callback_url(url: str, allow_private: bool = False, allowed_hosts: Optional[List[str]] = None) -> str:
+    """Validate a webhook URL; returns it or raises ``CallbackURLError``.
+
+    ``allowed_hosts`` (if given) is an exact host allow-list. Otherwise every
+    address the host resolves to must be public unless ``allow_private``, so
+    clients cannot make the server POST to itself or the internal network.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise CallbackURLError("callback_url must be an absolute http(s) URL")
+    host = parts.hostname.lower()
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise CallbackURLError(f"callback_url host {host} is not in JOB_CALLBACK_ALLOWED_HOSTS")
+        return url
+    if allow_private:
+        return url
+    try:
+        infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise CallbackURLError(f"callback_url host {host} does not resolve") from e
+    for info in infos:
+        addr = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not addr.is_global:
+            raise CallbackURLError(f"callback_url host {host} resolves to a non-public address")
+    return url
+
+
+class JobError(Exception):
+    """Handler failure; ``retry=False`` fails the job without further attempts."""
+
+    def __init__(self, detail: str, retry: bool = True):
+        super().__init__(detail)
+        self.retry = retry
+
+
+class JobDeferred(Exception):
+    """Handler could not start (server busy); the job is requeued after ``delay`` seconds without using an attempt."""
+
+    def __init__(self, delay: float = 1.0):
+        super().__init__(f"deferred {delay}s")
+        self.delay = delay
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 3,
+        lease_sec: float = 600.0,
+        ttl_sec: float = 7 * 24 * 3600,
+        max_queued: int = 1000,
+    ):
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self.lease_sec = lease_sec
+        self.ttl_sec = ttl_sec
+        self.max_queued = max_queued
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT, "
+            "options TEXT NOT NULL, callback_url TEXT, created_at REAL NOT NULL, available_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "worker TEXT, result TEXT, error TEXT, callback_status TEXT, callback_attempts INTEGER NOT NULL DEFAULT 0, "
+            "callback_next_at REAL, callback_error TEXT, delivered_at REAL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS job_inputs (id TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, available_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_callback ON jobs(callback_status, callback_next_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """Run ``fn(conn)`` in one IMMEDIATE transaction (one writer across workers)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            out = fn(conn)
+            conn.execute("COMMIT")
+            return out
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def submit(self, data: bytes, filename: Optional[str], options: Dict[str, Any], callback_url: Optional[str]) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def _insert(conn):
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if self.max_queued > 0 and queued >= self.max_queued:
+                raise JobQueueFull(f"{queued} jobs pending")
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, options, callback_url, created_at, available_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, filename, json.dumps(options), callback_url, now, now),
+            )
+            conn.execute("INSERT INTO job_inputs (id, data) VALUES (?, ?)", (job_id, data))
+
+        self._write(_insert)
+        _JOBS.inc(event="submitted")
+        return self.get(job_id)
+
+    def claim(self, worker: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """Lease the oldest runnable job (or one whose worker's lease ran out); ``(job, upload)`` or None."""
+        now = time.time()
+
+        def _claim(conn):
+            # Lost jobs that already used every attempt are failed rather than run again
+            lost = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'worker lost (lease expired)', finished_at = ?, "
+                "lease_until = NULL, callback_status = CASE WHEN callback_url IS NULL THEN NULL ELSE 'pending' END, "
+                "callback_next_at = ? WHERE status = 'running' AND lease_until <= ? AND attempts >= ?",
+                (now, now, now, self.max_attempts),
+            ).rowcount
+            if lost:
+                conn.execute("DELETE FROM job_inputs WHERE id IN (SELECT id FROM jobs WHERE status = 'failed')")
+                _JOBS.inc(lost, event="failed")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until <= ?) "
+                "ORDER BY available_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), lease_until = ?, "
+                "attempts = attempts + 1, worker = ? WHERE id = ?",
+                (now, now + self.lease_sec, worker, row["id"]),
+            )
+            job = dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+            data = conn.execute("SELECT data FROM job_inputs WHERE id = ?", (row["id"],)).fetchone()
+            return job, (bytes(data["data"]) if data is not None else None)
+
+        claimed = self._write(_claim)
+        if claimed is None:
+            return None
+        job, data = claimed
+        job["options"] = json.loads(job["options"])
+        if job["attempts"] == 1:
+            _QUEUE_LAG.observe(now - job["created_at"])
+        return job, data
+
+    def _settle(self, job: Dict[str, Any], sets: str, args: tuple, final: bool) -> bool:
+        """Update a job this worker still holds (same attempt); False when the lease was lost to another worker."""
+        def _update(conn):
+            cur = conn.execute(
+                f"UPDATE jobs SET {sets} WHERE id = ? AND status = 'running' AND attempts = ?",
+                (*args, job["id"], job["attempts"]),
+            )
+            if cur.rowcount and final:
+                conn.execute("DELETE FROM job_inputs WHERE id = ?", (job["id"],))
+            return cur.rowcount > 0
+
+        return self._write(_update)
+
+    def finish(self, job: Dict[str, Any], result: Dict[str, Any]) -> bool:
+        now = time.time()
+        ok = self._settle(
+            job,
+            "status = 'done', result = ?, error = NULL, finished_at = ?, lease_until = NULL, "
+            "callback_status = CASE WHEN callback_url IS NULL THEN NULL ELSE 'pending' END, callback_next_at = ?",
+            (json.dumps(result, default=str), now, now),
+            final=True,
+        )
+        if ok:
+            _JOBS.inc(event="done")
+        return ok
+
+    def fail(self, job: Dict[str, Any], error: str, retry: bool, backoff_sec: float) -> bool:
+        now = time.time()
+        if retry and job["attempts"] < self.max_attempts:
+            delay = backoff_sec * 2 ** (job["attempts"] - 1)
+            ok = self._settle(job, "status = 'queued', error = ?, available_at = ?, lease_until = NULL",
+                              (error, now + delay), final=False)
+            if ok:
+                _JOBS.inc(event="retried")
+            return ok
+        ok = self._settle(
+            job,
+            "status = 'failed', error = ?, finished_at = ?, lease_until = NULL, "
+            "callback_status = CASE WHEN callback_url IS NULL THEN NULL ELSE 'pending' END, callback_next_at = ?",
+            (error, now, now),
+            final=True,
+        )
+        if ok:
+            _JOBS.inc(event="failed")
+        return ok
+
+    def defer(self, job: Dict[str, Any], delay: float) -> bool:
+        ok = self._settle(job, "status = 'queued', attempts = attempts - 1, available_at = ?, lease_until = NULL",
+                          (time.time() + delay,), final=False)
+        if ok:
+            _JOBS.inc(event="deferred")
+        return ok
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _public(dict(row)) if row is not None else None
+
+    def due_callbacks(self, limit: int = 16, lease_sec: float = 60.0) -> List[Dict[str, Any]]:
+        """Claim up to ``limit`` due callbacks for ``lease_sec``; other workers skip them until the lease runs out."""
+        def _claim(conn):
+            now = time.time()
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE callback_status = 'pending' AND callback_next_at <= ? ORDER BY callback_next_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            # Pushing callback_next_at past the lease is the claim; a worker that dies leaves it to be retried
+            conn.executemany("UPDATE jobs SET callback_next_at = ? WHERE id = ?", [(now + lease_sec, row["id"]) for row in rows])
+            return [dict(row) for row in rows]
+
+        return self._write(_claim)
+
+    def callback_attempted(self, job_id: str, attempt: int, delivered: bool, error: Optional[str], next_at: Optional[float]) -> bool:
+        """Record delivery attempt number ``attempt`` (0-based); ``next_at=None`` after a failure gives up.
+
+        False when that attempt was already recorded (the lease ran out and another worker took it).
+        """
+        status = "delivered" if delivered else ("pending" if next_at is not None else "failed")
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET callback_status = ?, callback_attempts = callback_attempts + 1, callback_error = ?, "
+            "callback_next_at = ?, delivered_at = ? WHERE id = ? AND callback_status = 'pending' AND callback_attempts = ?",
+            (status, error, next_at, time.time() if delivered else None, job_id, attempt),
+        ).rowcount > 0)
+
+    def purge(self) -> int:
+        """Drop finished jobs older than ``ttl_sec`` whose callback is no longer pending."""
+        if self.ttl_sec <= 0:
+            return 0
+
+        def _purge(conn):
+            cutoff = time.time() - self.ttl_sec
+            removed = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at <= ? "
+                "AND COALESCE(callback_status, '') != 'pending'",
+                (cutoff,),
+            ).rowcount
+            conn.execute("DELETE FROM job_inputs WHERE id NOT IN (SELECT id FROM jobs)")
+            return removed
+
+        return self._write(_purge)
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        counts = {row[0]: row[1] for row in conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+        oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE callback_status = 'pending'").fetchone()[0]
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_queued_sec": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+            "callbacks_pending": pending,
+            "max_queued": self.max_queued,
+            "max_attempts": self.max_attempts,
+        }
+
+
+def _public(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Job document returned by ``GET /jobs/{id}`` and POSTed to the callback URL."""
+    out = {
+        "id": row["id"],
+        "status": row["status"],
+        "filename": row["filename"],
+        "options": json.loads(row["options"]),
+        "attempts": row["attempts"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+        "queue_lag_sec": round(row["started_at"] - row["created_at"], 4) if row["started_at"] else None,
+        "error": row["error"],
+    }
+    if row["status"] == "done" and row["result"]:
+        out["result"] = json.loads(row["result"])
+    if row["callback_url"]:
+        out["callback"] = {
+            "url": row["callback_url"],
+            "status": row["callback_status"],
+            "attempts": row["callback_attempts"],
+            "error": row["callback_error"],
+            "delivered_at": row["delivered_at"],
+        }
+    return out
+
+
+def _post_json(url: str, body: bytes, headers: Dict[str, str], timeout: float) -> int:
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json", **headers}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+class JobRunner:
+    """Event-loop workers that claim jobs from a ``JobQueue`` and deliver their callbacks."""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Dict[str, Any], bytes], Awaitable[Dict[str, Any]]],
+        workers: int = 2,
+        poll_sec: float = 1.0,
+        retry_backoff_sec: float = 5.0,
+        callback_retries: int = 5,
+        callback_backoff_sec: float = 2.0,
+        callback_timeout_sec: float = 10.0,
+        callback_secret: Optional[str] = None,
+        callback_allow_private: bool = False,
+        callback_allowed_hosts: Optional[List[str]] = None,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.workers = max(0, workers)
+        self.poll_sec = poll_sec
+        self.retry_backoff_sec = retry_backoff_sec
+        self.callback_retries = max(1, callback_retries)
+        self.callback_backoff_sec = callback_backoff_sec
+        self.callback_timeout_sec = callback_timeout_sec
+        self.callback_secret = callback_secret
+        self.callback_allow_private = callback_allow_private
+        self.callback_allowed_hosts = callback_allowed_hosts
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._busy = 0
+        self._name = f"{os.getpid()}"
+
+    async def start(self):
+        if self._tasks or self.workers == 0:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(f"{self._name}-{i}")) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._deliver()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        """Nudge idle workers after a submit (otherwise they poll every ``poll_sec``)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._wake.wait(), self.poll_sec)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    async def _work(self, worker: str):
+        while True:
+            try:
+                await self._work_once(worker)
+            except Exception:
+                # A locked database or similar must not end the worker; the job's lease brings it back
+                log.exception("job worker %s failed, retrying in %ss", worker, self.poll_sec)
+                await asyncio.sleep(self.poll_sec)
+
+    async def _work_once(self, worker: str):
+        try:
+            claimed = await asyncio.to_thread(self.queue.claim, worker)
+        except sqlite3.Error:
+            await asyncio.sleep(self.poll_sec)
+            return
+        if claimed is None:
+            await self._idle()
+            return
+        job, data = claimed
+        if data is None:
+            await asyncio.to_thread(self.queue.fail, job, "upload missing from queue", False, 0)
+            return
+        self._busy += 1
+        start = time.perf_counter()
+        try:
+            result = await self.handler(job, data)
+        except JobDeferred as e:
+            await asyncio.to_thread(self.queue.defer, job, e.delay)
+        except asyncio.CancelledError:
+            raise  # lease expires and another worker (or this one after restart) picks it up
+        except JobError as e:
+            await asyncio.to_thread(self.queue.fail, job, str(e), e.retry, self.retry_backoff_sec)
+        except Exception as e:
+            await asyncio.to_thread(self.queue.fail, job, f"{type(e).__name__}: {e}", True, self.retry_backoff_sec)
+        else:
+            await asyncio.to_thread(self.queue.finish, job, result)
+        finally:
+            self._busy -= 1
+            _RUN_SECONDS.observe(time.perf_counter() - start)
+
+    def _send(self, row: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+        body = json.dumps(_public(row), default=str).encode()
+        headers = {"X-PneumonAI-Job": row["id"], "X-PneumonAI-Delivery": str(row["callback_attempts"] + 1)}
+        if self.callback_secret:
+            digest = hmac.new(self.callback_secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-PneumonAI-Signature"] = f"sha256={digest}"
+        try:
+            # Checked again at send time: the host may resolve differently than at submit
+            check_callback_url(row["callback_url"], self.callback_allow_private, self.callback_allowed_hosts)
+            status = _post_json(row["callback_url"], body, headers, self.callback_timeout_sec)
+        except Exception as e:  # refused, timed out, bad URL or a malformed response (http.client.HTTPException)
+            return False, f"{type(e).__name__}: {e}"
+        return (200 <= status < 300), (None if 200 <= status < 300 else f"HTTP {status}")
+
+    async def _deliver(self):
+        last_purge = 0.0
+        while True:
+            try:
+                if await self._deliver_once():
+                    continue
+                if time.time() - last_purge > _PURGE_EVERY_SEC:
+                    last_purge = time.time()
+                    await asyncio.to_thread(self.queue.purge)
+            except Exception:
+                log.exception("job callback delivery failed, retrying in %ss", self.poll_sec)
+            await asyncio.sleep(self.poll_sec)
+
+    async def _deliver_once(self) -> bool:
+        """Attempt every due callback once; False when none were due."""
+        try:
+            # Lease covers every POST of the round (they run concurrently) plus recording them
+            due = await asyncio.to_thread(self.queue.due_callbacks, 16, 2 * self.callback_timeout_sec + 30)
+        except sqlite3.Error:
+            due = []
+        if not due:
+            return False
+        sent = await asyncio.gather(*(asyncio.to_thread(self._send, row) for row in due))
+        for row, (ok, error) in zip(due, sent):
+            attempts = row["callback_attempts"] + 1
+            next_at = None
+            if not ok and attempts < self.callback_retries:
+                delay = min(_CALLBACK_MAX_BACKOFF_SEC, self.callback_backoff_sec * 2 ** (attempts - 1))
+                next_at = time.time() + delay * random.uniform(0.8, 1.2)
+            if await asyncio.to_thread(self.queue.callback_attempted, row["id"], row["callback_attempts"], ok, error, next_at):
+                _CALLBACKS.inc(event="delivered" if ok else ("retried" if next_at else "failed"))
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "busy": self._busy, **self.queue.stats()}
+
+
+def receive(port: int, fail_first: int, secret: Optional[str]) -> int:
+    """Local webhook receiver: prints each delivery; answers 500 to the first ``fail_first`` ones per job."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    seen: Dict[str, int] = {}
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            job_id = self.headers.get("X-PneumonAI-Job", "?")
+            seen[job_id] = seen.get(job_id, 0) + 1
+            verdict = ""
+            if secret:
+                expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+                verdict = " signature ok" if hmac.compare_digest(expected, self.headers.get("X-PneumonAI-Signature", "")) else " BAD SIGNATURE"
+            status = 500 if seen[job_id] <= fail_first else 200
+            try:
+                doc = json.loads(body)
+                summary = f"status={doc.get('status')} lag={doc.get('queue_lag_sec')}s"
+                prediction = (doc.get("result") or {}).get("prediction") or {}
+                if "Pneumonia" in prediction:
+                    summary += f" Pneumonia={prediction['Pneumonia']}"
+            except ValueError:
+                summary = f"{len(body)} bytes (not JSON)"
+            print(f"{time.strftime('%H:%M:%S')} job {job_id} delivery {self.headers.get('X-PneumonAI-Delivery')} "
+                  f"{summary}{verdict} -> {status}", flush=True)
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    print(f"Receiving job callbacks on http://localhost:{port}/ (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Prediction job utilities")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("receive", help="run a local webhook receiver that prints job callbacks")
+    r.add_argument("--port", type=int, default=9000)
+    r.add_argument("--fail-first", type=int, default=0, help="answer 500 to the first N deliveries per job (exercise retries)")
+    r.add_argument("--secret", default=os.getenv("JOB_CALLBACK_SECRET"), help="verify X-PneumonAI-Signature")
+    args = parser.parse_args(argv)
+    return receive(args.port, args.fail_first, args.secret)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
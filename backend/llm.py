@@ -1,18 +1,57 @@
 import os
-from typing import Dict, Any, List
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Iterator, AsyncIterator
+
+from cache import LRUTTLCache
+from metrics import histogram, observe_stage, stage
+from sessions import estimate_tokens
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if GEMINI_API_KEY and GEMINI_API_KEY.lower() in {"replace_me", "your_key_here", "changeme"}:
     GEMINI_API_KEY = ""
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()  # gemini | fake (offline stub for tests/benchmarks)
+FAKE_LLM_TOKEN_DELAY_MS = float(os.getenv("FAKE_LLM_TOKEN_DELAY_MS", "20"))
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))  # delay before the first token
+FAKE_LLM_FAIL_RATE = float(os.getenv("FAKE_LLM_FAIL_RATE", "0"))  # fraction of calls that raise
+
+# Async call limits: per-call deadline, global concurrency cap with a bounded queue wait,
+# and a circuit breaker that serves template reports while the provider is failing
+LLM_TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT_SEC = float(os.getenv("LLM_QUEUE_TIMEOUT_SEC", "10"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SEC = float(os.getenv("LLM_BREAKER_RESET_SEC", "30"))
 
 if not GEMINI_API_KEY:
     # Allow import without key for container build; runtime check will happen
     pass
 
+# Bump when _SYSTEM_PROMPT or the report guidance changes so cached reports are not reused
+PROMPT_VERSION = "report-v1"
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "1024"))  # 0 disables the shared report cache
+REPORT_CACHE_TTL_SEC = float(os.getenv("REPORT_CACHE_TTL_SEC", "86400"))
+# Probabilities in the same band share a report; 0.001 matches build_context()'s 3-decimal precision
+REPORT_PROB_BAND = float(os.getenv("REPORT_PROB_BAND", "0.001"))
+
+_report_cache = LRUTTLCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL_SEC)
+_CHAT_PROMPT_TOKENS = histogram(
+    "pneumonai_chat_prompt_tokens", "Estimated prompt tokens per chat turn (characters / 4)",
+    buckets=(128, 256, 512, 768, 1024, 1536, 2048, 4096, 8192),
+)
+_report_stats = {"hits": 0, "misses": 0, "saved_sec": 0.0, "llm_calls": 0, "llm_sec": 0.0}
+_report_stats_lock = threading.Lock()
+
 # Lazy import of langchain / gemini to avoid overhead if unused
 _llm = None
 _from_langchain = False
+_llm_lock = threading.Lock()
 
 # Central system prompt governing BOTH report generation and chat follow‑ups.
 # Emphasizes scope restriction, probability usage, disclaimers, style, and bilingual (English + brief Filipino) optional clarifications.
@@ -32,24 +71,396 @@ _SYSTEM_PROMPT = (
     "10. JSON generation phase (report) must output ONLY JSON when requested. Chat phase outputs plain text."
 )
 
+class _FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeLLM:
+    """Offline stand-in for Gemini: canned report JSON or chat text, emitted token by token.
+
+    ``FAKE_LLM_LATENCY_MS`` and ``FAKE_LLM_FAIL_RATE`` simulate a slow or failing provider.
+    """
+
+    _REPORT = (
+        '{"summary": "Model output reviewed for pneumonia triage.", '
+        '"pneumonia_assessment": "see model probability; stub response", '
+        '"differential": "", "next_steps": "Clinical correlation and physician review.", '
+        '"patient_friendly": "This is a test response. Please see a doctor for a real reading."}'
+    )
+    _CHAT = "This is a stubbed answer for offline testing. NOT A FINAL DIAGNOSIS. Consult a licensed physician."
+
+    def __init__(
+        self,
+        token_delay_ms: float = FAKE_LLM_TOKEN_DELAY_MS,
+        latency_ms: float = FAKE_LLM_LATENCY_MS,
+        fail_rate: float = FAKE_LLM_FAIL_RATE,
+    ):
+        self.token_delay = max(0.0, token_delay_ms) / 1000.0
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.fail_rate = fail_rate
+
+    def _reply(self, messages) -> str:
+        if isinstance(messages, str):
+            prompt = messages
+        else:
+            prompt = " ".join(getattr(m, "content", str(m)) for m in messages)
+        return self._CHAT if ("follow-up mode" in prompt or "--CHAT MODE--" in prompt) else self._REPORT
+
+    def _maybe_fail(self):
+        if self.fail_rate > 0 and random.random() < self.fail_rate:
+            raise RuntimeError("fake provider failure")
+
+    def stream(self, messages) -> Iterator[_FakeMessage]:
+        time.sleep(self.latency)
+        self._maybe_fail()
+        for token in re.findall(r"\S+\s*", self._reply(messages)):
+            time.sleep(self.token_delay)
+            yield _FakeMessage(token)
+
+    def invoke(self, messages) -> _FakeMessage:
+        return _FakeMessage("".join(chunk.content for chunk in self.stream(messages)))
+
+    async def astream(self, messages) -> AsyncIterator[_FakeMessage]:
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        for token in re.findall(r"\S+\s*", self._reply(messages)):
+            await asyncio.sleep(self.token_delay)
+            yield _FakeMessage(token)
+
+    async def ainvoke(self, messages) -> _FakeMessage:
+        return _FakeMessage("".join([chunk.content async for chunk in self.astream(messages)]))
+
+
+def _llm_available() -> bool:
+    return LLM_PROVIDER == "fake" or bool(GEMINI_API_KEY)
+
+
+def _unavailable_reason() -> str:
+    return "GEMINI_API_KEY not set"
+
+
 def _init_llm():
+    """Process-wide client; the Gemini client pools its HTTP/gRPC connections across calls."""
     global _llm, _from_langchain
-    if _llm is None:
-        try:
-            from langchain_google_genai import ChatGoogleGenerativeAI
-            # NOTE: We'll provide a SystemMessage at invocation time instead of stuffing here.
-            _llm = ChatGoogleGenerativeAI(
-                model=GEMINI_MODEL,
-                api_key=GEMINI_API_KEY,
-                temperature=0.2,
-                convert_system_message_to_human=True  # compatibility safeguard
-            )
-            _from_langchain = True
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize Gemini LLM: {e}")
+    if _llm is not None:
+        return _llm
+    with _llm_lock:
+        if _llm is None:
+            if LLM_PROVIDER == "fake":
+                _llm = FakeLLM()
+                return _llm
+            try:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                # NOTE: We'll provide a SystemMessage at invocation time instead of stuffing here.
+                _llm = ChatGoogleGenerativeAI(
+                    model=GEMINI_MODEL,
+                    api_key=GEMINI_API_KEY,
+                    temperature=0.2,
+                    timeout=LLM_TIMEOUT_SEC,
+                    max_retries=LLM_MAX_RETRIES,
+                    convert_system_message_to_human=True  # compatibility safeguard
+                )
+                _from_langchain = True
+            except Exception as e:
+                raise RuntimeError(f"Failed to initialize Gemini LLM: {e}")
     return _llm
 
 
+def _prompt(system: str, human: str, fallback: str):
+    """LangChain message list, or a single fallback string if message classes are unavailable."""
+    try:
+        from langchain_core.messages import SystemMessage, HumanMessage
+        return [SystemMessage(content=system), HumanMessage(content=human)]
+    except Exception:
+        return fallback
+
+
+def _invoke(llm, system: str, human: str, fallback: str) -> str:
+    prompt = _prompt(system, human, fallback)
+    try:
+        response = llm.invoke(prompt)
+    except Exception:
+        if isinstance(prompt, str):
+            raise
+        # Fallback: single string prompt
+        response = llm.invoke(fallback)
+    return getattr(response, 'content', str(response))
+
+
+async def _ainvoke(llm, system: str, human: str, fallback: str) -> str:
+    prompt = _prompt(system, human, fallback)
+    try:
+        response = await llm.ainvoke(prompt)
+    except Exception:
+        if isinstance(prompt, str):
+            raise
+        # Fallback: single string prompt
+        response = await llm.ainvoke(fallback)
+    return getattr(response, 'content', str(response))
+
+
+async def _astream(llm, system: str, human: str, fallback: str) -> AsyncIterator[str]:
+    prompt = _prompt(system, human, fallback)
+    async for chunk in llm.astream(prompt):
+        text = getattr(chunk, 'content', str(chunk))
+        if text:
+            yield text
+
+
+class LLMBusyError(RuntimeError):
+    """No LLM slot freed up within LLM_QUEUE_TIMEOUT_SEC."""
+
+
+class LLMCircuitOpenError(RuntimeError):
+    """The circuit breaker is open; the provider is not being called."""
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive errors or timeouts.
+
+    While open, calls fail fast. After ``reset_sec`` a single probe call is let
+    through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, failures: int, reset_sec: float):
+        self.failures = max(1, failures)
+        self.reset_sec = reset_sec
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._consecutive = 0
+        self._lock = threading.Lock()
+        self.counts = {"opens": 0, "short_circuited": 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self._opened_at >= self.reset_sec:
+                self.state = "half_open"
+                return True
+            self.counts["short_circuited"] += 1
+            return False
+
+    def still_allowed(self) -> bool:
+        """Re-check a call already let through by ``allow()`` (e.g. after queueing): False once the breaker opened."""
+        with self._lock:
+            if self.state == "open":
+                self.counts["short_circuited"] += 1
+                return False
+            return True
+
+    def settle(self, outcome):
+        """Record a call allowed by ``allow()``: True = success, an exception = failure, None = abandoned."""
+        with self._lock:
+            if outcome is True:
+                self.state = "closed"
+                self._consecutive = 0
+            elif outcome is None:
+                if self.state == "half_open":
+                    self.state = "open"  # probe never finished; let the next call probe again
+            else:
+                self._consecutive += 1
+                if self.state == "half_open" or self._consecutive >= self.failures:
+                    if self.state != "open":
+                        self.counts["opens"] += 1
+                    self.state = "open"
+                    self._opened_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._consecutive, **self.counts}
+
+
+class _ConcurrencyLimit:
+    """Global cap on in-flight async LLM calls; waiters queue for up to ``queue_timeout`` seconds."""
+
+    def __init__(self, limit: int, queue_timeout: float):
+        self.limit = max(1, limit)
+        self.queue_timeout = queue_timeout
+        self._sem: Optional[asyncio.Semaphore] = None  # created on first use, inside the server loop
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.rejected = 0
+
+    async def __aenter__(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise LLMBusyError(f"no LLM slot within {self.queue_timeout:g}s ({self.limit} in flight)")
+        finally:
+            self.waiting -= 1
+            observe_stage("llm_queue_wait", time.perf_counter() - start)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._sem.release()
+
+
+_breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SEC)
+_limit = _ConcurrencyLimit(LLM_MAX_CONCURRENCY, LLM_QUEUE_TIMEOUT_SEC)
+_call_stats = {"calls": 0, "timeouts": 0, "failures": 0, "fallbacks": 0}
+
+
+def _count_call(key: str):
+    with _report_stats_lock:
+        _call_stats[key] += 1
+
+
+def _note_failure(e: BaseException):
+    _count_call("timeouts" if isinstance(e, asyncio.TimeoutError) else "failures")
+
+
+async def _acall(kind: str, system: str, human: str, fallback: str) -> str:
+    """One async LLM call under the circuit breaker, concurrency cap and deadline.
+
+    The breaker is checked before queueing for a slot, so an open breaker fails fast
+    instead of holding callers in the queue for up to LLM_QUEUE_TIMEOUT_SEC.
+    """
+    if not _breaker.allow():
+        raise LLMCircuitOpenError("LLM circuit breaker open")
+    outcome = None  # stays None (abandoned) if no slot frees up or the breaker opened meanwhile
+    try:
+        async with _limit:
+            if not _breaker.still_allowed():
+                raise LLMCircuitOpenError("LLM circuit breaker open")
+            _count_call("calls")
+            try:
+                with stage("llm_" + kind):
+                    text = await asyncio.wait_for(_ainvoke(_init_llm(), system, human, fallback), LLM_TIMEOUT_SEC)
+                outcome = True
+                return text
+            except Exception as e:
+                outcome = e
+                _note_failure(e)
+                raise
+    finally:
+        _breaker.settle(outcome)
+
+
+async def _astream_guarded(kind: str, system: str, human: str, fallback: str) -> AsyncIterator[str]:
+    """Token stream under the breaker and concurrency cap; LLM_TIMEOUT_SEC bounds every wait for a chunk."""
+    if not _breaker.allow():
+        raise LLMCircuitOpenError("LLM circuit breaker open")
+    outcome = None
+    try:
+        async with _limit:
+            if not _breaker.still_allowed():
+                raise LLMCircuitOpenError("LLM circuit breaker open")
+            _count_call("calls")
+            chunks = _astream(_init_llm(), system, human, fallback)
+            start = time.perf_counter()
+            first = True
+            try:
+                while True:
+                    try:
+                        piece = await asyncio.wait_for(chunks.__anext__(), LLM_TIMEOUT_SEC)
+                    except StopAsyncIteration:
+                        break
+                    if first:
+                        observe_stage(f"llm_{kind}_ttft", time.perf_counter() - start)
+                        first = False
+                    yield piece
+                outcome = True
+                observe_stage(f"llm_{kind}_stream", time.perf_counter() - start)
+            except Exception as e:
+                outcome = e
+                _note_failure(e)
+                raise
+            finally:
+                await chunks.aclose()
+    finally:
+        _breaker.settle(outcome)
+
+
+def _call_sync(kind: str, fn):
+    """Blocking call for non-async callers: shares the breaker (not the async concurrency cap)."""
+    if not _breaker.allow():
+        raise LLMCircuitOpenError("LLM circuit breaker open")
+    _count_call("calls")
+    outcome = None
+    try:
+        with stage("llm_" + kind):
+            result = fn()
+        outcome = True
+        return result
+    except Exception as e:
+        outcome = e
+        _note_failure(e)
+        raise
+    finally:
+        _breaker.settle(outcome)
+
+
+def llm_stats() -> Dict[str, Any]:
+    with _report_stats_lock:
+        stats = dict(_call_stats)
+    stats.update({
+        "provider": LLM_PROVIDER,
+        "timeout_sec": LLM_TIMEOUT_SEC,
+        "max_concurrency": _limit.limit,
+        "in_flight": _limit.in_flight,
+        "waiting": _limit.waiting,
+        "peak_in_flight": _limit.peak_in_flight,
+        "rejected": _limit.rejected,
+        "breaker": _breaker.stats(),
+    })
+    return stats
+
+
+class _JSONObjectScanner:
+    """Finds the first complete top-level JSON object in text that arrives in pieces."""
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = None
+        self._in_str = False
+        self._escape = False
+        self.done = False
+
+    def feed(self, piece: str) -> Optional[Any]:
+        """Append ``piece``; returns the parsed object once its closing brace arrives."""
+        self.text += piece
+        if self.done:
+            return None
+        while self._pos < len(self.text):
+            ch = self.text[self._pos]
+            self._pos += 1
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"' and self._start is not None:
+                self._in_str = True
+            elif ch == "{":
+                if self._start is None:
+                    self._start = self._pos - 1
+                self._depth += 1
+            elif ch == "}" and self._start is not None:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+                    try:
+                        return json.loads(self.text[self._start:self._pos])
+                    except Exception:
+                        return None
+        return None
+
+
 def build_context(predictions: Dict[str, float]) -> str:
     # Expecting pneumonia-only dict but remain resilient
     if not predictions:
@@ -62,77 +473,270 @@ def build_context(predictions: Dict[str, float]) -> str:
     return f"Model probability: Pneumonia: {pneu_prob:.3f} (NOT diagnostic, single-label focus)."
 
 
-def generate_structured_report(predictions: Dict[str, float]) -> Dict[str, Any]:
-    """Return structured JSON triage interpretation using the LLM.
-
-    Falls back gracefully if no key available. The LLM is instructed via a system
-    prompt to stay constrained and output ONLY a JSON object.
-    """
-    context = build_context(predictions)
-    if not GEMINI_API_KEY:
-        return {"error": "GEMINI_API_KEY not set", "context": context}
-    llm = _init_llm()
+def report_cache_key(predictions: Dict[str, float]) -> str:
+    """Model + prompt version + rounded-probability band: reports with equal keys are interchangeable."""
     pneu_prob = predictions.get("Pneumonia") if predictions else None
-    guidance = (
+    band = "none" if pneu_prob is None else str(int(round(float(pneu_prob) / REPORT_PROB_BAND)))
+    return f"{GEMINI_MODEL}|{PROMPT_VERSION}|{REPORT_PROB_BAND}|{band}"
+
+
+def _count_hit(report: Dict[str, Any]):
+    with _report_stats_lock:
+        _report_stats["hits"] += 1
+        _report_stats["saved_sec"] += (report.get("cache") or {}).get("latency_sec", 0.0)
+
+
+def report_cache_stats() -> Dict[str, Any]:
+    with _report_stats_lock:
+        stats = dict(_report_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["saved_sec"] = round(stats["saved_sec"], 3)
+    stats["llm_sec"] = round(stats["llm_sec"], 3)
+    stats["entries"] = len(_report_cache)
+    return stats
+
+
+def _report_guidance(context: str) -> str:
+    return (
         f"{context}\n\n"
         "Produce a concise triage JSON with keys: summary, pneumonia_assessment, differential, next_steps, patient_friendly. Rules: summary: 1 sentence. "
         "pneumonia_assessment: one of low (<0.2), uncertain (0.2-<0.4), moderate (0.4-<0.6), high (>=0.6) plus brief justification. "
         "differential: only if probability <0.6 (1-2 benign alternatives or empty string). next_steps: brief actions (clinical correlation, follow-up). "
         "patient_friendly: <=40 words, reassuring, plain language. Output ONLY JSON."
     )
-    try:
-        try:
-            from langchain_core.messages import SystemMessage, HumanMessage
-            messages = [
-                SystemMessage(content=_SYSTEM_PROMPT + " You are generating a structured triage JSON report. Output ONLY JSON object."),
-                HumanMessage(content=guidance)
-            ]
-            response = llm.invoke(messages)
-        except Exception:
-            # Fallback: concatenate system + human if message classes unavailable
-            combined = _SYSTEM_PROMPT + "\n---\n" + guidance
-            response = llm.invoke(combined)
-        text = getattr(response, 'content', str(response))
-    except Exception as e:
-        return {"error": f"LLM invocation failed: {e}", "context": context}
 
+
+def _report_prompt(context: str):
+    guidance = _report_guidance(context)
+    system = _SYSTEM_PROMPT + " You are generating a structured triage JSON report. Output ONLY JSON object."
+    # Fallback: concatenate system + human if message classes unavailable
+    combined = _SYSTEM_PROMPT + "\n---\n" + guidance
+    return system, guidance, combined
+
+
+def _cached_report(predictions: Dict[str, float], prior: Optional[Dict[str, Any]], context: str, key: str) -> Optional[Dict[str, Any]]:
+    if prior and (prior.get("cache") or {}).get("key") == key and not prior.get("error"):
+        _count_hit(prior)
+        return prior
+    cached = _report_cache.get(key) if REPORT_CACHE_SIZE > 0 else None
+    if cached is not None:
+        _count_hit(cached)
+        # Same band, possibly a slightly different probability: keep this prediction's context line
+        return {**cached, "context": context}
+    with _report_stats_lock:
+        _report_stats["misses"] += 1
+    return None
+
+
+def _finish_report(text: str, context: str, key: str, latency: float, parsed: Any = None) -> Dict[str, Any]:
+    with _report_stats_lock:
+        _report_stats["llm_calls"] += 1
+        _report_stats["llm_sec"] += latency
     # Attempt to extract JSON
-    import json, re
-    json_text = None
-    # naive first brace extraction
-    match = re.search(r'\{.*\}', text, re.DOTALL)
-    if match:
-        snippet = match.group(0)
-        try:
-            json_text = json.loads(snippet)
-        except Exception:
-            json_text = None
+    json_text = parsed
+    if json_text is None:
+        # naive first brace extraction
+        match = re.search(r'\{.*\}', text, re.DOTALL)
+        if match:
+            snippet = match.group(0)
+            try:
+                json_text = json.loads(snippet)
+            except Exception:
+                json_text = None
     result = {
         "raw": text,
         "parsed": json_text,
         "context": context,
-        "disclaimer": "Model + LLM output not a medical diagnosis. Seek licensed physician confirmation."
+        "disclaimer": "Model + LLM output not a medical diagnosis. Seek licensed physician confirmation.",
+        "cache": {"key": key, "latency_sec": round(latency, 3), "generated_at": time.time()}
     }
+    if REPORT_CACHE_SIZE > 0:
+        _report_cache.put(key, result)
     return result
 
 
-def chat_followup(
+# Same bands as the report guidance: low (<0.2), uncertain (0.2-<0.4), moderate (0.4-<0.6), high (>=0.6)
+_TEMPLATE_BANDS = (
+    (0.2, "low", "The model output suggests a low likelihood of pneumonia.", "Normal study or minor artifact.",
+     "Clinical correlation; routine follow-up if symptoms persist.",
+     "The scan shows a low chance of pneumonia (pulmonya). A doctor should still review it together with your symptoms."),
+    (0.4, "uncertain", "The model output is uncertain for pneumonia.", "Atelectasis or imaging artifact.",
+     "Clinical correlation; consider repeat imaging if symptoms persist.",
+     "The result is unclear. A doctor should look at the X-ray and your symptoms to decide next steps."),
+    (0.6, "moderate", "The model output suggests a moderate likelihood of pneumonia.", "Atelectasis.",
+     "Prompt physician review and clinical correlation.",
+     "There are some signs that could mean pneumonia (pulmonya). Please have a doctor review the X-ray soon."),
+    (None, "high", "The model output suggests a high likelihood of pneumonia.", "",
+     "Urgent physician review and clinical correlation.",
+     "The scan shows signs often seen with pneumonia (pulmonya). Please see a doctor as soon as possible."),
+)
+
+
+def pneumonia_band(prob: Optional[float]) -> Optional[str]:
+    if prob is None:
+        return None
+    for upper, band, *_ in _TEMPLATE_BANDS:
+        if upper is None or prob < upper:
+            return band
+    return None
+
+
+def template_report(predictions: Dict[str, float], reason: str) -> Dict[str, Any]:
+    """Deterministic report from the probability band, served when the LLM is slow or failing."""
+    context = build_context(predictions)
+    prob = predictions.get("Pneumonia") if predictions else None
+    band = pneumonia_band(prob)
+    if band is None:
+        parsed = {
+            "summary": "No pneumonia probability is available.",
+            "pneumonia_assessment": "unavailable",
+            "differential": "",
+            "next_steps": "Physician review of the image.",
+            "patient_friendly": "We could not estimate pneumonia from this image. Please have a doctor review it.",
+        }
+    else:
+        _, _, summary, differential, next_steps, friendly = next(b for b in _TEMPLATE_BANDS if b[1] == band)
+        parsed = {
+            "summary": summary,
+            "pneumonia_assessment": f"{band}: model-estimated probability {prob:.3f}",
+            "differential": differential,
+            "next_steps": next_steps,
+            "patient_friendly": friendly,
+        }
+    _count_call("fallbacks")
+    return {
+        "raw": json.dumps(parsed),
+        "parsed": parsed,
+        "context": context,
+        "disclaimer": "Model + LLM output not a medical diagnosis. Seek licensed physician confirmation.",
+        "fallback": {"reason": reason, "band": band},
+    }
+
+
+def template_chat_answer(pneumonia_prob: Optional[float], reason: str) -> str:
+    _count_call("fallbacks")
+    if isinstance(pneumonia_prob, (int, float)):
+        prob = (
+            f"Model-estimated pneumonia probability: {pneumonia_prob:.4f} (not a diagnosis), "
+            f"in the {pneumonia_band(pneumonia_prob)} band. "
+        )
+    else:
+        prob = "Model-estimated pneumonia probability: unavailable. "
+    return (
+        f"The assistant is temporarily unavailable ({reason}). " + prob +
+        "NOT A FINAL DIAGNOSIS. Consult a licensed physician."
+    )
+
+
+def _fallback_reason(e: Exception) -> str:
+    if isinstance(e, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(e, LLMBusyError):
+        return "busy"
+    if isinstance(e, LLMCircuitOpenError):
+        return "circuit_open"
+    return f"error: {e}"
+
+
+def generate_structured_report(predictions: Dict[str, float], prior: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Return structured JSON triage interpretation using the LLM.
+
+    Falls back gracefully if no key available. The LLM is instructed via a system
+    prompt to stay constrained and output ONLY a JSON object. ``prior`` is the report
+    already stored with the prediction; it is reused when its cache key still matches,
+    otherwise reports are shared across predictions in the same probability band.
+    Blocking; request handlers use ``agenerate_structured_report``.
+    """
+    context = build_context(predictions)
+    if not _llm_available():
+        return {"error": _unavailable_reason(), "context": context}
+    key = report_cache_key(predictions)
+    cached = _cached_report(predictions, prior, context, key)
+    if cached is not None:
+        return cached
+    start = time.time()
+    try:
+        text = _call_sync("report", lambda: _invoke(_init_llm(), *_report_prompt(context)))
+    except Exception as e:
+        return template_report(predictions, _fallback_reason(e))
+    return _finish_report(text, context, key, time.time() - start)
+
+
+async def agenerate_structured_report(predictions: Dict[str, float], prior: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Async ``generate_structured_report``: never blocks the event loop.
+
+    Bounded by LLM_TIMEOUT_SEC and the LLM_MAX_CONCURRENCY cap; on timeout, a full
+    queue, provider errors or an open breaker it returns ``template_report`` (marked
+    with ``fallback``; never cached).
+    """
+    context = build_context(predictions)
+    if not _llm_available():
+        return {"error": _unavailable_reason(), "context": context}
+    key = report_cache_key(predictions)
+    cached = _cached_report(predictions, prior, context, key)
+    if cached is not None:
+        return cached
+    start = time.time()
+    try:
+        text = await _acall("report", *_report_prompt(context))
+    except Exception as e:
+        return template_report(predictions, _fallback_reason(e))
+    return _finish_report(text, context, key, time.time() - start)
+
+
+async def astream_structured_report(predictions: Dict[str, float], prior: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming variant of ``agenerate_structured_report`` yielding ``{"event", "data"}`` dicts.
+
+    Events: ``token`` (text as it arrives), ``parsed`` (as soon as the JSON object
+    closes), ``report`` (final report object), ``error``, and ``done`` with
+    time-to-first-token and total time. If the provider fails, the final ``report``
+    is the template report and replaces any partial tokens.
+    """
+    start = time.time()
+    context = build_context(predictions)
+    if not _llm_available():
+        yield {"event": "error", "data": {"error": _unavailable_reason(), "context": context}}
+        return
+    key = report_cache_key(predictions)
+    cached = _cached_report(predictions, prior, context, key)
+    if cached is not None:
+        yield {"event": "report", "data": cached}
+        yield {"event": "done", "data": {"cached": True, "ttft_sec": 0.0, "total_sec": round(time.time() - start, 4)}}
+        return
+    scanner = _JSONObjectScanner()
+    parsed = None
+    ttft = None
+    try:
+        async for piece in _astream_guarded("report", *_report_prompt(context)):
+            if ttft is None:
+                ttft = time.time() - start
+            yield {"event": "token", "data": {"text": piece}}
+            obj = scanner.feed(piece)
+            if obj is not None:
+                parsed = obj
+                yield {"event": "parsed", "data": parsed}
+    except Exception as e:
+        total = time.time() - start
+        yield {"event": "report", "data": template_report(predictions, _fallback_reason(e))}
+        yield {"event": "done", "data": {"cached": False, "fallback": True, "ttft_sec": round(ttft or total, 4), "total_sec": round(total, 4)}}
+        return
+    total = time.time() - start
+    yield {"event": "report", "data": _finish_report(scanner.text, context, key, total, parsed)}
+    yield {"event": "done", "data": {"cached": False, "ttft_sec": round(ttft or total, 4), "total_sec": round(total, 4)}}
+
+
+def _chat_prompt(
     user_query: str,
     last_report: Dict[str, Any],
     pneumonia_prob: float = None,
     masks: Dict[str, Any] = None,
     threshold: float = None,
     meets_threshold: bool = None,
-) -> str:
-    """Conversational follow-up constrained to pneumonia triage.
-
-    Provides probability directly if asked (and available) while preserving guardrails.
-    """
-    if not GEMINI_API_KEY:
-        return "LLM unavailable: missing GEMINI_API_KEY"
-    llm = _init_llm()
-    # Extract parsed JSON summary if present
-    report_summary = last_report.get("parsed", {}) if last_report else {}
+    history: str = "",
+):
+    # Extract parsed JSON summary if present (compact JSON: sent on every turn)
+    report_summary = json.dumps(last_report.get("parsed", {}) if last_report else {}, separators=(",", ":"), ensure_ascii=False, default=str)
     prob_fragment = (
         f"Model pneumonia probability: {pneumonia_prob:.4f}. " if isinstance(pneumonia_prob, (int, float)) else "Model pneumonia probability: unavailable. "
     )
@@ -167,20 +771,84 @@ def chat_followup(
     guardrail_addendum = (
         "Refuse unrelated topics (non-imaging, prescriptions, politics). Do not fabricate data."
     )
+    system = _SYSTEM_PROMPT + " You are in chat / follow-up mode. " + guardrail_addendum
+    human = f"Context JSON: {report_summary}\n{history}{chat_instruction}"
+    # Fallback single string prompt
+    fallback_prompt = (
+        _SYSTEM_PROMPT + "\n--CHAT MODE--\nContext JSON: " + report_summary + "\n" + history + chat_instruction + "\n" + guardrail_addendum
+    )
+    _CHAT_PROMPT_TOKENS.observe(estimate_tokens(system) + estimate_tokens(human), history="true" if history else "false")
+    return system, human, fallback_prompt
+
+
+def chat_followup(
+    user_query: str,
+    last_report: Dict[str, Any],
+    pneumonia_prob: float = None,
+    masks: Dict[str, Any] = None,
+    threshold: float = None,
+    meets_threshold: bool = None,
+    history: str = "",
+) -> str:
+    """Conversational follow-up constrained to pneumonia triage.
+
+    Provides probability directly if asked (and available) while preserving guardrails.
+    ``history`` is the session transcript (``sessions.ChatSessions.history``), inserted before the new question.
+    Blocking; request handlers use ``achat_followup``.
+    """
+    if not _llm_available():
+        return "LLM unavailable: missing GEMINI_API_KEY"
+    prompt = _chat_prompt(user_query, last_report, pneumonia_prob, masks, threshold, meets_threshold, history)
     try:
-        try:
-            from langchain_core.messages import SystemMessage, HumanMessage
-            messages = [
-                SystemMessage(content=_SYSTEM_PROMPT + " You are in chat / follow-up mode. " + guardrail_addendum),
-                HumanMessage(content=f"Context JSON: {report_summary}\n{chat_instruction}")
-            ]
-            response = llm.invoke(messages)
-        except Exception:
-            # Fallback single string prompt
-            fallback_prompt = (
-                _SYSTEM_PROMPT + "\n--CHAT MODE--\nContext JSON: " + str(report_summary) + "\n" + chat_instruction + "\n" + guardrail_addendum
-            )
-            response = llm.invoke(fallback_prompt)
-        return getattr(response, 'content', str(response))
+        return _call_sync("chat", lambda: _invoke(_init_llm(), *prompt))
+    except Exception as e:
+        return template_chat_answer(pneumonia_prob, _fallback_reason(e))
+
+
+async def achat_followup(
+    user_query: str,
+    last_report: Dict[str, Any],
+    pneumonia_prob: float = None,
+    masks: Dict[str, Any] = None,
+    threshold: float = None,
+    meets_threshold: bool = None,
+    history: str = "",
+) -> str:
+    """Async ``chat_followup`` with the same deadline, concurrency cap and template fallback as reports."""
+    if not _llm_available():
+        return "LLM unavailable: missing GEMINI_API_KEY"
+    try:
+        return await _acall("chat", *_chat_prompt(user_query, last_report, pneumonia_prob, masks, threshold, meets_threshold, history))
+    except Exception as e:
+        return template_chat_answer(pneumonia_prob, _fallback_reason(e))
+
+
+async def astream_chat_followup(
+    user_query: str,
+    last_report: Dict[str, Any],
+    pneumonia_prob: float = None,
+    masks: Dict[str, Any] = None,
+    threshold: float = None,
+    meets_threshold: bool = None,
+    history: str = "",
+) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming variant of ``achat_followup``: ``token`` events, then ``done`` with the answer and timings."""
+    start = time.time()
+    if not _llm_available():
+        yield {"event": "error", "data": {"error": "LLM unavailable: missing GEMINI_API_KEY"}}
+        return
+    ttft = None
+    parts: List[str] = []
+    fallback = False
+    try:
+        async for piece in _astream_guarded("chat", *_chat_prompt(user_query, last_report, pneumonia_prob, masks, threshold, meets_threshold, history)):
+            if ttft is None:
+                ttft = time.time() - start
+            parts.append(piece)
+            yield {"event": "token", "data": {"text": piece}}
     except Exception as e:
-        return f"LLM error: {e}"
+        # Replace any partial answer with the template
+        parts = [template_chat_answer(pneumonia_prob, _fallback_reason(e))]
+        fallback = True
+    total = time.time() - start
+    yield {"event": "done", "data": {"answer": "".join(parts), "fallback": fallback, "ttft_sec": round(ttft or total, 4), "total_sec": round(total, 4)}}
@@ -0,0 +1,183 @@
+"""In-process metrics with Prometheus text exposition.
+
+- ``stage(name)`` times a block into the ``pneumonai_stage_seconds`` histogram
+  and into the current request's breakdown (returned as a ``Server-Timing``
+  header when enabled)
+- ``Counter`` / ``Histogram`` for anything else; ``register_collector`` adds
+  gauges read at scrape time (queue depths, cache hit rates, ...)
+- ``render()`` produces the ``/metrics`` payload (text format 0.0.4)
+
+Everything is thread-safe; stages may run on the event loop, in the threadpool
+or on the batcher worker.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Per-request stage totals {stage: seconds}; the dict is shared with threadpool work via context copies
+_breakdown: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_breakdown", default=None)
+
+
+def _key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _fmt_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}  # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = []
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, (('le', _fmt_value(bound)),))} {_fmt_value(count)}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(key, (('le', '+Inf'),))} {_fmt_value(series[-1])}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(series[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {_fmt_value(series[-1])}")
+        return lines
+
+
+# (name, type, help, labels, value) tuples produced at scrape time
+GaugeSample = Tuple[str, str, str, Dict[str, str], float]
+
+_metrics: Dict[str, object] = {}
+_collectors: List[Callable[[], Iterable[GaugeSample]]] = []
+_registry_lock = threading.Lock()
+
+
+def counter(name: str, help: str) -> Counter:
+    with _registry_lock:
+        return _metrics.setdefault(name, Counter(name, help))
+
+
+def histogram(name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    with _registry_lock:
+        return _metrics.setdefault(name, Histogram(name, help, buckets))
+
+
+def register_collector(fn: Callable[[], Iterable[GaugeSample]]):
+    """``fn`` is called on every scrape and yields ``(name, type, help, labels, value)``."""
+    with _registry_lock:
+        _collectors.append(fn)
+
+
+STAGE_SECONDS = histogram("pneumonai_stage_seconds", "Latency of each processing stage")
+
+
+def observe_stage(name: str, seconds: float):
+    """Record an already-measured stage duration."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    current = _breakdown.get()
+    if current is not None:
+        current[name] = current.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def begin_request() -> contextvars.Token:
+    return _breakdown.set({})
+
+
+def end_request(token: contextvars.Token) -> Dict[str, float]:
+    breakdown = _breakdown.get() or {}
+    _breakdown.reset(token)
+    return breakdown
+
+
+def server_timing(breakdown: Dict[str, float]) -> str:
+    """``Server-Timing`` header value (durations in milliseconds)."""
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in breakdown.items())
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_metrics.values())
+        collectors = list(_collectors)
+    lines: List[str] = []
+    for m in metrics:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.type}")
+        lines.extend(m.samples())
+    families: Dict[str, Tuple[str, str, List[str]]] = {}
+    for collect in collectors:
+        try:
+            samples = list(collect())
+        except Exception:
+            continue
+        for name, kind, help, labels, value in samples:
+            if value is None:
+                continue
+            family = families.setdefault(name, (kind, help, []))
+            family[2].append(f"{name}{_fmt_labels(_key(labels))} {_fmt_value(value)}")
+    for name, (kind, help, samples) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,117 @@
+"""Image decoding and preprocessing shared by the API and offline tools.
+
+Two paths produce the (1, 224, 224) xrv input:
+
+- ``reference``: full-resolution ``skimage.io.imread`` + ``XRayCenterCrop`` +
+  ``XRayResizer(224)`` (the original pipeline)
+- ``fast`` (default): Pillow decode that lets JPEGs load at a reduced DCT scale
+  (``draft``), crops to the center square, box-reduces to a small working size
+  while still 8-bit, and only then converts to float32 for the same final
+  ``XRayResizer``. Matches ``reference`` within interpolation tolerance (see
+  ``benchmarks/bench_preprocess.py``).
+"""
+import io
+import math
+import os
+
+import numpy as np
+import skimage.io
+import torch
+import torchvision
+import torchxrayvision as xrv
+
+PREPROCESS_MODE = os.getenv("PREPROCESS_MODE", "fast").lower()  # fast | reference
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(64_000_000)))  # decompression-bomb guard (fast path)
+
+# Reduced decodes keep at least this many pixels on the short side before the final resize;
+# larger values track the reference path more closely at some CPU cost
+_WORK_SIZE = int(os.getenv("PREPROCESS_WORK_SIZE", str(2 * 224)))
+# Modes the fast path handles; anything else (16-bit, 1-bit, CMYK...) goes through the reference path
+_FAST_MODES = {"L", "LA", "RGB", "RGBA", "P"}
+
+# Preprocessing transforms
+_transform = torchvision.transforms.Compose([
+    xrv.datasets.XRayCenterCrop(),
+    xrv.datasets.XRayResizer(224)
+])
+
+
+class ImageDecodeError(ValueError):
+    """The upload could not be decoded into a single-channel X-ray."""
+
+
+def prepare_image_reference(file_bytes: bytes) -> torch.Tensor:
+    """Full-resolution decode: skimage imread, normalize, center crop, resize."""
+    try:
+        # Read image from bytes
+        img = skimage.io.imread(io.BytesIO(file_bytes))
+    except Exception as e:
+        raise ImageDecodeError(f"Failed to read image: {e}")
+
+    img = xrv.datasets.normalize(img, 255)
+    # Channel handling
+    if img.ndim == 3:
+        if img.shape[2] > 1:
+            img = img.mean(2)
+        else:
+            img = img[:, :, 0]
+    elif img.ndim != 2:
+        raise ImageDecodeError(f"Unexpected image shape {img.shape}")
+
+    img = img[None, ...]  # (1, H, W)
+    img = _transform(img)
+    tensor = torch.from_numpy(img).float()  # (1, H, W)
+    return tensor
+
+
+def _reduced_square(img):
+    """Center square of ``img`` (``XRayCenterCrop`` offsets), box-reduced toward ``_WORK_SIZE``."""
+    w, h = img.size
+    side = min(w, h)
+    left, top = w // 2 - side // 2, h // 2 - side // 2
+    img = img.crop((left, top, left + side, top + side))
+    factor = side // _WORK_SIZE
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+
+def prepare_image_fast(file_bytes: bytes) -> torch.Tensor:
+    """Reduced-resolution decode; 8-bit until the final float32 resize."""
+    from PIL import Image
+    try:
+        img = Image.open(io.BytesIO(file_bytes))
+        w, h = img.size
+        if w * h > MAX_IMAGE_PIXELS:
+            raise ImageDecodeError(f"Image too large ({w}x{h} pixels)")
+        if img.mode not in _FAST_MODES:
+            return prepare_image_reference(file_bytes)
+        if img.format == "JPEG" and min(w, h) > _WORK_SIZE:
+            # DCT-domain downscale (1/2, 1/4, 1/8) to the smallest size still >= the request
+            scale = _WORK_SIZE / min(w, h)
+            img.draft(img.mode, (math.ceil(w * scale), math.ceil(h * scale)))
+        img.load()
+    except ImageDecodeError:
+        raise
+    except Exception as e:
+        raise ImageDecodeError(f"Failed to read image: {e}")
+
+    if img.mode == "P":
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    arr = np.asarray(_reduced_square(img))
+    # Same channel handling as the reference path (plain mean over all channels)
+    if arr.ndim == 3:
+        arr = arr.mean(2, dtype=np.float32) if arr.shape[2] > 1 else arr[:, :, 0].astype(np.float32)
+    else:
+        arr = arr.astype(np.float32)
+    # xrv.datasets.normalize(img, 255) in float32: [0, 255] -> [-1024, 1024]
+    arr = arr * np.float32(2048.0 / 255.0) - np.float32(1024.0)
+    img = _transform(arr[None, ...])
+    return torch.from_numpy(img).float()
+
+
+def prepare_image(file_bytes: bytes, mode: str = None) -> torch.Tensor:
+    """Decode image bytes into the (1, 224, 224) float tensor the xrv models expect."""
+    if (mode or PREPROCESS_MODE) == "reference":
+        return prepare_image_reference(file_bytes)
+    return prepare_image_fast(file_bytes)
@@ -0,0 +1,169 @@
+"""Precomputed RSNA Lung Opacity mask index.
+
+The RSNA pneumonia labels are bounding boxes on 1024x1024 films, so the index
+only needs ``patientId -> boxes``. It is stored as plain ``.npy`` arrays that are
+memory-mapped at startup (no dataset scan, no per-request sample loading):
+
+- ``keys.npy``     sorted lowercase file stems (fixed-width bytes)
+- ``offsets.npy``  int64, boxes for ``keys[i]`` are ``boxes[offsets[i]:offsets[i+1]]``
+- ``boxes.npy``    int16 (N, 4) ``x, y, width, height`` in source pixels
+- ``meta.json``    ``{"base_size": 1024, ...}``
+
+Build it once offline::
+
+    python rsna_index.py build --csv stage_2_train_labels.csv --out rsna_index/
+    python rsna_index.py build --dataset /data/rsna --out rsna_index/   # via torchxrayvision
+
+and point ``RSNA_INDEX_PATH`` at the output directory.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from cache import LRUTTLCache
+
+KEY_WIDTH = 64
+BASE_SIZE = 1024
+
+
+def normalize_key(filename: str) -> str:
+    """Uploads are matched by file stem, so ``ID.dcm``, ``ID.jpg`` and ``ID.png`` all hit."""
+    return os.path.splitext(os.path.basename(filename or ""))[0].lower()
+
+
+class RSNAMaskIndex:
+    def __init__(self, path: str, cache_size: int = 256):
+        self.path = path
+        self.keys = np.load(os.path.join(path, "keys.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.boxes_arr = np.load(os.path.join(path, "boxes.npy"), mmap_mode="r")
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.base_size = int(self.meta.get("base_size", BASE_SIZE))
+        self._png_cache = LRUTTLCache(cache_size)
+        self.png_hits = 0
+        self.png_misses = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def boxes(self, filename: str) -> Optional[np.ndarray]:
+        key = normalize_key(filename).encode("utf-8")
+        if not key or len(key) > KEY_WIDTH:
+            return None
+        i = int(np.searchsorted(self.keys, key))
+        if i >= len(self.keys) or self.keys[i] != key:
+            return None
+        return np.asarray(self.boxes_arr[self.offsets[i]:self.offsets[i + 1]])
+
+    def render(self, boxes: np.ndarray) -> np.ndarray:
+        mask = np.zeros((self.base_size, self.base_size), dtype=np.uint8)
+        for x, y, w, h in boxes:
+            mask[max(y, 0):y + h, max(x, 0):x + w] = 255
+        return mask
+
+    def mask_png(self, filename: str) -> Optional[bytes]:
+        """PNG bytes of the union of opacity boxes for ``filename`` (LRU-cached)."""
+        key = normalize_key(filename)
+        png = self._png_cache.get(key)
+        if png is not None:
+            self.png_hits += 1
+            return png
+        boxes = self.boxes(filename)
+        if boxes is None or len(boxes) == 0:
+            return None
+        self.png_misses += 1
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.fromarray(self.render(boxes), mode="L").save(buf, format="PNG")
+        png = buf.getvalue()
+        self._png_cache.put(key, png)
+        return png
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self), "png_cache": len(self._png_cache), "png_hits": self.png_hits, "png_misses": self.png_misses}
+
+
+def _rows_from_csv(path: str):
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def _rows_from_dataset(imgpath: str):
+    import torchxrayvision as xrv
+    ds = xrv.datasets.RSNA_Pneumonia_Dataset(
+        imgpath=imgpath,
+        views=["PA", "AP", "AP Supine", "AP Erect"],
+        pathology_masks=True
+    )
+    for row in ds.raw_csv.to_dict("records"):
+        yield row
+
+
+def build_index(rows, out: str) -> Dict[str, int]:
+    """Write the index arrays for every positive (Target == 1) box in ``rows``."""
+    grouped: Dict[bytes, List[List[int]]] = {}
+    for row in rows:
+        try:
+            if int(float(row.get("Target", 0) or 0)) != 1:
+                continue
+            box = [int(float(row[k])) for k in ("x", "y", "width", "height")]
+        except (KeyError, TypeError, ValueError):
+            continue
+        key = normalize_key(str(row["patientId"])).encode("utf-8")
+        if key and len(key) <= KEY_WIDTH:
+            grouped.setdefault(key, []).append(box)
+    keys = sorted(grouped)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    boxes: List[List[int]] = []
+    for i, key in enumerate(keys):
+        boxes.extend(grouped[key])
+        offsets[i + 1] = len(boxes)
+    os.makedirs(out, exist_ok=True)
+    np.save(os.path.join(out, "keys.npy"), np.array(keys, dtype=f"S{KEY_WIDTH}"))
+    np.save(os.path.join(out, "offsets.npy"), offsets)
+    np.save(os.path.join(out, "boxes.npy"), np.array(boxes, dtype=np.int16).reshape(-1, 4))
+    meta = {"base_size": BASE_SIZE, "images": len(keys), "boxes": len(boxes), "built_at": time.time()}
+    with open(os.path.join(out, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="RSNA Lung Opacity mask index")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="precompute the on-disk index")
+    src = b.add_mutually_exclusive_group(required=True)
+    src.add_argument("--csv", help="stage_2_train_labels.csv (patientId,x,y,width,height,Target)")
+    src.add_argument("--dataset", help="RSNA image directory, labels read through torchxrayvision")
+    b.add_argument("--out", required=True)
+    q = sub.add_parser("lookup", help="print boxes for a filename")
+    q.add_argument("--index", required=True)
+    q.add_argument("filename")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        start = time.time()
+        rows = _rows_from_csv(args.csv) if args.csv else _rows_from_dataset(args.dataset)
+        meta = build_index(rows, args.out)
+        print(f"Indexed {meta['images']} images / {meta['boxes']} boxes into {args.out} in {time.time() - start:.1f}s")
+        return 0
+    index = RSNAMaskIndex(args.index)
+    boxes = index.boxes(args.filename)
+    if boxes is None:
+        print("no match")
+        return 1
+    print(json.dumps(boxes.tolist()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Multi-process server: load the model once, then fork uvicorn workers that share it.
+
+``uvicorn --workers`` spawns fresh interpreters, so every worker would load its
+own DenseNet and keep its own prediction state. Here the parent binds the
+socket and loads the model into shared memory (or maps the artifact baked by
+``python engines.py bake``, whose pages are shared already) and builds the
+configured inference engine (``engines.prepare_engine``), then forks
+``SERVE_WORKERS`` workers. The workers inherit the weights without copying them, accept on the
+same socket, and each runs ``SERVE_TORCH_THREADS`` intra-op threads, so the
+workers together do not oversubscribe the CPUs. With more than one worker,
+predictions (including stored reports and saliency results) go to the shared
+SQLite store (``PREDICTION_STORE=sqlite``). Workers that die are restarted::
+
+    python serve.py                                   # one worker per 2 available CPUs
+    SERVE_WORKERS=4 SERVE_TORCH_THREADS=2 python serve.py
+
+CPU only: a CUDA context cannot be shared across fork, so GPU hosts should run
+a single worker (``SERVE_WORKERS=1``, which is plain uvicorn).
+"""
+import os
+import signal
+import sys
+import time
+from typing import Dict
+
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", os.getenv("PORT", "8000")))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))  # 0 = available CPUs // 2
+SERVE_TORCH_THREADS = int(os.getenv("SERVE_TORCH_THREADS", "0"))  # intra-op threads per worker; 0 = CPUs // workers
+SERVE_INTEROP_THREADS = int(os.getenv("SERVE_INTEROP_THREADS", "1"))
+SERVE_LOG_LEVEL = os.getenv("SERVE_LOG_LEVEL", "info")
+_RESTART_BACKOFF_SEC = 1.0  # delay before restarting a worker that died right after starting
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: affinity mask, capped by a cgroup v2 quota (containers)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def plan(cpus: int, workers: int = SERVE_WORKERS, threads: int = SERVE_TORCH_THREADS):
+    """``(workers, intra-op threads per worker)`` for ``cpus`` CPUs."""
+    workers = workers if workers > 0 else max(1, cpus // 2)
+    threads = threads if threads > 0 else max(1, cpus // workers)
+    return workers, threads
+
+
+def _configure_env(workers: int, threads: int):
+    # OpenMP/MKL read these when torch is first imported; must be set before that
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, str(threads))
+    if workers > 1 and os.getenv("PREDICTION_STORE", "memory") != "sqlite":
+        # Each worker has its own memory; only the SQLite store is visible to all of them
+        print("serve: SERVE_WORKERS > 1, using PREDICTION_STORE=sqlite", file=sys.stderr)
+        os.environ["PREDICTION_STORE"] = "sqlite"
+
+
+def _set_threads(threads: int):
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(SERVE_INTEROP_THREADS)
+    except RuntimeError:
+        pass  # already fixed once any inter-op work has run
+
+
+def _run_worker(config, sock, model, engine, threads: int):
+    """Child process body; never returns."""
+    code = 1
+    try:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)  # uvicorn installs its own graceful handlers
+        _set_threads(threads)
+        import api
+        api.use_preloaded_model(model, engine)
+        import uvicorn
+        uvicorn.Server(config).run(sockets=[sock])
+        code = 0
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        os._exit(code)
+
+
+def serve(workers: int, threads: int) -> int:
+    import uvicorn
+    from startup import LAZY_IMPORTS
+
+    config = uvicorn.Config("api:app", host=SERVE_HOST, port=SERVE_PORT, log_level=SERVE_LOG_LEVEL)
+    if workers == 1:
+        if not LAZY_IMPORTS:
+            _set_threads(threads)  # with lazy imports torch takes OMP_NUM_THREADS when warmup imports it
+        uvicorn.Server(config).run()
+        return 0
+    import torch
+    if torch.cuda.is_available():
+        print("serve: CUDA device found; forked workers cannot share it, use SERVE_WORKERS=1", file=sys.stderr)
+        return 2
+
+    # The parent stays single-threaded so fork is safe; workers set their own thread counts
+    torch.set_num_threads(1)
+    from engines import load_model, prepare_engine, share_weights
+    start = time.time()
+    model = load_model(torch.device("cpu"))
+    share_weights(model)
+    # TorchScript/int8/ensemble weights are built once here and inherited like the main model
+    engine = prepare_engine(os.getenv("INFERENCE_ENGINE", "eager"), model, torch.device("cpu"))
+    print(f"serve: model loaded in {time.time() - start:.1f}s; starting {workers} workers x {threads} threads "
+          f"on {SERVE_HOST}:{SERVE_PORT}", file=sys.stderr)
+    sock = config.bind_socket()
+
+    children: Dict[int, float] = {}  # pid -> start time
+    stopping = False
+
+    def _spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(config, sock, model, engine, threads)
+        children[pid] = time.time()
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    for _ in range(workers):
+        _spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"serve: worker {pid} exited ({os.waitstatus_to_exitcode(status)}), restarting", file=sys.stderr)
+        if time.time() - started < 5:
+            time.sleep(_RESTART_BACKOFF_SEC)
+        if not stopping:
+            _spawn()
+    sock.close()
+    return 0
+
+
+def main() -> int:
+    workers, threads = plan(available_cpus())
+    _configure_env(workers, threads)
+    return serve(workers, threads)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Server-side chat sessions with a token-budgeted, compacted history.
+
+A session belongs to one prediction id and keeps the last few exchanges
+verbatim. Once the history exceeds ``history_tokens``, the oldest exchanges
+are folded into a short extractive summary (first sentence of the question and
+of the answer, disclaimer stripped), and the oldest summary lines are dropped
+past ``summary_tokens``. The history text added to each chat prompt therefore
+stays roughly constant however long the conversation runs.
+
+Sessions are kept in a ``store.py`` backend, so a session can be continued on
+any worker when ``PREDICTION_STORE=sqlite``. The store's TTL counts from the
+last write, and every turn rewrites the session, so sessions expire after
+``ttl_sec`` of inactivity. Token counts are estimates (characters / 4).
+Turns on one session are recorded one at a time, each onto the latest stored
+history, so concurrent turns do not overwrite each other.
+"""
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from store import PredictionStore
+
+_DISCLAIMER = re.compile(r"\s*NOT A FINAL DIAGNOSIS\.?\s*(Consult a licensed physician\.?)?", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English prompts (about four characters per token)."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    text = " ".join(_DISCLAIMER.sub(" ", text or "").split())
+    text = _SENTENCE_END.split(text, 1)[0]
+    return text if len(text) <= max_chars else text[: max_chars - 3].rstrip() + "..."
+
+
+def _turn_text(user: str, assistant: str) -> str:
+    return f"User: {user}\nAssistant: {assistant}\n"
+
+
+class ChatSessions:
+    def __init__(
+        self,
+        store: PredictionStore,
+        history_tokens: int = 600,
+        max_turns: int = 6,
+        summary_tokens: int = 200,
+    ):
+        self.store = store
+        self.history_tokens = max(1, history_tokens)
+        self.max_turns = max(1, max_turns)
+        self.summary_tokens = max(0, summary_tokens)
+        self._stats = {"created": 0, "resumed": 0, "expired": 0, "turns": 0, "compactions": 0}
+        self._lock = threading.Lock()
+        self._session_locks: Dict[str, List[Any]] = {}  # session id -> [lock, holders]
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    def open(self, session_id: Optional[str], prediction_id: str) -> Tuple[Dict[str, Any], bool]:
+        """Returns ``(session, resumed)``; a missing, expired or foreign ``session_id`` starts a new session."""
+        if session_id:
+            session = self.store.get(session_id)
+            if session is not None and session.get("prediction_id") == prediction_id:
+                self._count("resumed")
+                return session, True
+            self._count("expired")
+        self._count("created")
+        now = time.time()
+        return {"id": uuid.uuid4().hex, "prediction_id": prediction_id, "turns": [], "summary": [],
+                "omitted": 0, "compactions": 0, "created_at": now, "updated_at": now}, False
+
+    def history(self, session: Dict[str, Any]) -> str:
+        """Prompt text for the conversation so far (empty for a new session)."""
+        if not session["turns"] and not session["summary"]:
+            return ""
+        lines = ["Conversation so far (oldest first; answer only the new question):"]
+        if session["summary"] or session["omitted"]:
+            earlier = "; ".join(session["summary"])
+            if session["omitted"]:
+                earlier = f"({session['omitted']} earlier exchanges omitted) " + earlier
+            lines.append(f"Earlier: {earlier}")
+        lines.extend(_turn_text(u, a).rstrip("\n") for u, a in session["turns"])
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def _locked(self, session_id: str):
+        with self._lock:
+            entry = self._session_locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._session_locks[session_id]
+
+    def record(self, session: Dict[str, Any], user: str, answer: str) -> Dict[str, Any]:
+        """Append one exchange, compact to the budget and persist; returns the stored session."""
+        with self._locked(session["id"]):
+            # Another turn may have been recorded since this one opened the session
+            latest = self.store.get(session["id"])
+            if latest is not None and latest.get("prediction_id") == session["prediction_id"]:
+                session = latest
+            return self._record(session, user, answer)
+
+    def _record(self, session: Dict[str, Any], user: str, answer: str) -> Dict[str, Any]:
+        turns: List[List[str]] = [list(t) for t in session["turns"]] + [[user, _DISCLAIMER.sub("", answer).strip()]]
+        summary = list(session["summary"])
+        omitted, compactions = session["omitted"], session["compactions"]
+
+        def _size():
+            return sum(estimate_tokens(_turn_text(u, a)) for u, a in turns)
+
+        while len(turns) > 1 and (len(turns) > self.max_turns or _size() > self.history_tokens):
+            u, a = turns.pop(0)
+            summary.append(f"Q: {_first_sentence(u, 100)} A: {_first_sentence(a, 160)}")
+            compactions += 1
+        while summary and estimate_tokens("; ".join(summary)) > self.summary_tokens:
+            summary.pop(0)
+            omitted += 1
+        if _size() > self.history_tokens:
+            # A single oversized exchange: keep its head
+            u, a = turns[0]
+            room = max(0, self.history_tokens * 4 - len(u) - 32)
+            turns[0] = [u, a[:room].rstrip() + "..."]
+        self._count("turns")
+        self._count("compactions", compactions - session["compactions"])
+        session = {**session, "turns": turns, "summary": summary, "omitted": omitted,
+                   "compactions": compactions, "updated_at": time.time()}
+        self.store.put(session["id"], session)
+        return session
+
+    def describe(self, session: Dict[str, Any], resumed: bool) -> Dict[str, Any]:
+        """Session fields returned to clients."""
+        return {
+            "id": session["id"],
+            "resumed": resumed,
+            "turns": len(session["turns"]) + len(session["summary"]) + session["omitted"],
+            "history_tokens": estimate_tokens(self.history(session)),
+            "compactions": session["compactions"],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        out.update({"active": len(self.store), "backend": self.store.backend, "ttl_sec": self.store.ttl_sec,
+                    "history_tokens": self.history_tokens, "max_turns": self.max_turns})
+        return out
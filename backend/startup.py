@@ -0,0 +1,141 @@
+"""Deferred heavy imports and a cold-start profile.
+
+With ``LAZY_IMPORTS=1`` (default) ``lazy_import("torch")`` returns a
+placeholder module. The real import happens on first attribute access, so the
+server binds its port and answers ``/healthz`` before torch, torchvision,
+torchxrayvision and skimage are loaded. Warmup then imports them off the event
+loop. With ``LAZY_IMPORTS=0`` they are imported immediately, as before.
+
+Every import made through ``lazy_import`` is timed, together with what
+triggered it. ``profile()`` (under ``startup`` on ``/readyz``) reports these
+timings along with the seconds since the process started. Measure a cold start
+without a server with::
+
+    python startup.py            # import api, heavy modules, model + engine, one forward pass
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+import traceback
+import types
+from typing import Any, Dict, List, Optional
+
+LAZY_IMPORTS = os.getenv("LAZY_IMPORTS", "1") == "1"
+
+_IMPORTED_AT = time.time()
+_import_lock = threading.RLock()
+_imports: List[Dict[str, Any]] = []  # in import order; a module's time excludes dependencies imported before it
+
+
+def process_uptime() -> Optional[float]:
+    """Seconds since this process started (Linux ``/proc``), or None elsewhere."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 4)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _caller() -> str:
+    # First frame outside this module and importlib: the code that needed the module
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        if frame.filename != __file__ and "importlib" not in frame.filename:
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "?"
+
+
+def _timed_import(name: str, trigger: str) -> types.ModuleType:
+    with _import_lock:
+        already = name in sys.modules
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        if not already:
+            _imports.append({"module": name, "sec": round(time.perf_counter() - start, 4), "trigger": trigger,
+                             "thread": threading.current_thread().name})
+        return module
+
+
+class _LazyModule(types.ModuleType):
+    """Stands in for a module until an attribute is first read."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = _timed_import(self.__name__, _caller())
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """``name`` now (``LAZY_IMPORTS=0``) or on first attribute access."""
+    if not LAZY_IMPORTS:
+        return _timed_import(name, "eager")
+    return _LazyModule(name)
+
+
+def preload(names: List[str]):
+    """Import ``names`` in order, each timed on its own (warmup passes dependencies first)."""
+    for name in names:
+        _timed_import(name, "preload")
+
+
+def profile() -> Dict[str, Any]:
+    return {
+        "lazy_imports": LAZY_IMPORTS,
+        "process_uptime_sec": process_uptime(),
+        "since_first_import_sec": round(time.time() - _IMPORTED_AT, 4),
+        "imports": list(_imports),
+        "import_sec": round(sum(i["sec"] for i in _imports), 4),
+    }
+
+
+def main() -> int:
+    os.environ.setdefault("WARMUP_ON_STARTUP", "0")
+    startup = importlib.import_module("startup")  # the instance api.py records into, not __main__
+    start = time.perf_counter()
+    steps = []
+
+    def _step(name, fn):
+        t = time.perf_counter()
+        result = fn()
+        steps.append((name, time.perf_counter() - t))
+        return result
+
+    api = _step("import api", lambda: importlib.import_module("api"))
+    _step("preload heavy modules", lambda: startup.preload(api.HEAVY_MODULES))
+    _step("load model", api.get_model)
+    _step("load engine", api.get_engine)
+    _step("first forward pass", lambda: api._forward_batch(list(api.engines.synthetic_batch(1))))
+    report = startup.profile()
+    print(f"{'stage':<40} {'sec':>8}  trigger")
+    for name, sec in steps:
+        print(f"{name:<40} {sec:>8.3f}")
+    for entry in report["imports"]:
+        print(f"{'  import ' + entry['module']:<40} {entry['sec']:>8.3f}  {entry['trigger']}")
+    print(f"{'total (to first forward pass)':<40} {time.perf_counter() - start:>8.3f}")
+    if report["process_uptime_sec"] is not None:
+        print(f"{'process uptime (incl. interpreter)':<40} {report['process_uptime_sec']:>8.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
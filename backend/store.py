@@ -0,0 +1,263 @@
+"""Prediction store backends.
+
+``MemoryPredictionStore`` keeps records in an O(1) LRU/TTL map (per process).
+``SQLitePredictionStore`` persists records to a WAL-mode SQLite file so they
+survive restarts and can be shared by several uvicorn workers on one host.
+Both evict least-recently-used records past ``max_entries`` and drop records
+not written for ``ttl_sec`` seconds (0 disables either limit).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from cache import LRUTTLCache
+
+
+class PredictionStore:
+    """Minimal interface shared by the backends."""
+
+    def get(self, pred_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, pred_id: str, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def update(self, pred_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Merge ``fields`` into an existing record; returns the new record or None if absent."""
+        raise NotImplementedError
+
+    def delete(self, pred_id: str) -> None:
+        raise NotImplementedError
+
+    def iter_field(self, field: str) -> Iterator[Tuple[str, Any]]:
+        """Yield ``(id, record[field])`` for every live record holding ``field`` (bulk scans)."""
+        raise NotImplementedError
+
+    def live_ids(self, ids: Iterable[str]) -> Set[str]:
+        """Subset of ``ids`` that still have a live record; does not touch recency (asset GC)."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "entries": len(self), "max_entries": self.max_entries, "ttl_sec": self.ttl_sec}
+
+
+class MemoryPredictionStore(PredictionStore):
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 100000, ttl_sec: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._cache = LRUTTLCache(max_entries, ttl_sec)
+        self._update_lock = threading.Lock()
+
+    def get(self, pred_id):
+        return self._cache.get(pred_id)
+
+    def put(self, pred_id, record):
+        self._cache.put(pred_id, record)
+
+    def update(self, pred_id, fields):
+        # Copy-on-write: readers holding the previous dict never see it change
+        with self._update_lock:
+            current = self._cache.get(pred_id)
+            if current is None:
+                return None
+            merged = {**current, **fields}
+            self._cache.put(pred_id, merged)
+            return merged
+
+    def delete(self, pred_id):
+        self._cache.pop(pred_id)
+
+    def iter_field(self, field):
+        for pred_id, record in self._cache.items():
+            if field in record:
+                yield pred_id, record[field]
+
+    def live_ids(self, ids):
+        live = {pred_id for pred_id, _ in self._cache.items()}
+        return {pred_id for pred_id in ids if pred_id in live}
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class SQLitePredictionStore(PredictionStore):
+    backend = "sqlite"
+    _SWEEP_EVERY = 64  # puts between eviction sweeps (keeps inserts O(1) amortized)
+    _TOUCH_EVERY_SEC = 60.0  # reads refresh accessed_at at most this often, so most reads take no write lock
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl_sec: float = 0.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._local = threading.local()
+        self._puts = 0
+        self._update_lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "id TEXT PRIMARY KEY, record TEXT NOT NULL, updated_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_accessed ON predictions(accessed_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_updated ON predictions(updated_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers and the single writer proceed concurrently
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, updated_at: float, now: float) -> bool:
+        return self.ttl_sec > 0 and updated_at <= now - self.ttl_sec
+
+    def get(self, pred_id):
+        conn = self._conn()
+        row = conn.execute("SELECT record, updated_at, accessed_at FROM predictions WHERE id = ?", (pred_id,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if self._expired(row[1], now):
+            conn.execute("DELETE FROM predictions WHERE id = ?", (pred_id,))
+            return None
+        if now - row[2] > self._TOUCH_EVERY_SEC:
+            # LRU order only needs coarse recency; a write per read would contend with every other worker
+            conn.execute("UPDATE predictions SET accessed_at = ? WHERE id = ?", (now, pred_id))
+        return json.loads(row[0])
+
+    def put(self, pred_id, record):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO predictions (id, record, updated_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (pred_id, json.dumps(record), now, now),
+        )
+        self._puts += 1
+        if self._puts % self._SWEEP_EVERY == 0:
+            self.sweep()
+
+    def update(self, pred_id, fields):
+        with self._update_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT record FROM predictions WHERE id = ?", (pred_id,)).fetchone()
+                if row is None:
+                    conn.execute("ROLLBACK")
+                    return None
+                merged = {**json.loads(row[0]), **fields}
+                now = time.time()
+                conn.execute(
+                    "UPDATE predictions SET record = ?, updated_at = ?, accessed_at = ? WHERE id = ?",
+                    (json.dumps(merged), now, now, pred_id),
+                )
+                conn.execute("COMMIT")
+                return merged
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, pred_id):
+        self._conn().execute("DELETE FROM predictions WHERE id = ?", (pred_id,))
+
+    def iter_field(self, field):
+        # json_extract avoids parsing whole records; objects/arrays come back as JSON text
+        cutoff = time.time() - self.ttl_sec if self.ttl_sec > 0 else float("-inf")
+        rows = self._conn().execute(
+            "SELECT id, json_extract(record, ?), json_type(record, ?) FROM predictions "
+            "WHERE updated_at > ? AND json_type(record, ?) IS NOT NULL",
+            ("$." + field, "$." + field, cutoff, "$." + field),
+        )
+        for pred_id, value, kind in rows:
+            yield pred_id, json.loads(value) if kind in ("object", "array") else value
+
+    def live_ids(self, ids):
+        ids = list(ids)
+        cutoff = time.time() - self.ttl_sec if self.ttl_sec > 0 else float("-inf")
+        live = set()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self._conn().execute(
+                f"SELECT id FROM predictions WHERE updated_at > ? AND id IN ({','.join('?' * len(chunk))})",
+                (cutoff, *chunk),
+            )
+            live.update(row[0] for row in rows)
+        return live
+
+    def sweep(self) -> None:
+        """Drop expired records, then the least recently used ones beyond capacity."""
+        conn = self._conn()
+        if self.ttl_sec > 0:
+            conn.execute("DELETE FROM predictions WHERE updated_at <= ?", (time.time() - self.ttl_sec,))
+        if self.max_entries > 0:
+            conn.execute(
+                "DELETE FROM predictions WHERE id IN ("
+                "SELECT id FROM predictions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+
+class TimedPredictionStore(PredictionStore):
+    """Delegating wrapper that reports each operation's latency as ``observe("store_<op>", seconds)``."""
+
+    def __init__(self, inner: PredictionStore, observe):
+        self.inner = inner
+        self.observe = observe
+        self.backend = inner.backend
+        self.max_entries = inner.max_entries
+        self.ttl_sec = inner.ttl_sec
+
+    def _timed(self, op: str, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.observe("store_" + op, time.perf_counter() - start)
+
+    def get(self, pred_id):
+        return self._timed("get", self.inner.get, pred_id)
+
+    def put(self, pred_id, record):
+        return self._timed("put", self.inner.put, pred_id, record)
+
+    def update(self, pred_id, fields):
+        return self._timed("update", self.inner.update, pred_id, fields)
+
+    def delete(self, pred_id):
+        return self._timed("delete", self.inner.delete, pred_id)
+
+    def iter_field(self, field):
+        return self.inner.iter_field(field)
+
+    def live_ids(self, ids):
+        return self.inner.live_ids(ids)
+
+    def __len__(self):
+        return len(self.inner)
+
+    def stats(self):
+        return self.inner.stats()
+
+
+def open_store(kind: str, path: str, max_entries: int, ttl_sec: float) -> PredictionStore:
+    kind = (kind or "memory").lower()
+    if kind == "sqlite":
+        return SQLitePredictionStore(path, max_entries=max_entries, ttl_sec=ttl_sec)
+    if kind == "memory":
+        return MemoryPredictionStore(max_entries=max_entries, ttl_sec=ttl_sec)
+    raise ValueError(f"Unknown PREDICTION_STORE backend: {kind}")
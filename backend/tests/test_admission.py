@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from admission import BATCH, INTERACTIVE, AdmissionRejected, Gate, InflightBytes
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_grants_up_to_limit_then_queues():
+    async def main():
+        gate = Gate("inference", 2)
+        await gate.acquire()
+        await gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done() and gate.waiting() == 1
+        gate.release(INTERACTIVE)
+        await waiter
+        return gate.stats()
+
+    stats = run(main())
+    assert stats["in_use"] == 2 and stats["admitted"] == 3 and stats["waiting"] == 0
+
+
+def test_interactive_waiters_go_first():
+    async def main():
+        gate = Gate("inference", 1)
+        order = []
+        await gate.acquire(INTERACTIVE)
+
+        async def wait(priority, name):
+            await gate.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(wait(BATCH, "batch")), asyncio.ensure_future(wait(INTERACTIVE, "interactive"))]
+        await asyncio.sleep(0)
+        gate.release(INTERACTIVE)
+        await asyncio.sleep(0)
+        gate.release(INTERACTIVE)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(main()) == ["interactive", "batch"]
+
+
+def test_lane_limit_keeps_headroom_for_interactive():
+    async def main():
+        gate = Gate("inference", 3, lane_limits={BATCH: 1})
+        await gate.acquire(BATCH)
+        second_batch = asyncio.ensure_future(gate.acquire(BATCH))
+        await asyncio.sleep(0)
+        assert not second_batch.done()
+        await asyncio.wait_for(gate.acquire(INTERACTIVE), 1)  # not stuck behind the capped lane
+        gate.release(BATCH)
+        await second_batch
+        return gate.stats()["lanes"]
+
+    assert run(main()) == {"batch": 1, "interactive": 1}
+
+
+def test_weighted_cost():
+    async def main():
+        gate = Gate("inference", 4)
+        await gate.acquire(cost=3)
+        big = asyncio.ensure_future(gate.acquire(cost=2))
+        await asyncio.sleep(0)
+        assert not big.done()
+        gate.release(INTERACTIVE, cost=3)
+        await big
+        return gate.stats()["in_use"]
+
+    assert run(main()) == 2
+
+
+def test_rejects_when_queue_is_full():
+    async def main():
+        gate = Gate("llm", 1, max_queue=1)
+        await gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as e:
+            await gate.acquire()
+        waiter.cancel()
+        return e.value
+
+    rejected = run(main())
+    assert rejected.reason == "queue_full" and rejected.retry_after >= 1
+
+
+def test_rejects_after_queue_deadline_without_leaking_a_slot():
+    async def main():
+        gate = Gate("inference", 1, deadlines={BATCH: 0.01})
+        await gate.acquire()
+        with pytest.raises(AdmissionRejected) as e:
+            await gate.acquire(BATCH)
+        gate.release(INTERACTIVE)
+        await asyncio.wait_for(gate.acquire(BATCH), 1)
+        return e.value.reason, gate.stats()
+
+    reason, stats = run(main())
+    assert reason == "deadline"
+    assert stats["in_use"] == 1 and stats["deadline"] == 1
+
+
+def test_rejects_up_front_when_expected_wait_exceeds_deadline():
+    async def main():
+        gate = Gate("inference", 1, deadlines={BATCH: 1.0})
+        async with gate.slot():
+            pass
+        gate._service_sec = 5.0  # recent slots took 5s each
+        await gate.acquire()
+        with pytest.raises(AdmissionRejected) as e:
+            await gate.acquire(BATCH)
+        return e.value
+
+    rejected = run(main())
+    assert rejected.reason == "predicted"
+    assert rejected.retry_after >= 5
+
+
+def test_cancelled_waiter_releases_its_place():
+    async def main():
+        gate = Gate("inference", 1)
+        await gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        gate.release(INTERACTIVE)
+        return gate.stats()
+
+    stats = run(main())
+    assert stats["in_use"] == 0 and stats["waiting"] == 0
+
+
+def test_slot_tracks_hold_time():
+    async def main():
+        gate = Gate("inference", 1)
+        async with gate.slot():
+            await asyncio.sleep(0.01)
+        return gate.stats()
+
+    stats = run(main())
+    assert stats["in_use"] == 0 and stats["avg_slot_sec"] >= 0.01
+
+
+def test_inflight_bytes_budget():
+    budget = InflightBytes(100)
+    budget.reserve(150)  # a lone upload is always admitted
+    with pytest.raises(AdmissionRejected) as e:
+        budget.reserve(1)
+    budget.release(150)
+    budget.reserve(60)
+    budget.reserve(40)
+    assert e.value.reason == "memory"
+    assert budget.stats() == {"limit": 100, "current": 100, "peak": 150, "rejected": 1}
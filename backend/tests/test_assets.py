@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from assets import _LIVENESS_GRACE_SEC, LocalAssetStore
+
+
+def files_under(root, sub):
+    return sorted(os.path.relpath(os.path.join(d, f), os.path.join(root, sub))
+                  for d, _, fs in os.walk(os.path.join(root, sub)) for f in fs)
+
+
+def test_identical_content_shares_one_blob(tmp_path):
+    store = LocalAssetStore(str(tmp_path))
+    first = store.put("p1", "image.png", b"pixels")
+    second = store.put("p2", "image.png", b"pixels")
+    assert first == second
+    assert store.get("p2", "image.png") == b"pixels"
+    assert len(files_under(store.root, "blobs")) == 1
+    stats = store.stats()
+    assert (stats["blobs"], stats["refs"], stats["dedup_hits"], stats["bytes"]) == (1, 2, 1, 6)
+
+
+def test_prediction_views_point_at_the_blob(tmp_path):
+    store = LocalAssetStore(str(tmp_path))
+    blob = store.put("p1", "image.png", b"pixels")
+    view = store.view_path("p1", "image.png")
+    with open(view, "rb") as f:
+        assert f.read() == b"pixels"
+    assert os.path.samefile(view, blob) or os.path.getsize(view) == 6
+    with pytest.raises(ValueError):
+        store.view_path("p1", "../../escape.png")
+
+
+def test_shared_assets_outlive_their_source(tmp_path, clock):
+    live = {"p1", "p2"}
+    store = LocalAssetStore(str(tmp_path), is_live=lambda ids: live & set(ids))
+    store.put("p1", "image.png", b"pixels")
+    store.put("p1", "mask.png", b"mask")
+    assert store.share("p1", "p2") == 2
+    live.discard("p1")
+    clock.advance(_LIVENESS_GRACE_SEC + 1)
+    assert store.gc()["removed_evicted"] == 2
+    assert store.get("p1", "image.png") is None
+    assert store.get("p2", "mask.png") == b"mask"
+    assert os.path.exists(store.view_path("p2", "image.png"))
+    assert not os.path.exists(os.path.join(store.root, "predictions", "p1"))
+
+
+def test_recent_assets_survive_the_liveness_check(tmp_path):
+    store = LocalAssetStore(str(tmp_path), is_live=lambda ids: set())
+    store.put("p1", "image.png", b"pixels")  # prediction record not stored yet
+    assert store.gc()["removed_evicted"] == 0
+    assert store.get("p1", "image.png") == b"pixels"
+
+
+def test_ttl_drops_refs_views_and_orphan_blobs(tmp_path, clock):
+    store = LocalAssetStore(str(tmp_path), ttl_sec=60)
+    store.put("old", "image.png", b"old")
+    clock.advance(61)
+    store.put("new", "image.png", b"new")
+    os.utime(os.path.join(store.root, "predictions", "new"), (clock.now, clock.now))  # mtimes follow the real clock
+    assert store.gc()["removed_ttl"] == 1
+    assert store.get("old", "image.png") is None and store.get("new", "image.png") == b"new"
+    assert files_under(store.root, "predictions") == [os.path.join("new", "image.png")]
+    assert store.stats()["blobs"] == 1
+
+
+def test_quota_removes_oldest_predictions_first(tmp_path, clock):
+    store = LocalAssetStore(str(tmp_path), max_bytes=250)
+    for pred_id in ("a", "b", "c"):
+        store.put(pred_id, "image.png", pred_id.encode() * 100)
+        clock.advance(1)
+    removed = store.gc()
+    assert removed["removed_quota"] == 1  # 300 bytes -> under 90% of the quota
+    assert [p for p in "abc" if store.get(p, "image.png")] == ["b", "c"]
+    assert store.stats()["bytes"] == 200
+
+
+def test_blob_shared_by_a_live_prediction_is_kept(tmp_path, clock):
+    store = LocalAssetStore(str(tmp_path), ttl_sec=60)
+    store.put("old", "image.png", b"pixels")
+    clock.advance(61)
+    store.put("new", "image.png", b"pixels")
+    store.gc()
+    assert store.get("new", "image.png") == b"pixels"
+    assert store.stats()["blobs"] == 1
+
+
+def test_orphaned_view_directories_are_swept(tmp_path, clock):
+    store = LocalAssetStore(str(tmp_path), is_live=lambda ids: set())
+    legacy = os.path.join(store.root, "predictions", "legacy")
+    os.makedirs(legacy)
+    with open(os.path.join(legacy, "image.png"), "wb") as f:
+        f.write(b"pre-blob layout")
+    clock.advance(_LIVENESS_GRACE_SEC + 1)
+    store.gc()
+    assert not os.path.exists(legacy)
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from cache import LRUTTLCache, ResultCache
+
+
+def test_lru_evicts_least_recently_used():
+    evicted = []
+    cache = LRUTTLCache(2, on_evict=lambda k, v: evicted.append(k))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the coldest
+    cache.put("c", 3)
+    assert evicted == ["b"]
+    assert "b" not in cache
+    assert [k for k, _ in cache.items()] == ["a", "c"]
+
+
+def test_ttl_expires_entries(clock):
+    evicted = []
+    cache = LRUTTLCache(0, ttl_sec=10, on_evict=lambda k, v: evicted.append(k))
+    cache.put("a", 1)
+    clock.advance(5)
+    cache.put("b", 2)
+    clock.advance(6)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert evicted == ["a"]
+    clock.advance(5)
+    cache.put("c", 3)  # puts sweep expired entries from the cold end
+    assert evicted == ["a", "b"]
+    assert len(cache) == 1
+
+
+def test_on_evict_errors_are_swallowed():
+    def boom(key, value):
+        raise RuntimeError(key)
+
+    cache = LRUTTLCache(1, on_evict=boom)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("b") == 2
+
+
+def test_single_flight_runs_compute_once():
+    cache = ResultCache(8)
+    calls, shared = [], []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"p": [0.5]}
+
+    async def main():
+        first = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        second = await cache.get_or_compute("k", compute, on_shared=lambda: shared.append("coalesced"))
+        third = await cache.get_or_compute("k", compute, on_shared=lambda: shared.append("hit"))
+        return await first, second, third
+
+    first, second, third = asyncio.run(main())
+    assert len(calls) == 1
+    assert [s for _, s in (first, second, third)] == ["miss", "coalesced", "hit"]
+    assert shared == ["coalesced", "hit"]
+    assert cache.stats()["hit_rate"] == pytest.approx(2 / 3, abs=1e-4)
+
+
+def test_results_are_copies():
+    cache = ResultCache(8)
+
+    async def compute():
+        return {"p": [0.5]}
+
+    async def main():
+        value, _ = await cache.get_or_compute("k", compute)
+        value["p"].append(1.0)
+        return await cache.get_or_compute("k", compute)
+
+    assert asyncio.run(main()) == ({"p": [0.5]}, "hit")
+
+
+def test_failures_reach_waiters_and_are_not_cached():
+    cache = ResultCache(8)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("bad image")
+
+    async def ok():
+        return 1
+
+    async def main():
+        first = asyncio.ensure_future(cache.get_or_compute("k", failing))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(first, cache.get_or_compute("k", failing), return_exceptions=True)
+        return results, await cache.get_or_compute("k", ok)
+
+    results, retry = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(r, ValueError) for r in results)
+    assert retry == (1, "miss")
+
+
+def test_disabled_cache_always_computes():
+    cache = ResultCache(0)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return 1
+
+    async def main():
+        return [await cache.get_or_compute("k", compute) for _ in range(2)]
+
+    assert asyncio.run(main()) == [(1, "miss"), (1, "miss")]
+    assert len(calls) == 2
+    assert "k" not in cache
@@ -0,0 +1,138 @@
+import pytest
+
+from jobs import CallbackURLError, JobQueue, JobQueueFull, check_callback_url
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2, lease_sec=30, ttl_sec=3600, max_queued=10)
+
+
+def submit(queue, callback_url=None):
+    return queue.submit(b"film", "xray.png", {"report": False}, callback_url)["id"]
+
+
+def test_claim_and_finish(queue):
+    job_id = submit(queue)
+    job, data = queue.claim("w1")
+    assert (job["id"], job["attempts"], job["worker"], data) == (job_id, 1, "w1", b"film")
+    assert queue.claim("w2") is None
+    assert queue.finish(job, {"label": "Normal"})
+    doc = queue.get(job_id)
+    assert doc["status"] == "done" and doc["result"] == {"label": "Normal"}
+    assert queue._conn().execute("SELECT COUNT(*) FROM job_inputs").fetchone()[0] == 0
+
+
+def test_failed_attempts_retry_with_backoff_then_fail(queue, clock):
+    job_id = submit(queue)
+    job, _ = queue.claim("w1")
+    assert queue.fail(job, "boom", retry=True, backoff_sec=10)
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.claim("w1") is None  # still backing off
+    clock.advance(10)
+    job, _ = queue.claim("w1")
+    assert job["attempts"] == 2
+    assert queue.fail(job, "boom again", retry=True, backoff_sec=10)
+    doc = queue.get(job_id)
+    assert doc["status"] == "failed" and doc["error"] == "boom again"
+
+
+def test_non_retryable_failure(queue):
+    job_id = submit(queue)
+    job, _ = queue.claim("w1")
+    queue.fail(job, "not an image", retry=False, backoff_sec=10)
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_defer_does_not_use_an_attempt(queue, clock):
+    submit(queue)
+    job, _ = queue.claim("w1")
+    assert queue.defer(job, 5)
+    assert queue.claim("w1") is None
+    clock.advance(5)
+    job, _ = queue.claim("w1")
+    assert job["attempts"] == 1
+
+
+def test_expired_lease_is_reclaimed_and_stale_worker_loses(queue, clock):
+    job_id = submit(queue)
+    stale, _ = queue.claim("w1")
+    clock.advance(31)
+    job, data = queue.claim("w2")
+    assert (job["worker"], job["attempts"], data) == ("w2", 2, b"film")
+    assert not queue.finish(stale, {"label": "late"})
+    assert queue.finish(job, {"label": "Normal"})
+    assert queue.get(job_id)["result"] == {"label": "Normal"}
+
+
+def test_lost_job_out_of_attempts_is_failed(queue, clock):
+    job_id = submit(queue, "https://hooks.example/done")
+    queue.claim("w1")
+    clock.advance(31)
+    queue.claim("w2")
+    clock.advance(31)
+    assert queue.claim("w3") is None
+    doc = queue.get(job_id)
+    assert doc["status"] == "failed" and "lease expired" in doc["error"]
+    assert doc["callback"]["status"] == "pending"
+
+
+def test_queue_limit(queue):
+    for _ in range(10):
+        submit(queue)
+    with pytest.raises(JobQueueFull):
+        submit(queue)
+
+
+def test_callbacks_are_claimed_once_per_lease(queue, clock):
+    job_id = submit(queue, "https://hooks.example/done")
+    job, _ = queue.claim("w1")
+    queue.finish(job, {"label": "Normal"})
+    due = queue.due_callbacks(lease_sec=60)
+    assert [d["id"] for d in due] == [job_id]
+    assert queue.due_callbacks(lease_sec=60) == []  # held by the first claimer
+    clock.advance(61)
+    assert [d["id"] for d in queue.due_callbacks(lease_sec=60)] == [job_id]  # claimer died; claimable again
+
+
+def test_callback_attempt_is_recorded_once(queue, clock):
+    job_id = submit(queue, "https://hooks.example/done")
+    job, _ = queue.claim("w1")
+    queue.finish(job, {"label": "Normal"})
+    queue.due_callbacks()
+    assert queue.callback_attempted(job_id, 0, False, "HTTP 500", clock.now + 2)
+    assert not queue.callback_attempted(job_id, 0, True, None, None)  # a second worker on the same attempt
+    assert queue.callback_attempted(job_id, 1, True, None, None)
+    callback = queue.get(job_id)["callback"]
+    assert callback["status"] == "delivered" and callback["attempts"] == 2
+
+
+def test_purge_keeps_pending_callbacks(queue, clock):
+    plain, hooked = submit(queue), submit(queue, "https://hooks.example/done")
+    for _ in range(2):
+        job, _ = queue.claim("w1")
+        queue.finish(job, {})
+    clock.advance(3601)
+    assert queue.purge() == 1
+    assert queue.get(plain) is None and queue.get(hooked) is not None
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/hook",
+    "/relative/hook",
+    "http://127.0.0.1:9000/hook",
+    "http://10.0.0.5/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+])
+def test_callback_url_refused(url):
+    with pytest.raises(CallbackURLError):
+        check_callback_url(url)
+
+
+def test_callback_url_allowed():
+    assert check_callback_url("https://8.8.8.8/hook")
+    assert check_callback_url("http://127.0.0.1:9000/hook", allow_private=True)
+    assert check_callback_url("http://receiver:9000/hook", allowed_hosts=["receiver"])
+    with pytest.raises(CallbackURLError):
+        check_callback_url("https://8.8.8.8/hook", allowed_hosts=["receiver"])
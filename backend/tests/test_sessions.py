@@ -0,0 +1,55 @@
+import threading
+
+from sessions import ChatSessions, estimate_tokens
+from store import MemoryPredictionStore
+
+
+def make(**kwargs):
+    return ChatSessions(MemoryPredictionStore(), **kwargs)
+
+
+def test_open_resumes_only_the_same_prediction():
+    chats = make()
+    session, resumed = chats.open(None, "p1")
+    assert not resumed and chats.history(session) == ""
+    chats.record(session, "Is it pneumonia?", "Likely. NOT A FINAL DIAGNOSIS. Consult a licensed physician.")
+    again, resumed = chats.open(session["id"], "p1")
+    assert resumed and again["turns"] == [["Is it pneumonia?", "Likely."]]
+    other, resumed = chats.open(session["id"], "p2")
+    assert not resumed and other["id"] != session["id"]
+    assert chats.stats()["expired"] == 1
+
+
+def test_old_turns_are_compacted_into_a_summary():
+    chats = make(max_turns=2, summary_tokens=1000)
+    session, _ = chats.open(None, "p1")
+    for i in range(4):
+        session = chats.record(session, f"Question {i}? More detail.", f"Answer {i}. More detail.")
+    assert [u for u, _ in session["turns"]] == ["Question 2? More detail.", "Question 3? More detail."]
+    assert session["summary"] == ["Q: Question 0? A: Answer 0.", "Q: Question 1? A: Answer 1."]
+    assert chats.describe(session, True)["turns"] == 4
+
+
+def test_history_stays_within_budget():
+    chats = make(history_tokens=50, max_turns=6, summary_tokens=20)
+    session, _ = chats.open(None, "p1")
+    for i in range(20):
+        session = chats.record(session, f"Question number {i}?", "A long answer. " * 10)
+    assert sum(estimate_tokens(f"User: {u}\nAssistant: {a}\n") for u, a in session["turns"]) <= 50
+    assert estimate_tokens("; ".join(session["summary"])) <= 20
+    assert session["omitted"] > 0
+    assert "earlier exchanges omitted" in chats.history(session)
+
+
+def test_concurrent_turns_are_all_kept():
+    chats = make(max_turns=20, history_tokens=10000)
+    session, _ = chats.open(None, "p1")
+    session = chats.record(session, "first?", "ok.")
+    threads = [threading.Thread(target=chats.record, args=(session, f"q{i}?", "a.")) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stored = chats.store.get(session["id"])
+    assert len(stored["turns"]) == 9
+    assert chats._session_locks == {}
@@ -0,0 +1,109 @@
+import pytest
+
+from store import MemoryPredictionStore, SQLitePredictionStore, TimedPredictionStore, open_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return open_store(request.param, str(tmp_path / "predictions.sqlite3"), max_entries=0, ttl_sec=0)
+
+
+def test_put_get_update_delete(store):
+    store.put("a", {"label": "Pneumonia", "probability": 0.7})
+    assert store.get("a") == {"label": "Pneumonia", "probability": 0.7}
+    assert store.update("a", {"report": {"summary": "ok"}}) == {"label": "Pneumonia", "probability": 0.7, "report": {"summary": "ok"}}
+    assert store.get("a")["report"] == {"summary": "ok"}
+    assert store.update("missing", {"x": 1}) is None
+    store.delete("a")
+    assert store.get("a") is None
+    assert len(store) == 0
+
+
+def test_iter_field_and_live_ids(store):
+    store.put("a", {"outputs": {"schema": "w|eager", "f16": "AAA="}})
+    store.put("b", {"label": "x"})
+    assert dict(store.iter_field("outputs")) == {"a": {"schema": "w|eager", "f16": "AAA="}}
+    assert store.live_ids(["a", "b", "c"]) == {"a", "b"}
+
+
+def test_memory_update_is_copy_on_write():
+    store = MemoryPredictionStore()
+    store.put("a", {"n": 1})
+    before = store.get("a")
+    store.update("a", {"n": 2})
+    assert before == {"n": 1}
+    assert store.get("a") == {"n": 2}
+
+
+def test_memory_lru_and_ttl(clock):
+    store = MemoryPredictionStore(max_entries=2, ttl_sec=60)
+    store.put("a", {})
+    store.put("b", {})
+    store.get("a")
+    store.put("c", {})
+    assert store.get("b") is None
+    clock.advance(61)
+    assert store.get("a") is None
+    assert store.live_ids(["a", "c"]) == set()
+
+
+def test_sqlite_ttl(tmp_path, clock):
+    store = SQLitePredictionStore(str(tmp_path / "p.sqlite3"), ttl_sec=60)
+    store.put("a", {"n": 1})
+    clock.advance(30)
+    store.put("b", {"n": 2})
+    clock.advance(31)
+    assert store.live_ids(["a", "b"]) == {"b"}
+    assert dict(store.iter_field("n")) == {"b": 2}
+    assert store.get("a") is None  # expired on read
+    store.sweep()
+    assert len(store) == 1
+
+
+def test_sqlite_sweep_keeps_most_recently_used(tmp_path, clock):
+    store = SQLitePredictionStore(str(tmp_path / "p.sqlite3"), max_entries=2)
+    for pred_id in "abc":
+        store.put(pred_id, {})
+        clock.advance(1)
+    clock.advance(SQLitePredictionStore._TOUCH_EVERY_SEC + 1)
+    assert store.get("a") == {}  # old enough to be touched
+    store.sweep()
+    assert store.live_ids("abc") == {"a", "c"}
+
+
+def test_sqlite_reads_touch_coarsely(tmp_path, clock):
+    store = SQLitePredictionStore(str(tmp_path / "p.sqlite3"))
+
+    def accessed_at():
+        return store._conn().execute("SELECT accessed_at FROM predictions WHERE id = 'a'").fetchone()[0]
+
+    store.put("a", {})
+    written = accessed_at()
+    clock.advance(SQLitePredictionStore._TOUCH_EVERY_SEC / 2)
+    store.get("a")
+    assert accessed_at() == written
+    clock.advance(SQLitePredictionStore._TOUCH_EVERY_SEC)
+    store.get("a")
+    assert accessed_at() == clock.now
+
+
+def test_sqlite_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "p.sqlite3")
+    SQLitePredictionStore(path).put("a", {"n": 1})
+    assert SQLitePredictionStore(path).get("a") == {"n": 1}
+
+
+def test_timed_store_reports_each_operation():
+    seen = []
+    store = TimedPredictionStore(MemoryPredictionStore(), lambda op, sec: seen.append(op))
+    store.put("a", {})
+    store.get("a")
+    store.update("a", {"x": 1})
+    store.delete("a")
+    assert seen == ["store_put", "store_get", "store_update", "store_delete"]
+    assert store.stats()["backend"] == "memory"
+
+
+def test_open_store_rejects_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        open_store("redis", str(tmp_path / "p"), 10, 0)
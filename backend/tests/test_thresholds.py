@@ -0,0 +1,74 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from thresholds import (  # noqa: E402
+    MAX_SWEEP,
+    decode_outputs,
+    encode_outputs,
+    output_schema,
+    parse_sweep,
+    resolve_thresholds,
+    schema_weights,
+    stack_outputs,
+    sweep_counts,
+)
+
+
+def test_outputs_round_trip_as_float16():
+    probs = [0.0, 0.25, 0.5, 0.9999, 1.0]
+    encoded = encode_outputs(probs, "densenet121-res224-all|eager")
+    assert encoded["schema"] == "densenet121-res224-all|eager"
+    assert np.allclose(decode_outputs(encoded), probs, atol=1e-3)
+    stacked = stack_outputs([encoded["f16"], encode_outputs(probs[::-1], "")["f16"]], len(probs))
+    assert stacked.shape == (2, 5) and stacked.dtype == np.float32
+    assert np.allclose(stacked[1], probs[::-1], atol=1e-3)
+
+
+def test_schema_separates_engines_and_configs():
+    eager = output_schema("w", "eager")
+    ensemble = output_schema("w", "ensemble", {"members": ["a", "b"], "tta": ["flip"]})
+    assert eager == "w|eager"
+    assert ensemble.startswith("w|ensemble|") and ensemble != output_schema("w", "ensemble", {"members": ["a"]})
+    assert ensemble == output_schema("w", "ensemble", {"tta": ["flip"], "members": ["a", "b"]})
+    assert schema_weights(ensemble) == schema_weights(eager) == schema_weights("w") == "w"
+
+
+def test_sweep_counts_values_at_or_above_each_threshold():
+    values = np.array([0.125, 0.5, 0.5, 0.75, 0.875], dtype=np.float32)
+    assert sweep_counts(values, [0.0, 0.5, 0.51, 0.875, 1.0]) == [5, 4, 2, 1, 0]
+    assert sweep_counts(np.array([], dtype=np.float32), [0.5]) == [0]
+
+
+def test_sweep_counts_match_brute_force():
+    rng = np.random.default_rng(0)
+    values = rng.random(1000).astype(np.float32)
+    grid = parse_sweep([round(t, 2) for t in np.linspace(0, 1, 21)])
+    assert sweep_counts(values, grid) == [int((values >= t).sum()) for t in grid]
+
+
+def test_parse_sweep():
+    assert parse_sweep([0.9, 0, 0.5, 1]) == [0.0, 0.5, 0.9, 1.0]
+    assert parse_sweep([]) == []
+
+
+@pytest.mark.parametrize("grid", [0.5, "0.5", [0.5, "0.6"], [True], [1.5], [-0.1], [None], [0.5] * (MAX_SWEEP + 1)])
+def test_parse_sweep_rejects(grid):
+    with pytest.raises(ValueError):
+        parse_sweep(grid)
+
+
+def test_resolve_thresholds():
+    labels = ["Pneumonia", "Effusion", "Mass"]
+    assert resolve_thresholds(labels, None, None, 0.5) == dict.fromkeys(labels, 0.5)
+    assert resolve_thresholds(labels, 0.3, {"Mass": 0.8}, 0.5) == {"Pneumonia": 0.3, "Effusion": 0.3, "Mass": 0.8}
+
+
+@pytest.mark.parametrize("threshold, thresholds, error", [
+    (1.5, None, ValueError),
+    (None, {"Mass": -0.1}, ValueError),
+    (None, [0.5], TypeError),
+])
+def test_resolve_thresholds_rejects(threshold, thresholds, error):
+    with pytest.raises(error):
+        resolve_thresholds(["Mass"], threshold, thresholds, 0.5)
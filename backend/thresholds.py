@@ -0,0 +1,85 @@
+"""Stored pathology vectors and threshold re-evaluation without the model.
+
+Every prediction keeps the full model output vector as little-endian float16
+(36 bytes for the 18 xrv pathologies), base64-encoded under ``outputs.f16``
+together with the ``schema``: the model weights that fix the label order, plus
+the engine (and ensemble/TTA configuration) whose scores they are. Only vectors
+of one schema are comparable, so re-thresholding evaluates one schema at a time.
+Re-thresholding and threshold sweeps then only decode these vectors; the model
+is never touched.
+"""
+import base64
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+_DTYPE = np.dtype("<f2")
+MAX_SWEEP = 1000  # thresholds per sweep request
+
+
+def output_schema(weights: str, engine: str, config: Optional[Dict] = None) -> str:
+    """``<weights>|<engine>[|<config hash>]``; ``config`` distinguishes ensemble members/weights/TTA views."""
+    schema = f"{weights}|{engine}"
+    if config:
+        schema += "|" + hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+    return schema
+
+
+def schema_weights(schema: str) -> str:
+    """Model weights (label order) of a schema; older records stored the weights alone."""
+    return schema.split("|", 1)[0]
+
+
+def encode_outputs(probs: Sequence[float], schema: str) -> Dict[str, str]:
+    """Compact, JSON-safe form of one output vector."""
+    raw = np.asarray(probs, dtype=_DTYPE).tobytes()
+    return {"schema": schema, "f16": base64.b64encode(raw).decode("ascii")}
+
+
+def decode_outputs(outputs: Dict[str, str]) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(outputs["f16"]), dtype=_DTYPE).astype(np.float32)
+
+
+def stack_outputs(encoded: Iterable[str], width: int) -> np.ndarray:
+    """(N, width) float32 matrix from base64 float16 vectors, decoded in one pass."""
+    raw = b"".join(base64.b64decode(e) for e in encoded)
+    return np.frombuffer(raw, dtype=_DTYPE).reshape(-1, width).astype(np.float32)
+
+
+def resolve_thresholds(
+    labels: List[str],
+    threshold: Optional[float],
+    thresholds: Optional[Dict[str, float]],
+    default: float,
+) -> Dict[str, float]:
+    """Per-label thresholds: explicit ``thresholds`` entries, else ``threshold``, else ``default``."""
+    if thresholds is not None and not isinstance(thresholds, dict):
+        raise TypeError("thresholds must be an object of {label: value}")
+    base = default if threshold is None else float(threshold)
+    per_label = {k: float(v) for k, v in (thresholds or {}).items()}
+    for label, value in per_label.items():
+        if not 0.0 <= value <= 1.0:
+            raise ValueError(f"Threshold for {label} must be within [0, 1]")
+    if not 0.0 <= base <= 1.0:
+        raise ValueError("threshold must be within [0, 1]")
+    return {label: per_label.get(label, base) for label in labels}
+
+
+def parse_sweep(grid) -> List[float]:
+    """Sorted sweep thresholds from a request; ValueError for anything but a list of numbers in [0, 1]."""
+    if not isinstance(grid, list) or len(grid) > MAX_SWEEP:
+        raise ValueError(f"sweep must be a list of at most {MAX_SWEEP} thresholds")
+    values = []
+    for t in grid:
+        if isinstance(t, bool) or not isinstance(t, (int, float)) or not 0.0 <= t <= 1.0:
+            raise ValueError(f"sweep thresholds must be numbers within [0, 1], got {t!r}")
+        values.append(float(t))
+    return sorted(values)
+
+
+def sweep_counts(values: np.ndarray, grid: Sequence[float]) -> List[int]:
+    """Number of ``values >= t`` for each ``t`` in ``grid`` (one sort, then binary searches)."""
+    ordered = np.sort(values)
+    return [int(len(ordered) - np.searchsorted(ordered, t, side="left")) for t in grid]
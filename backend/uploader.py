@@ -0,0 +1,180 @@
+"""Pooled object-storage uploader.
+
+Assets are uploaded straight from memory by a bounded worker pool that shares
+one storage client, retrying failures with exponential backoff. Backends:
+
+- ``FirebaseBackend``: firebase-admin bucket; objects are created public in a
+  single request (``predefined_acl``) instead of upload + ``make_public()``
+- ``LocalObjectStore``: filesystem stand-in with the same interface, for tests,
+  benchmarks and deployments without Firebase
+
+An upload that still fails after the last retry is handed to its ``fallback``
+(the API keeps it in the local asset store), so a storage outage does not lose it.
+"""
+import collections
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger("pneumonai.uploader")
+
+
+class UploadQueueFull(RuntimeError):
+    """Raised when no upload slot frees up within the enqueue timeout."""
+
+
+class FirebaseBackend:
+    name = "firebase"
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def put(self, object_name: str, data: bytes, content_type: str) -> str:
+        blob = self.bucket.blob(object_name)
+        blob.upload_from_string(data, content_type=content_type, predefined_acl="publicRead")  # For hackathon simplicity; tighten later
+        return blob.public_url
+
+
+class LocalObjectStore:
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, object_name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, object_name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Object name escapes store root: {object_name}")
+        return path
+
+    def put(self, object_name: str, data: bytes, content_type: str) -> str:
+        path = self._path(object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so readers never see a partial object
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        return "file://" + path
+
+    def get(self, object_name: str) -> bytes:
+        with open(self._path(object_name), "rb") as f:
+            return f.read()
+
+    def exists(self, object_name: str) -> bool:
+        return os.path.isfile(self._path(object_name))
+
+
+class Uploader:
+    def __init__(
+        self,
+        backend,
+        workers: int = 4,
+        max_queue: int = 256,
+        retries: int = 3,
+        backoff_sec: float = 0.5,
+        enqueue_timeout_sec: float = 5.0,
+    ):
+        self.backend = backend
+        self.retries = max(0, int(retries))
+        self.backoff_sec = float(backoff_sec)
+        self.enqueue_timeout_sec = float(enqueue_timeout_sec)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="upload")
+        self._slots = threading.BoundedSemaphore(max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=1024)
+        self._counts = {"queued": 0, "in_flight": 0, "uploaded": 0, "failed": 0, "retries": 0, "spooled": 0, "bytes": 0}
+
+    def submit(
+        self,
+        object_name: str,
+        data: bytes,
+        content_type: str = "application/octet-stream",
+        fallback: Optional[Callable[[bytes], str]] = None,
+    ) -> Future:
+        """Queue an in-memory upload; blocks up to ``enqueue_timeout_sec`` when the queue is full.
+
+        ``fallback(data)`` keeps the bytes elsewhere if every attempt fails; its reference is the result.
+        """
+        if not self._slots.acquire(timeout=self.enqueue_timeout_sec):
+            raise UploadQueueFull("Upload queue is full")
+        with self._lock:
+            self._counts["queued"] += 1
+        return self._pool.submit(self._run, object_name, data, content_type, time.time(), fallback)
+
+    def _run(
+        self,
+        object_name: str,
+        data: bytes,
+        content_type: str,
+        enqueued_at: float,
+        fallback: Optional[Callable[[bytes], str]] = None,
+    ) -> Optional[str]:
+        with self._lock:
+            self._counts["queued"] -= 1
+            self._counts["in_flight"] += 1
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    url = self.backend.put(object_name, data, content_type)
+                except Exception as e:
+                    if attempt == self.retries:
+                        with self._lock:
+                            self._counts["failed"] += 1
+                        return self._spool(object_name, data, fallback, e)
+                    with self._lock:
+                        self._counts["retries"] += 1
+                    time.sleep(self.backoff_sec * (2 ** attempt) * (0.5 + random.random()))
+                    continue
+                with self._lock:
+                    self._counts["uploaded"] += 1
+                    self._counts["bytes"] += len(data)
+                    self._latencies.append(time.time() - enqueued_at)
+                return url
+        finally:
+            with self._lock:
+                self._counts["in_flight"] -= 1
+            self._slots.release()
+
+    def _spool(self, object_name: str, data: bytes, fallback: Optional[Callable[[bytes], str]], error: Exception) -> Optional[str]:
+        if fallback is None:
+            log.error("upload of %s failed after %d attempts, dropped: %s", object_name, self.retries + 1, error)
+            return None
+        try:
+            ref = fallback(data)
+        except Exception:
+            log.exception("upload of %s failed after %d attempts and the local fallback failed too", object_name, self.retries + 1)
+            return None
+        with self._lock:
+            self._counts["spooled"] += 1
+        log.warning("upload of %s failed after %d attempts (%s); kept locally at %s", object_name, self.retries + 1, error, ref)
+        return ref
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            lat = sorted(self._latencies)
+        if lat:
+            counts["latency_sec"] = {
+                "p50": round(lat[len(lat) // 2], 4),
+                "p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 4),
+                "max": round(lat[-1], 4),
+            }
+        counts["backend"] = self.backend.name
+        return counts
@@ -46,3 +46,16 @@ export async function chatWithBot({message, predictionId = undefined, report = u
     if (!res.ok) throw new Error(await res.text());
     return await res.json();
 }
+
+// Batch predict: several files in one request; returns {count, succeeded, results: [...]} (one entry per file, in order)
+export async function predictXrayBatch(files) {
+    const url = `${BACKEND_BASE_URL}/predict/batch`;
+    const fd = new FormData();
+    for (const file of files) fd.append('files', file);
+    const res = await fetch(url, {
+        method: 'POST',
+        body: fd,
+    });
+    if (!res.ok) throw new Error(await res.text());
+    return await res.json();
+}